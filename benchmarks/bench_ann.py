@@ -0,0 +1,74 @@
+""" Recall@k and single-query latency of the IVF index against exact batch k-NN.
+
+Uses clustered synthetic vectors (random Gaussians have no neighbourhood structure and are a worst case for
+any ANN index). mxbai-embed-large vectors have 1024 dimensions; the default is smaller so 1M rows fit in memory.
+
+    python benchmarks/bench_ann.py --sizes 10000 100000 1000000 --dim 256
+"""
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from rag.ann import IVFIndex
+from rag.knn import BatchKNN
+
+
+def clustered(rng, n, dim, clusters=1000, spread=0.6):
+    centers = rng.standard_normal((clusters, dim), dtype=np.float32)
+    vectors = centers[rng.integers(0, clusters, n)]
+    vectors += spread * rng.standard_normal((n, dim), dtype=np.float32)
+    return vectors
+
+
+def latencies(search, queries):
+    times = []
+    results = []
+    for query in queries:
+        started = time.perf_counter()
+        results.append(search(query)[0][0])
+        times.append(time.perf_counter() - started)
+    times = np.array(times) * 1000
+    return results, np.percentile(times, 50), np.percentile(times, 99)
+
+
+def recall(found, exact, k):
+    return np.mean([len(set(a) & set(b)) / k for a, b in zip(found, exact)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--dim', type=int, default=256)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--probes', type=int, nargs='+', default=[1, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        rng = np.random.default_rng(0)
+        vectors = clustered(rng, size, args.dim)
+        queries = vectors[rng.integers(0, size, args.queries)] + 0.2 * rng.standard_normal((args.queries, args.dim), dtype=np.float32)
+        ids = list(range(size))
+
+        exact_index = BatchKNN(ids, vectors)
+        exact, p50, p99 = latencies(lambda query: exact_index.search(query, k=args.k), queries)
+        del exact_index
+        started = time.perf_counter()
+        index = IVFIndex()
+        index.add(ids, vectors)
+        build = time.perf_counter() - started
+        del vectors
+
+        print(f"{size} vectors x {args.dim}: IVF with {index.n_lists} lists built in {build:.1f}s")
+        print(f"  {'exact':<12} recall@{args.k} 1.000  p50 {p50:7.2f} ms  p99 {p99:7.2f} ms")
+        for n_probe in args.probes:
+            found, p50, p99 = latencies(lambda query: index.search(query, k=args.k, n_probe=n_probe), queries)
+            print(f"  {f'n_probe {n_probe}':<12} recall@{args.k} {recall(found, exact, args.k):.3f}  p50 {p50:7.2f} ms  p99 {p99:7.2f} ms")
+        del index
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+""" Per-utterance latency of the old file-based chain (pico2wave -> speech.wav -> ffmpeg -> enhanced_speech.wav ->
+aplay) against the in-memory one (pico2wave on tmpfs -> NumPy resample/upmix -> sounddevice), from text to the
+moment the player has the clip.
+
+Stages that need a missing tool are reported as unavailable. Without pico2wave a 16 kHz mono WAV of the same
+length stands in for its output, so the conversion stages can still be compared. Playback is only started with
+--play, since it needs an audio device.
+
+    python benchmarks/bench_audio.py --runs 10 --play
+"""
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from audio_io import PicoSynthesizer, SoundDevicePlayer, convert, read_wav, write_wav
+
+TEXT = "The living room thermostat is at twenty one degrees and the front door is locked."
+
+
+def stand_in_wav(text, rate=16000, chars_per_second=14.0):
+    """ Noise of the length pico2wave would produce for text, as 16 kHz mono WAV bytes. """
+    frames = int(rate * len(text) / chars_per_second)
+    return write_wav(np.random.default_rng(0).uniform(-0.3, 0.3, (frames, 1)), rate)
+
+
+def file_chain(text, directory, pico, play):
+    stages = {}
+    began = time.perf_counter()
+    speech = os.path.join(directory, 'speech.wav')
+    if pico:
+        subprocess.run(["pico2wave", "--wave", speech, "--lang", "en-US", text], check=True)
+    else:
+        with open(speech, 'wb') as file:
+            file.write(stand_in_wav(text))
+    stages['synthesize'] = time.perf_counter() - began
+    began = time.perf_counter()
+    enhanced = os.path.join(directory, 'enhanced_speech.wav')
+    subprocess.run(["ffmpeg", "-y", "-loglevel", "error", "-i", speech, "-ac", "2", "-ar", "44100",
+                    "-sample_fmt", "s16", enhanced], check=True)
+    stages['convert'] = time.perf_counter() - began
+    if play:
+        began = time.perf_counter()
+        player = subprocess.Popen(["aplay", "-q", enhanced])
+        stages['start playback'] = time.perf_counter() - began
+        player.terminate()
+        player.wait()
+    return stages
+
+
+def memory_chain(text, synthesizer, player):
+    stages = {}
+    began = time.perf_counter()
+    data = synthesizer.raw(text) if synthesizer else stand_in_wav(text)
+    stages['synthesize'] = time.perf_counter() - began
+    began = time.perf_counter()
+    samples = convert(*read_wav(data))
+    stages['convert'] = time.perf_counter() - began
+    if player:
+        began = time.perf_counter()
+        playback = player.start(samples)
+        stages['start playback'] = time.perf_counter() - began
+        playback.cancel()
+        playback.wait(1.0)
+        playback.stream.close()
+    return stages
+
+
+def report(name, runs):
+    stages = {stage: statistics.median(run[stage] for run in runs) for stage in runs[0]}
+    detail = ", ".join(f"{stage} {seconds * 1000:.1f}ms" for stage, seconds in stages.items())
+    print(f"{name:10} {sum(stages.values()) * 1000:8.1f}ms  ({detail})")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--text', default=TEXT)
+    parser.add_argument('--play', action='store_true', help="also start playback (needs an audio device)")
+    args = parser.parse_args()
+
+    pico = shutil.which('pico2wave') is not None
+    if not pico:
+        print("pico2wave not found: both chains convert a stand-in WAV instead")
+    with tempfile.TemporaryDirectory() as directory:
+        if shutil.which('ffmpeg') and (not args.play or shutil.which('aplay')):
+            report('files', [file_chain(args.text, directory, pico, args.play) for _ in range(args.runs)])
+        else:
+            print(f"{'files':10} unavailable (needs ffmpeg{' and aplay' if args.play else ''})")
+    synthesizer = PicoSynthesizer() if pico else None
+    try:
+        player = SoundDevicePlayer() if args.play else None
+    except (ImportError, OSError) as exc:
+        print(f"{'memory':10} playback unavailable ({exc}), timing synthesis and conversion only")
+        player = None
+    report('memory', [memory_chain(args.text, synthesizer, player) for _ in range(args.runs)])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+""" Cancellation latency of a barge-in: a spoken answer streams from the stub Ollama server and is interrupted at
+a random moment. Reports how long after the interruption
+    - the audio stopped (the player's last block ended),
+    - the token loop was abandoned,
+    - and the HTTP stream to the server was closed.
+
+Playback runs through audio_io.Playback block by block in real time, like the sound card callback does, so
+--block-ms shows how the stop latency depends on the output block size.
+
+    python benchmarks/bench_barge_in.py --trials 20 --block-ms 23
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+import numpy as np
+import ollama
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from audio_io import Playback
+from speech_pipeline import CancelToken, SpeechPipeline, interruptible
+from stub_ollama import StubOllama
+from bench_speech import ANSWER
+
+RATE = 8000
+
+
+class SoundCard:
+    def __init__(self, block_ms):
+        self.block = RATE * block_ms // 1000
+
+    def play(self, clip, cancelled):
+        playback = Playback(clip, cancelled)
+        out = np.empty((self.block, 1), dtype=np.float32)
+        while playback.fill(out):
+            time.sleep(self.block / RATE)
+        return playback.fraction
+
+
+def synthesize(text, chars_per_second=14.0):
+    time.sleep(0.05)
+    return np.zeros((int(RATE * len(text) / chars_per_second), 1), dtype=np.float32)
+
+
+def trial(client, card, delay):
+    cancel = CancelToken()
+    speech = SpeechPipeline(synthesize, card).start()
+    cancel.on_cancel(speech.stop)
+    closed = {}
+    chunks = client.chat(model='stub', messages=[{'role': 'user', 'content': 'status?'}], stream=True)
+
+    def watched():
+        try:
+            yield from chunks
+        finally:
+            closed['at'] = time.perf_counter()
+
+    threading.Timer(delay, cancel.cancel, args=('barge-in',)).start()
+    for chunk in interruptible(watched(), cancel):
+        speech.feed(chunk['message']['content'])
+    abandoned = time.perf_counter()
+    timings = speech.finish()
+    deadline = time.time() + 2
+    while 'at' not in closed and time.time() < deadline:
+        time.sleep(0.005)
+    if not cancel.cancelled or 'stop_latency' not in timings:
+        return None  # Interrupted before anything was playing, or after the answer was over
+    return {'audio stopped': timings['stop_latency'], 'loop abandoned': abandoned - cancel.requested_at,
+            'stream closed': closed.get('at', float('nan')) - cancel.requested_at}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--trials', type=int, default=20)
+    parser.add_argument('--block-ms', type=int, default=23, help="output block; 1024 frames at 44.1 kHz is 23 ms")
+    parser.add_argument('--token-latency', type=float, default=0.05)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    stub = StubOllama(first_token_latency=0.2, token_latency=args.token_latency, answer_text=ANSWER).start()
+    client = ollama.Client(host=stub.url)
+    rng = random.Random(args.seed)
+    try:
+        results = [trial(client, SoundCard(args.block_ms), rng.uniform(1.0, 3.0)) for _ in range(args.trials)]
+        time.sleep(2 * args.token_latency)  # The server notices a closed stream on its next write
+    finally:
+        stub.stop()
+    results = [result for result in results if result is not None]
+    print(f"{len(results)} interruptions during playback, {args.block_ms} ms output blocks, "
+          f"{stub.aborted} generations stopped by the server")
+    for name in ('audio stopped', 'loop abandoned', 'stream closed'):
+        values = np.array([result[name] for result in results]) * 1000
+        print(f"{name:15} p50 {np.percentile(values, 50):6.1f}ms  p95 {np.percentile(values, 95):6.1f}ms  "
+              f"max {values.max():6.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
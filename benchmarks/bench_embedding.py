@@ -0,0 +1,48 @@
+""" Chunks/sec of the embedding pipeline against a stub server, compared with one request per chunk
+(what OllamaEmbeddings does during ingestion).
+
+    python benchmarks/bench_embedding.py --chunks 2000
+"""
+import argparse
+import os
+import sys
+import time
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from rag.embedding_pipeline import EmbeddingPipeline, OllamaBatchEmbedder, format_stats
+from stub_ollama import StubOllama
+
+
+def sequential(url, texts):
+    started = time.perf_counter()
+    with httpx.Client(base_url=url) as client:
+        for text in texts:
+            client.post('/api/embeddings', json={'model': 'stub', 'prompt': text}).raise_for_status()
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--chunks', type=int, default=1000)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    stub = StubOllama(failure_rate=args.failure_rate).start()
+    texts = [f"chunk {i} " + "lorem ipsum " * 40 for i in range(args.chunks)]
+    items = [(str(i), text, None) for i, text in enumerate(texts)]
+    try:
+        if not args.failure_rate:
+            seconds = sequential(stub.url, texts)
+            print(f"{'sequential':<24} {len(texts) / seconds:8.1f} chunks/s")
+        for batch_size, concurrency in ((1, 4), (16, 1), (16, 4), (32, 4), (64, 8)):
+            pipeline = EmbeddingPipeline(batch_size=batch_size, max_concurrency=concurrency, backoff=0.05,
+                                         embed_batch=OllamaBatchEmbedder('stub', host=stub.url))
+            stats = pipeline.run_sync(items, lambda *batch: None)
+            print(f"{f'batch {batch_size} x{concurrency}':<24} {stats['chunks_per_second']:8.1f} chunks/s  {format_stats(stats)}")
+    finally:
+        stub.stop()
+
+
+if __name__ == '__main__':
+    main()
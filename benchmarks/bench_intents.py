@@ -0,0 +1,85 @@
+""" Hit rate, precision and latency of the intent router on a labeled set of utterances: commands it should
+answer (some phrased differently from the patterns) and questions that must go to the model.
+
+    python benchmarks/bench_intents.py
+    OLLAMA_HOST=http://localhost:11434 python benchmarks/bench_intents.py --embeddings
+
+--embeddings adds the nearest-neighbour stage with mxbai-embed-large, which needs a real Ollama server: the stub
+returns random vectors.
+"""
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from intent_router import IntentRouter, format_stats
+from response_cache import ollama_embedder
+
+INTENTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'configs', 'intents.yaml')
+
+UTTERANCES = [
+    ("Turn on the kitchen lights.", 'lights'),
+    ("switch off the bedroom lamp", 'lights'),
+    ("Can you turn the living room lights off please", 'lights'),
+    ("hallway lights on", 'lights'),
+    ("turn the lights off in the office", 'lights'),
+    ("could you get the porch lights on", 'lights'),
+    ("lights off in the garage please", 'lights'),
+    ("Dim the kitchen lights to 30%", 'brightness'),
+    ("set the lights in the bedroom to 50 percent", 'brightness'),
+    ("bring the dining room lamp down to 20 percent", 'brightness'),
+    ("Set the thermostat to 21 degrees.", 'thermostat'),
+    ("make it 19.5", 'thermostat'),
+    ("I'd like the heating at 22 degrees", 'thermostat'),
+    ("Lock the front door", 'door'),
+    ("please unlock the back door", 'door'),
+    ("What time is it?", 'time'),
+    ("what's the time", 'time'),
+    ("Tell me a joke.", None),
+    ("What is the capital of France?", None),
+    ("Why do the kitchen lights flicker when the fridge starts?", None),
+    ("turn on the kitchen lights and play some jazz", None),
+    ("Summarize the manual of the thermostat", None),
+    ("How much power do the bedroom lights use?", None),
+    ("Write a poem about doors", None),
+    ("Is the front door locked?", None),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--embeddings', action='store_true', help="add the mxbai-embed-large classifier")
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    router = IntentRouter.from_config(INTENTS_PATH, embed_fn=ollama_embedder() if args.embeddings else None)
+    answered = wrong = 0
+    for text, label in UTTERANCES:
+        routed = router.route(text)
+        intent = routed['intent'] if routed else None
+        if intent is not None and intent == label:
+            answered += 1
+        elif intent is not None:
+            wrong += 1
+            print(f"wrong: {text!r} -> {intent}, expected {label or 'the model'}")
+    commands = sum(1 for _, label in UTTERANCES if label)
+    print(f"{len(UTTERANCES)} utterances: {answered}/{commands} commands answered without the model, "
+          f"{wrong} wrong answers ({answered / max(1, answered + wrong):.0%} precision)")
+
+    latencies = {'pattern': [], 'embedding': [], 'fallthrough': []}
+    for _ in range(args.repeat if not args.embeddings else 1):
+        for text, _label in UTTERANCES:
+            started = time.perf_counter()
+            routed = router.route(text)
+            latencies[routed['route'] if routed else 'fallthrough'].append(time.perf_counter() - started)
+    for route, values in latencies.items():
+        if values:
+            values = np.array(values) * 1000
+            print(f"{route:12} p50 {np.percentile(values, 50):8.3f}ms  p99 {np.percentile(values, 99):8.3f}ms")
+    print(format_stats(router.stats()))
+
+
+if __name__ == '__main__':
+    main()
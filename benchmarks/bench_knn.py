@@ -0,0 +1,72 @@
+""" Batch k-NN (one matrix multiply) versus the per-query path (one search call per vector on a thread pool).
+
+    python benchmarks/bench_knn.py --rows 50000 --queries 64
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from rag.knn import BatchKNN, normalize_rows, top_k
+
+
+def per_query(matrix, queries, k, threads):
+    def search(query):
+        return top_k((matrix @ normalize_rows(query).T).T, k)
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        return list(executor.map(search, queries))
+
+
+def chroma_per_query(ids, vectors, queries, k):
+    import chromadb
+    collection = chromadb.Client().create_collection('bench', metadata={'hnsw:space': 'cosine'})
+    for start in range(0, len(ids), 5000):
+        collection.add(ids=ids[start:start + 5000], embeddings=vectors[start:start + 5000].tolist())
+    started = time.perf_counter()
+    for query in queries:
+        collection.query(query_embeddings=[query.tolist()], n_results=k)
+    return time.perf_counter() - started
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--dim', type=int, default=1024)
+    parser.add_argument('--queries', type=int, default=64)
+    parser.add_argument('--k', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((args.rows, args.dim), dtype=np.float32)
+    queries = rng.standard_normal((args.queries, args.dim), dtype=np.float32)
+    ids = [str(i) for i in range(args.rows)]
+    metadatas = [{'source': f'manual-{i % 10}.pdf'} for i in range(args.rows)]
+    knn = BatchKNN(ids, vectors, metadatas)
+
+    print(f"{args.rows} x {args.dim} corpus, {args.queries} queries, k={args.k}")
+    batch = timed(knn.search, queries, args.k)
+    print(f"  batch k-NN            {batch * 1000:8.1f} ms  ({batch / args.queries * 1000:.2f} ms/query)")
+    filtered = timed(knn.search, queries, args.k, {'source': 'manual-3.pdf'})
+    print(f"  batch k-NN, filtered  {filtered * 1000:8.1f} ms")
+    for threads in (1, 16):
+        seconds = timed(per_query, knn.matrix, queries, args.k, threads)
+        print(f"  per query, {threads:2} threads {seconds * 1000:8.1f} ms  ({seconds / args.queries * 1000:.2f} ms/query)")
+    try:
+        seconds = chroma_per_query(ids, vectors, queries, args.k)
+        print(f"  chroma, per query     {seconds * 1000:8.1f} ms  ({seconds / args.queries * 1000:.2f} ms/query)")
+    except ImportError:
+        print("  chroma, per query     skipped (chromadb not installed)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+""" Time to first audio of a spoken answer: the sequential path (generate everything, synthesize everything, then
+play) versus SpeechPipeline, which speaks each sentence as soon as it is complete.
+
+The answer streams from the stub Ollama server. Synthesis and playback are simulated: synthesizing costs
+--synth-base plus --synth-per-char seconds, like a pico2wave + ffmpeg spawn, and a clip lasts one second per
+--chars-per-second characters, played --speedup times faster so runs stay short. Time to first audio does not
+depend on the speedup; the totals do.
+
+    python benchmarks/bench_speech.py --token-latency 0.05 --runs 3
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+import ollama
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from speech_pipeline import SpeechPipeline, format_timings
+from stub_ollama import StubOllama
+
+ANSWER = ("Sure, I turned on the kitchen lights and set them to warm white at sixty percent. "
+          "The living room thermostat is at twenty one degrees and holding. "
+          "Your front door is locked, and the garage door closed about ten minutes ago. "
+          "The hallway motion sensor reports a low battery, so you may want to replace it this week. "
+          "Tomorrow the heating starts at six thirty, half an hour before your alarm. "
+          "Is there anything else you would like me to adjust?")
+
+
+class SimulatedVoice:
+    def __init__(self, args):
+        self.args = args
+
+    def synthesize(self, text):
+        time.sleep(self.args.synth_base + self.args.synth_per_char * len(text))
+        return len(text) / self.args.chars_per_second  # Clip length in seconds
+
+    def play(self, seconds, cancelled):
+        cancelled.wait(seconds / self.args.speedup)
+
+
+def stream(client, model='stub'):
+    for chunk in client.chat(model=model, messages=[{'role': 'user', 'content': 'status?'}], stream=True):
+        if chunk.get('message', {}).get('content'):
+            yield chunk['message']['content']
+
+
+def sequential(client, voice):
+    started = time.perf_counter()
+    answer = "".join(stream(client))
+    clip = voice.synthesize(answer)
+    first_audio = time.perf_counter() - started
+    voice.play(clip, threading.Event())
+    return {'first_audio': first_audio, 'total': time.perf_counter() - started}
+
+
+def pipelined(client, voice):
+    speech = SpeechPipeline(voice.synthesize, voice).start()
+    for token in stream(client):
+        speech.feed(token)
+    return speech.finish()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--first-token-latency', type=float, default=0.3)
+    parser.add_argument('--token-latency', type=float, default=0.04, help="seconds per streamed word")
+    parser.add_argument('--synth-base', type=float, default=0.15)
+    parser.add_argument('--synth-per-char', type=float, default=0.002)
+    parser.add_argument('--chars-per-second', type=float, default=14.0)
+    parser.add_argument('--speedup', type=float, default=10.0)
+    args = parser.parse_args()
+
+    stub = StubOllama(first_token_latency=args.first_token_latency, token_latency=args.token_latency,
+                      answer_text=ANSWER).start()
+    client = ollama.Client(host=stub.url)
+    try:
+        for name, speak in (('sequential', sequential), ('pipelined', pipelined)):
+            runs = [speak(client, SimulatedVoice(args)) for _ in range(args.runs)]
+            first_audio = statistics.median(run['first_audio'] for run in runs)
+            total = statistics.median(run['total'] for run in runs)
+            print(f"{name:11} first audio {first_audio:6.2f}s   total {total:6.2f}s (playback {args.speedup:g}x)")
+            if name == 'pipelined':
+                print(f"{'':11} {format_timings(runs[-1])}")
+    finally:
+        stub.stop()
+
+
+if __name__ == '__main__':
+    main()
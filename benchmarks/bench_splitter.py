@@ -0,0 +1,74 @@
+""" Throughput and peak allocations of the offset-based TextSplitter versus LangChain's
+RecursiveCharacterTextSplitter (512/51), plus how many chunk ids survive a one-paragraph edit.
+
+    python benchmarks/bench_splitter.py --pages 2000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from rag.splitter import TextSplitter
+
+WORDS = ("bridge", "sensor", "firmware", "reset", "thermostat", "Zigbee", "error", "E-42", "press", "hold", "the",
+         "button", "for", "seconds", "until", "LED", "blinks", "Hue", "v2", "network", "pairing", "mode", "and")
+
+
+def make_pages(count, seed=0):
+    rng = random.Random(seed)
+    pages = []
+    for _ in range(count):
+        paragraphs = []
+        for _ in range(rng.randint(4, 10)):
+            sentences = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 20))).capitalize() + "."
+                         for _ in range(rng.randint(2, 8))]
+            paragraphs.append(" ".join(sentences))
+        pages.append("\n\n".join(paragraphs))
+    return pages
+
+
+def measure(split, pages):
+    tracemalloc.start()
+    started = time.perf_counter()
+    chunks = sum(len(split(page)) for page in pages)
+    seconds = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return chunks, seconds, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, default=2000)
+    args = parser.parse_args()
+
+    pages = make_pages(args.pages)
+    megabytes = sum(len(page) for page in pages) / 1e6
+    splitter = TextSplitter(512, 51)
+    candidates = [('TextSplitter.spans', lambda page: list(splitter.spans(page))),
+                  ('TextSplitter.split', lambda page: splitter.split(page, source='manual.pdf', page=0))]
+    try:
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+        recursive = RecursiveCharacterTextSplitter(chunk_size=512, chunk_overlap=51)
+        candidates.append(('RecursiveCharacterText', recursive.split_text))
+    except ImportError:
+        print("langchain_text_splitters not installed, measuring TextSplitter only")
+
+    print(f"{args.pages} pages, {megabytes:.1f} MB of text")
+    for name, split in candidates:
+        chunks, seconds, peak = measure(split, pages)
+        print(f"  {name:<24} {chunks:7} chunks  {megabytes / seconds:7.1f} MB/s  peak alloc {peak / 1e6:6.1f} MB")
+
+    page = pages[0]
+    before = {chunk.id for chunk in splitter.split(page, source='manual.pdf', page=0)}
+    paragraphs = page.split("\n\n")
+    paragraphs[len(paragraphs) // 2] += " Updated firmware note."
+    after = {chunk.id for chunk in splitter.split("\n\n".join(paragraphs), source='manual.pdf', page=0)}
+    print(f"  one-paragraph edit keeps {len(before & after)} of {len(before)} chunk ids")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+""" Startup cost of the CLI entry points: wall time to import each module in a fresh interpreter, and the
+imports that account for most of it (from python -X importtime).
+
+    python benchmarks/bench_startup.py --runs 5
+    python benchmarks/bench_startup.py --modules chat_with_audio rag.persistent_index
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+SRC = os.path.join(ROOT, 'src')
+MODULES = ['llm-smarthome-nb', 'chat_with_audio', 'chat', 'llm_chat_agent', 'rag.persistent_index', 'rag.retrievers']
+
+# Times the import in the child process, so interpreter startup itself is not counted
+PROBE = """
+import importlib.util, sys, time
+sys.path.insert(0, {src!r})
+started = time.perf_counter()
+name = {name!r}
+if name.endswith('-nb'):
+    spec = importlib.util.spec_from_file_location('nb', {path!r})
+    spec.loader.exec_module(importlib.util.module_from_spec(spec))
+else:
+    importlib.import_module(name)
+print(time.perf_counter() - started)
+"""
+
+
+def probe(name, importtime=False):
+    """ Import name in a fresh interpreter. Returns (seconds, importtime lines on stderr). """
+    code = PROBE.format(src=SRC, name=name, path=os.path.join(ROOT, name + '.py'))
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', code]
+    result = subprocess.run(command, capture_output=True, text=True, cwd=ROOT)
+    if result.returncode != 0:
+        error = [line for line in result.stderr.splitlines() if not line.startswith('import time:')]
+        raise RuntimeError(error[-1] if error else f"exit code {result.returncode}")
+    return float(result.stdout.strip().splitlines()[-1]), result.stderr
+
+
+def startup_packages():
+    """ Packages an empty interpreter imports anyway, left out of the per-module breakdown. """
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'pass'], capture_output=True, text=True).stderr
+    return {line.rsplit('|', 1)[-1].strip().split('.')[0] for line in stderr.splitlines() if line.startswith('import time:')}
+
+
+def top_imports(stderr, count, skip=()):
+    """ (cumulative us, package) of the slowest top-level packages in an importtime report. """
+    packages = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if name.startswith('  '):  # Nested import, already part of its parent's cumulative time
+            continue
+        package = name.strip().split('.')[0]
+        if package in skip:
+            continue
+        packages[package] = packages.get(package, 0) + int(cumulative)
+    return sorted(((us, package) for package, us in packages.items()), reverse=True)[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--modules', nargs='+', default=MODULES)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--top', type=int, default=5)
+    args = parser.parse_args()
+
+    skip = startup_packages()
+    print(f"{'module':24} {'median':>9} {'min':>9}  slowest imports")
+    for name in args.modules:
+        try:
+            seconds = [probe(name)[0] for _ in range(args.runs)]
+            _, stderr = probe(name, importtime=True)
+        except RuntimeError as exc:
+            print(f"{name:24} {'failed':>9} {'':>9}  {exc}")
+            continue
+        slowest = ", ".join(f"{package} {us / 1000:.0f}ms" for us, package in top_imports(stderr, args.top, skip))
+        print(f"{name:24} {statistics.median(seconds) * 1000:7.0f}ms {min(seconds) * 1000:7.0f}ms  {slowest}")
+
+
+if __name__ == '__main__':
+    main()
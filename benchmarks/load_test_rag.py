@@ -0,0 +1,76 @@
+""" Load test of the async RAG API against the stub Ollama server: many concurrent questions, a bounded number
+of generations at a time. Reports time to first token and total latency percentiles and answers per second.
+
+The chain here retrieves with BM25 over a few synthetic chunks and streams from the stub's /api/chat, so the
+harness runs without LangChain or a model; AsyncRAG accepts setup_chain's chain the same way.
+
+    python benchmarks/load_test_rag.py --questions 64 --concurrency 1 2 4 8
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import numpy as np
+import ollama
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from rag.async_api import AsyncRAG
+from rag.bm25 import BM25Index
+from rag.retrieval_cache import StageTimer
+from stub_ollama import StubOllama
+
+
+class StubChain:
+    def __init__(self, host, bm25):
+        self.client = ollama.AsyncClient(host=host)
+        self.bm25 = bm25
+
+    async def astream(self, question):
+        with StageTimer.stage('retrieve'):
+            context = "\n".join(chunk_id for chunk_id, _ in self.bm25.search(question, k=3))
+        messages = [{'role': 'system', 'content': f"Answer from this context: {context}"},
+                    {'role': 'user', 'content': question}]
+        async for chunk in await self.client.chat(model='stub', messages=messages, stream=True):
+            yield chunk['message']['content']
+
+
+async def run(rag, questions):
+    async def one(question):
+        timings = {}
+        async for _ in rag.astream(question, timings):
+            pass
+        return timings
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(one(question) for question in questions))
+    return results, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--questions', type=int, default=32)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--num-parallel', type=int, default=4, help="Generations the stub serves at once")
+    args = parser.parse_args()
+
+    stub = StubOllama(num_parallel=args.num_parallel, first_token_latency=0.1, token_latency=0.01, answer_tokens=30).start()
+    bm25 = BM25Index()
+    bm25.add([f"manual-{i}" for i in range(100)], [f"Device {i} error E-{i} reset procedure" for i in range(100)])
+    questions = [f"What does error E-{i % 100} mean?" for i in range(args.questions)]
+    print(f"{args.questions} concurrent questions, stub serves {args.num_parallel} generations in parallel")
+    try:
+        for concurrency in args.concurrency:
+            rag = AsyncRAG(StubChain(stub.url, bm25), max_concurrency=concurrency)
+            results, seconds = asyncio.run(run(rag, questions))
+            first = np.array([timings['first_token'] for timings in results]) * 1000
+            total = np.array([timings['total'] for timings in results]) * 1000
+            print(f"  limit {concurrency:2}: {len(results) / seconds:6.1f} answers/s  "
+                  f"first token p50 {np.percentile(first, 50):6.0f} ms p99 {np.percentile(first, 99):6.0f} ms  "
+                  f"total p50 {np.percentile(total, 50):6.0f} ms p99 {np.percentile(total, 99):6.0f} ms")
+    finally:
+        stub.stop()
+
+
+if __name__ == '__main__':
+    main()
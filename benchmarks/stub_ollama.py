@@ -0,0 +1,138 @@
+""" Minimal stand-in for the Ollama HTTP API, for benchmarks and load tests.
+
+Serves /api/embed (batched) and /api/embeddings (one prompt) with deterministic vectors and a simulated
+latency of request_latency + item_latency per text, and /api/chat and /api/generate streaming answer_tokens
+tokens (or the words of answer_text), one every token_latency seconds after a first_token_latency wait. num_parallel caps how many requests
+are processed at once, like OLLAMA_NUM_PARALLEL; failure_rate makes a share of requests answer 503 to
+exercise retries.
+
+    python benchmarks/stub_ollama.py --port 11435
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+
+
+def fake_embedding(text, dim):
+    seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], 'little')
+    vector = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+class StubOllama:
+    def __init__(self, port=0, dim=1024, request_latency=0.02, item_latency=0.005, num_parallel=4, failure_rate=0.0,
+                 first_token_latency=0.2, token_latency=0.02, answer_tokens=40,
+                 answer_text=None):
+        self.dim = dim
+        self.first_token_latency = first_token_latency
+        self.token_latency = token_latency
+        self.answer_tokens = answer_tokens
+        self.answer_text = answer_text
+        self.request_latency = request_latency
+        self.item_latency = item_latency
+        self.failure_rate = failure_rate
+        self.slots = threading.BoundedSemaphore(num_parallel)
+        self.requests = 0
+        self.aborted = 0  # Streams the client closed before the end
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), self.handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server.server_address[1]}'
+
+    def handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def send_json(self, status, payload):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                stub.requests += 1
+                if random.random() < stub.failure_rate:
+                    return self.send_json(503, {'error': 'server busy'})
+                if self.path == '/api/embed':
+                    texts = request['input'] if isinstance(request['input'], list) else [request['input']]
+                    stub.work(len(texts))
+                    return self.send_json(200, {'model': request['model'],
+                                                'embeddings': [fake_embedding(text, stub.dim) for text in texts]})
+                if self.path == '/api/embeddings':
+                    stub.work(1)
+                    return self.send_json(200, {'embedding': fake_embedding(request['prompt'], stub.dim)})
+                if self.path in ('/api/chat', '/api/generate'):
+                    return self.stream_answer(request)
+                self.send_json(404, {'error': 'not found'})
+
+            def stream_answer(self, request):
+                chat = self.path == '/api/chat'
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/x-ndjson')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+
+                def send(payload):
+                    line = json.dumps(payload).encode() + b'\n'
+                    self.wfile.write(f'{len(line):x}\r\n'.encode() + line + b'\r\n')
+                    self.wfile.flush()
+
+                try:
+                    tokens = ([word + ' ' for word in stub.answer_text.split(' ')] if stub.answer_text
+                              else [f'token{i} ' for i in range(stub.answer_tokens)])
+                    with stub.slots:
+                        time.sleep(stub.first_token_latency)
+                        for token in tokens:
+                            send({'model': request['model'], 'done': False,
+                                  **({'message': {'role': 'assistant', 'content': token}} if chat else {'response': token})})
+                            time.sleep(stub.token_latency)
+                    send({'model': request['model'], 'done': True, 'eval_count': len(tokens),
+                          'eval_duration': int(len(tokens) * stub.token_latency * 1e9), 'prompt_eval_count': 1,
+                          'prompt_eval_duration': int(stub.first_token_latency * 1e9), 'load_duration': 0,
+                          'total_duration': int((stub.first_token_latency + len(tokens) * stub.token_latency) * 1e9),
+                          **({'message': {'role': 'assistant', 'content': ''}} if chat else {'response': ''})})
+                    self.wfile.write(b'0\r\n\r\n')
+                except (BrokenPipeError, ConnectionResetError):
+                    stub.aborted += 1  # The client hung up; Ollama stops generating in that case
+
+        return Handler
+
+    def work(self, items):
+        with self.slots:
+            time.sleep(self.request_latency + self.item_latency * items)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=11435)
+    parser.add_argument('--num-parallel', type=int, default=4)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    args = parser.parse_args()
+    stub = StubOllama(args.port, num_parallel=args.num_parallel, failure_rate=args.failure_rate)
+    print(f"Stub Ollama on {stub.url}")
+    stub.server.serve_forever()
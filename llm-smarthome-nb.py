@@ -1,25 +1,22 @@
 #!/usr/bin/env python
 # coding: utf-8
 
+import argparse
+import contextlib
 import sys
 import os
-import json
-import pandas as pd
-import numpy as np
-import ollama
-import langchain
-from langchain_community.embeddings import OllamaEmbeddings
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import Chroma
-from langchain.document_loaders import UnstructuredPDFLoader, OnlinePDFLoader
-from langchain.prompts import ChatPromptTemplate, PromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-from langchain_community.chat_models import ChatOllama
-from langchain_core.runnables import RunnablePassthrough
-from langchain.retrievers.multi_query import MultiQueryRetriever
-from concurrent.futures import ThreadPoolExecutor
+import time
+
+# LangChain, Chroma, the PDF loaders and numpy take long to import; they are imported where first used.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+from rag.persistent_index import PersistentIndex
+from rag.embedding_pipeline import EmbeddingPipeline
+from rag.ingest import find_pdfs
+from rag.retrieval_cache import StageTimer, default_retrieval_cache
+from rag.async_api import AsyncRAG, RAGService, format_timings
 
 def load_pdf_data(file_path):
+    from langchain.document_loaders import UnstructuredPDFLoader
     if file_path:
         loader = UnstructuredPDFLoader(file_path=file_path)
         return loader.load()
@@ -28,45 +25,78 @@ def load_pdf_data(file_path):
 
 
 def split_text_into_chunks(data, chunk_size=512, chunk_overlap=51):
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
     text_splitter = RecursiveCharacterTextSplitter(
         chunk_size=chunk_size, chunk_overlap=chunk_overlap
     )
     return text_splitter.split_documents(data)
 
 
-def create_vector_db(chunks, model="mxbai-embed-large", collection_name="GE-2024-8K"):
+def create_vector_db(chunks, model="mxbai-embed-large", collection_name="GE-2024-8K", persist_directory=None):
+    from langchain_community.embeddings import OllamaEmbeddings
+    from langchain_community.vectorstores import Chroma
     return Chroma.from_documents(
         documents=chunks,
         embedding=OllamaEmbeddings(model=model, show_progress=True),
         collection_name=collection_name,
+        persist_directory=persist_directory,
     )
 
 
-def concurrent_search(vector_db, query_vector, top_k=5, num_threads=16):
-    """ Function to perform concurrent searches using ThreadPoolExecutor. """
-    with ThreadPoolExecutor(max_workers=num_threads) as executor:
-        future_to_vector = {executor.submit(vector_db.search, vec, top_k): vec for vec in query_vector}
-        results = {}
-        for future in future_to_vector:
-            vec = future_to_vector[future]
-            try:
-                results[vec] = future.result()
-            except Exception as exc:
-                results[vec] = str(type(exc))
-        return results
-
-
-def setup_retriever(vector_db, llm):
+def load_index(directory, model="mxbai-embed-large", collection_name="GE-2024-8K", persist_directory="./data/index",
+               chunk_size=512, chunk_overlap=51, sync=True):
+    """ Open the persistent index and stream every new or changed PDF below directory into it, page by page.
+    PDFs that were removed from the directory are dropped from the index. sync=False skips the check.
+    """
+    index = PersistentIndex(persist_directory, collection_name=collection_name, embedding_model=model,
+                            chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    if not sync:
+        return index
+    report = index.ingest(find_pdfs(directory), prune=True)
+    print(f"Index v{index.version}: {report['unchanged']} unchanged, {report['updated']} updated, "
+          f"{report['removed']} removed, {report['failed']} failed, "
+          f"{report['embedded_chunks']} chunks embedded, {report['reused_chunks']} reused")
+    return index
+
+
+def batch_search(index, query_vectors, top_k=5, where=None):
+    """ Top-k chunks for every query vector, scored in one pass over the memory-mapped embeddings of the index.
+    where is an optional metadata filter, e.g. {"source": "./data/GE.pdf"}.
+    """
+    import numpy as np
+    ids, scores = index.store.search(np.asarray(query_vectors), k=top_k, where=where)
+    return [list(zip(query_ids, query_scores.tolist())) for query_ids, query_scores in zip(ids, scores)]
+
+
+def build_ann(index, n_probe=8):
+    """ IVF index over the memory-mapped embeddings of the index. """
+    from rag.ann import IVFIndex
+    started = time.perf_counter()
+    ann = IVFIndex.from_store(index.store, n_probe=n_probe)
+    print(f"ANN index: {len(ann)} vectors in {ann.n_lists} lists, built in {time.perf_counter() - started:.1f}s")
+    return ann
+
+
+def setup_retriever(vector_db, llm, base_retriever=None, cache=None):
+    from langchain.prompts import PromptTemplate
+    from langchain.retrievers.multi_query import MultiQueryRetriever
+    from rag.retrievers import CachedMultiQueryRetriever
     query_prompt = PromptTemplate(
         input_variables=["question"],
         template="""
         You are an AI language model assistant named Plex. You retrieve documents from vector databases and provide additional questions for the user once you read and analyzed the code.
         """,
     )
-    return MultiQueryRetriever.from_llm(vector_db.as_retriever(), llm, prompt=query_prompt)
+    retriever = MultiQueryRetriever.from_llm(base_retriever or vector_db.as_retriever(), llm, prompt=query_prompt)
+    if cache is None:
+        return retriever
+    return CachedMultiQueryRetriever(retriever=retriever.retriever, llm_chain=retriever.llm_chain, cache=cache)
 
 
 def setup_chain(retriever, llm):
+    from langchain.prompts import ChatPromptTemplate
+    from langchain_core.output_parsers import StrOutputParser
+    from langchain_core.runnables import RunnablePassthrough
     template = """ANSWER THE QUESTION BASED ONLY ON THE FOLLOWING CONTEXT: {context}"""
     prompt = ChatPromptTemplate.from_template(template)
     return (
@@ -77,42 +107,91 @@ def setup_chain(retriever, llm):
     )
 
 
-import numpy as np
+def invoke_with_timings(chain, question):
+    """ chain.invoke plus the expand/retrieve/generate latency of this call. Generation is the remainder
+    of the total once expansion and retrieval are accounted for.
+    """
+    timings = StageTimer.start()
+    started = time.perf_counter()
+    answer = chain.invoke(question)
+    timings["generate"] = time.perf_counter() - started - timings.get("expand", 0.0) - timings.get("retrieve", 0.0)
+    return answer, timings
 
-def get_query_vectors(chunks, model, num_samples=5):
-    """Assuming you need to recompute vectors for querying, which is not efficient but for illustration."""
-    embedding_model = OllamaEmbeddings(model=model)
-    query_vectors = [embedding_model.embed(chunk.text) for chunk in chunks[:num_samples]]
-    return query_vectors
 
-def main():
-    print(sys.prefix)
-    os.system("ollama list")
+def get_query_vectors(vector_db, model, num_samples=5):
+    """ Embed a sample of stored chunks as queries, batched into as few requests as possible. """
+    texts = vector_db.get(limit=num_samples)["documents"]
+    return EmbeddingPipeline(model).embed_texts(texts)
 
-    file_path = "./data/GE.pdf"
-    data = load_pdf_data(file_path)
+def build_chain(index, local_model="mistral:7b-instruct-v0.2-fp16"):
+    """ The answer chain over the index, with the retriever chosen by RAG_ANN / RAG_HYBRID. """
+    from langchain_community.chat_models import ChatOllama
+    from rag.retrievers import ANNRetriever, HybridRetriever
+    llm = ChatOllama(model=local_model)
 
-    chunks = split_text_into_chunks(data)
-    vector_db = create_vector_db(chunks)
+    # RAG_ANN=1 answers each generated query from the IVF index instead of the collection's own search
+    base_retriever = None
+    ann = build_ann(index) if os.environ.get("RAG_ANN", "0") == "1" else None
+    if ann is not None:
+        base_retriever = ANNRetriever(index=index, ann=ann)
+    # RAG_HYBRID=1 replaces the multi-query rewrites with a single fused BM25 + vector retrieval
+    if os.environ.get("RAG_HYBRID", "0") == "1":
+        from rag.bm25 import HybridSearch
+        hybrid = HybridSearch(index.bm25, (ann or index.store).search, index.embeddings.embed_query)
+        retriever = HybridRetriever(index=index, hybrid=hybrid)
+    else:
+        retriever = setup_retriever(index.vector_db, llm, base_retriever, cache=default_retrieval_cache(lambda: index.cache_key))
+    return setup_chain(retriever, llm)
 
-    local_model = "mistral:7b-instruct-v0.2-fp16"
-    llm = ChatOllama(model=local_model)
 
-    retriever = setup_retriever(vector_db, llm)
-    chain = setup_chain(retriever, llm)
+def ask_once(question, data_directory, sync=True):
+    """ Non-interactive mode: print only the answer on stdout, everything else goes to stderr. """
+    if question == "-":
+        question = sys.stdin.read()
+    with contextlib.redirect_stdout(sys.stderr):
+        index = load_index(data_directory, sync=sync)
+        answer, timings = invoke_with_timings(build_chain(index), question.strip())
+        print(f"[stages] {format_timings(timings)}")
+    print(answer)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ask questions about the PDFs in a directory.")
+    parser.add_argument("--ask", metavar="QUESTION", help="answer one question ('-' reads it from stdin) and exit")
+    parser.add_argument("--data", default="./data", help="directory of PDFs to index")
+    parser.add_argument("--no-sync", action="store_true", help="use the index as it is, without checking for changed PDFs")
+    args = parser.parse_args()
+    if args.ask:
+        ask_once(args.ask, args.data, sync=not args.no_sync)
+        return
+
+    print(sys.prefix)
+    os.system("ollama list")
+
+    index = load_index(args.data, sync=not args.no_sync)
+    vector_db = index.vector_db
+    chain = build_chain(index)
 
     # Compute query vectors properly
-    query_vectors = get_query_vectors(chunks, model="mxbai-embed-large")
+    query_vectors = get_query_vectors(vector_db, model="mxbai-embed-large")
 
-    # Perform concurrent searches
-    results = concurrent_search(vector_db, query_vectors, top_k=3, num_threads=4)
-    for result in results.values():
+    # Search all query vectors at once
+    results = batch_search(index, query_vectors, top_k=3)
+    for result in results:
         print(result)
 
-    user_input = input("Type something in, I guess:")
-    result = chain.invoke(user_input)
-    print(result)
+    # Answers stream token by token; OLLAMA_NUM_PARALLEL bounds how many questions generate at once
+    service = RAGService(AsyncRAG(chain, max_concurrency=int(os.environ.get("OLLAMA_NUM_PARALLEL", 1))))
+    while True:
+        user_input = input("Type something in, I guess:")
+        if not user_input.strip():
+            break
+        timings = {}
+        for token in service.stream(user_input, timings):
+            print(token, end="", flush=True)
+        print()
+        print(f"[stages] {format_timings(timings)}")
+    service.close()
 
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,231 @@
+import asyncio
+import re
+import time
+from hedges import find_hedge
+from ollama_session import get_session
+
+STOPWORDS = {
+    'the', 'and', 'for', 'are', 'but', 'not', 'you', 'your', 'with', 'what', 'how', 'why', 'who', 'when', 'where',
+    'which', 'can', 'could', 'would', 'should', 'does', 'did', 'this', 'that', 'there', 'about', 'from', 'have',
+    'has', 'was', 'were', 'will', 'please', 'tell', 'give', 'explain',
+}
+
+
+def score_answer(question, answer):
+    """ Cheap 0..1 quality heuristic for the fast path: how many of the question's keywords the answer covers,
+    minus a penalty for hedging.
+    Args:
+        question (str): The user's question.
+        answer (str): The base answer.
+    Returns:
+        float: The score.
+    """
+    keywords = {word for word in re.findall(r"[a-z0-9][a-z0-9'-]+", question.lower()) if len(word) > 2 and word not in STOPWORDS}
+    answer_lower = answer.lower()
+    coverage = sum(1 for word in keywords if word in answer_lower) / len(keywords) if keywords else 1.0
+    hedging = find_hedge(answer) is not None
+    return max(0.0, coverage - (0.5 if hedging else 0.0))
+
+
+async def ollama_stream(model, messages):
+    """ Default token stream: the model's shared OllamaSession. """
+    async for chunk in get_session(model).achat(messages):
+        if 'message' in chunk:
+            yield chunk['message']['content']
+
+
+class Stage:
+    """ Text and timings of one pipeline stage. """
+
+    def __init__(self, name, started_at):
+        self.name = name
+        self.started_at = started_at
+        self.text = ''
+        self.finished = False
+        self.valid = asyncio.Event()  # Set once the output is final (no restart pending)
+        self.generation = 0
+        self.timing = {'stage': name, 'start': None, 'first_token': None, 'end': None, 'restarts': 0, 'skipped': False}
+
+    def mark(self, key):
+        self.timing[key] = time.perf_counter() - self.started_at
+
+
+class AgentPipeline:
+    """ Runs the base -> refiner -> final stages of llm_chat_agent concurrently on one event loop.
+
+    With speculation on, the refiner starts critiquing the base draft once refiner_start_chars have streamed,
+    and the final stage starts from a partial critique once final_start_chars are in. A stage whose input
+    turned out to be too incomplete (less than min_coverage of the finished input) is restarted with the full
+    input. The fast path skips refining entirely when the base answer is short or score_answer rates it high;
+    with it enabled the refiner waits for the complete base answer, since that decides whether it runs at all.
+
+    Concurrent stages only overlap on the server when it serves requests in parallel (OLLAMA_NUM_PARALLEL > 1),
+    otherwise they queue and the speculation only saves the client-side hand-off.
+    """
+
+    def __init__(self, model, prompts, speculative=True, fast_path=False, fast_path_words=40, fast_path_score=0.8,
+                 refiner_start_chars=400, final_start_chars=200, min_coverage=0.67, stream_fn=ollama_stream):
+        """ Args:
+            model (str): The model used by every stage.
+            prompts (dict): System prompts keyed 'base', 'refiner' and 'final'.
+            speculative (bool): Start later stages on partial input.
+            fast_path (bool): Skip refiner and final when the base answer is good enough.
+            fast_path_words (int): Base answers with at most this many words take the fast path.
+            fast_path_score (float): Base answers scoring at least this take the fast path.
+            refiner_start_chars (int): Draft length at which the refiner starts speculatively.
+            final_start_chars (int): Critique length at which the final stage starts speculatively.
+            min_coverage (float): Share of the finished input a speculative stage must have seen to be kept.
+            stream_fn (callable): async stream_fn(model, messages) yielding text tokens.
+        """
+        self.model = model
+        self.prompts = prompts
+        self.speculative = speculative
+        self.fast_path = fast_path
+        self.fast_path_words = fast_path_words
+        self.fast_path_score = fast_path_score
+        self.refiner_start_chars = refiner_start_chars
+        self.final_start_chars = final_start_chars
+        self.min_coverage = min_coverage
+        self.stream_fn = stream_fn
+        self.changed = None
+
+    def commit(self, question, store, result):
+        """ Record the turn in the store: the answer the user saw goes into the dialogue, drafts into scratch. """
+        store.add_turn(question, result['final'], base=result['base'], refiner=result['refiner'])
+
+    async def notify(self):
+        async with self.changed:
+            self.changed.notify_all()
+
+    async def wait_until(self, predicate):
+        async with self.changed:
+            await self.changed.wait_for(predicate)
+
+    async def generate(self, stage, messages, on_token=None):
+        stage.text = ''
+        stage.finished = False
+        stage.generation += 1
+        if stage.timing['start'] is None:
+            stage.mark('start')
+        stream = self.stream_fn(self.model, messages)
+        try:
+            async for token in stream:
+                if token and stage.timing['first_token'] is None:
+                    stage.mark('first_token')
+                stage.text += token
+                if on_token:
+                    on_token(token)
+                await self.notify()
+        finally:
+            await stream.aclose()  # On cancellation this closes the HTTP stream so the server stops generating
+        stage.finished = True
+        stage.mark('end')
+        await self.notify()
+
+    def covers(self, seen, full):
+        return not full or len(seen) / len(full) >= self.min_coverage
+
+    def take_fast_path(self, question, answer):
+        if not self.fast_path:
+            return False
+        return len(answer.split()) <= self.fast_path_words or score_answer(question, answer) >= self.fast_path_score
+
+    async def run_refiner(self, question, store, base, refiner):
+        if self.speculative:
+            await self.wait_until(lambda: base.finished or len(base.text) >= self.refiner_start_chars)
+        else:
+            await self.wait_until(lambda: base.finished)
+        while True:
+            draft = base.text
+            await self.generate(refiner, store.refiner_view(self.prompts['refiner'], question, draft))
+            await self.wait_until(lambda: base.finished)
+            if self.covers(draft, base.text):
+                break
+            refiner.timing['restarts'] += 1  # Critiqued too small a part of the draft
+        refiner.valid.set()
+        await self.notify()
+
+    async def run_final(self, question, store, base, refiner, final):
+        while True:
+            if self.speculative:
+                await self.wait_until(lambda: base.finished and (refiner.valid.is_set() or len(refiner.text) >= self.final_start_chars))
+            else:
+                await self.wait_until(lambda: refiner.valid.is_set())
+            critique, generation = refiner.text, refiner.generation
+            final_view = store.final_view(self.prompts['final'], question, base.text, critique, self.model)
+            final_task = asyncio.ensure_future(self.generate(final, final_view))
+            valid_task = asyncio.ensure_future(refiner.valid.wait())
+            try:
+                await asyncio.wait({final_task, valid_task}, return_when=asyncio.FIRST_COMPLETED)
+                await valid_task
+            except asyncio.CancelledError:
+                final_task.cancel()
+                valid_task.cancel()
+                raise
+            if generation == refiner.generation and self.covers(critique, refiner.text):
+                await final_task
+                break
+            final_task.cancel()
+            final.timing['restarts'] += 1  # The finished critique says more than the draft was based on
+        final.valid.set()
+
+    async def run(self, question, store, on_base_token=None):
+        """ Run one turn.
+        Args:
+            question (str): The user's question.
+            store (ConversationStore): The conversation. Not modified, see commit().
+            on_base_token (callable, optional): Called with every base token, e.g. to print the draft as it streams.
+        Returns:
+            dict: base, refiner and final texts, fast_path flag, total time and per-stage timings (seconds from start).
+        """
+        self.changed = asyncio.Condition()
+        started_at = time.perf_counter()
+        base, refiner, final = (Stage(name, started_at) for name in ('base', 'refiner', 'final'))
+        base_view = store.base_view(self.prompts['base'], question, self.model)
+        base_task = asyncio.ensure_future(self.generate(base, base_view, on_base_token))
+        later_tasks = []
+        if not self.fast_path:
+            # Without a fast path the later stages may start while the base is still streaming
+            later_tasks = [
+                asyncio.ensure_future(self.run_refiner(question, store, base, refiner)),
+                asyncio.ensure_future(self.run_final(question, store, base, refiner, final)),
+            ]
+        try:
+            await base_task
+            fast_path = self.take_fast_path(question, base.text)
+            if fast_path:
+                for stage in (refiner, final):
+                    stage.timing['skipped'] = True
+            else:
+                if not later_tasks:
+                    later_tasks = [
+                        asyncio.ensure_future(self.run_refiner(question, store, base, refiner)),
+                        asyncio.ensure_future(self.run_final(question, store, base, refiner, final)),
+                    ]
+                await asyncio.gather(*later_tasks)
+        finally:
+            for task in [base_task] + later_tasks:
+                task.cancel()
+        return {
+            'base': base.text,
+            'refiner': refiner.text,
+            'final': base.text if fast_path else final.text,
+            'fast_path': fast_path,
+            'total': time.perf_counter() - started_at,
+            'timings': [base.timing, refiner.timing, final.timing],
+        }
+
+
+def format_timings(result):
+    """ One line per stage with start, first token, end and restarts. """
+    lines = []
+    for timing in result['timings']:
+        if timing['skipped']:
+            lines.append(f"  {timing['stage']:<8} skipped (fast path)")
+            continue
+        fields = [f"{key} {timing[key]:.2f}s" for key in ('start', 'first_token', 'end') if timing[key] is not None]
+        if timing['restarts']:
+            fields.append(f"{timing['restarts']} restart(s)")
+        lines.append(f"  {timing['stage']:<8} " + ", ".join(fields))
+    lines.append(f"  total    {result['total']:.2f}s")
+    return "\n".join(lines)
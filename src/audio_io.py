@@ -0,0 +1,177 @@
+import io
+import os
+import subprocess
+import tempfile
+import threading
+import wave
+import numpy as np
+
+OUTPUT_RATE = 44100
+OUTPUT_CHANNELS = 2
+# pico2wave can only write to a named .wav file; on a tmpfs it never touches the disk
+SCRATCH_DIRECTORY = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+
+def read_wav(data):
+    """ Decode 16-bit PCM WAV bytes.
+    Returns:
+        tuple: (float32 array of shape (frames, channels) in [-1, 1], sample rate).
+    """
+    with wave.open(io.BytesIO(data), 'rb') as file:
+        if file.getsampwidth() != 2:
+            raise ValueError(f"Expected 16-bit PCM, got {8 * file.getsampwidth()}-bit")
+        frames = np.frombuffer(file.readframes(file.getnframes()), dtype='<i2')
+        samples = frames.reshape(-1, file.getnchannels()).astype(np.float32) / 32768.0
+        return samples, file.getframerate()
+
+
+def write_wav(samples, rate):
+    """ Encode a float array of shape (frames, channels) as 16-bit PCM WAV bytes. """
+    samples = np.asarray(samples, dtype=np.float32).reshape(len(samples), -1)
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as file:
+        file.setnchannels(samples.shape[1])
+        file.setsampwidth(2)
+        file.setframerate(rate)
+        file.writeframes((np.clip(samples, -1.0, 1.0) * 32767).astype('<i2').tobytes())
+    return buffer.getvalue()
+
+
+def resample(samples, rate, target_rate):
+    """ Resample (frames, channels) audio by linear interpolation. Speech from pico2wave is 16 kHz and band-limited
+    well below 8 kHz, so interpolating up to 44.1 kHz adds no audible artifacts.
+    """
+    if rate == target_rate or not len(samples):
+        return samples
+    frames = int(round(len(samples) * target_rate / rate))
+    positions = np.arange(frames) * (rate / target_rate)
+    source = np.arange(len(samples))
+    return np.stack([np.interp(positions, source, channel) for channel in samples.T], axis=1).astype(np.float32)
+
+
+def to_channels(samples, channels):
+    """ Upmix by repeating or downmix by averaging channels. """
+    if samples.shape[1] == channels:
+        return samples
+    if samples.shape[1] == 1:
+        return np.repeat(samples, channels, axis=1)
+    mono = samples.mean(axis=1, keepdims=True)
+    return mono if channels == 1 else np.repeat(mono, channels, axis=1)
+
+
+def convert(samples, rate, target_rate=OUTPUT_RATE, channels=OUTPUT_CHANNELS):
+    """ The in-process replacement for `ffmpeg -ac 2 -ar 44100`. """
+    return to_channels(resample(samples, rate, target_rate), channels)
+
+
+class PicoSynthesizer:
+    """ Text to speech with pico2wave, returned as samples in memory at the output rate and channel count.
+
+    pico2wave writes to a file in SCRATCH_DIRECTORY (a tmpfs where available) that is read back and removed
+    straight away; resampling and upmixing happen in NumPy instead of an ffmpeg process and a second file.
+    """
+
+    def __init__(self, language='en-US', rate=OUTPUT_RATE, channels=OUTPUT_CHANNELS, directory=SCRATCH_DIRECTORY):
+        self.language = language
+        self.rate = rate
+        self.channels = channels
+        self.directory = directory
+
+    def raw(self, text):
+        """ pico2wave output as WAV bytes. """
+        fd, path = tempfile.mkstemp(suffix='.wav', prefix='pico-', dir=self.directory)
+        os.close(fd)
+        try:
+            subprocess.run(["pico2wave", "--wave", path, "--lang", self.language, text], check=True)
+            with open(path, 'rb') as file:
+                return file.read()
+        finally:
+            os.remove(path)
+
+    def __call__(self, text):
+        samples, rate = read_wav(self.raw(text))
+        return convert(samples, rate, self.rate, self.channels)
+
+
+class Playback:
+    """ Handle of one clip being played. The output callback pulls blocks from it with fill(); once cancelled the
+    next block is silent and ends the stream, so playback stops within one block. cancelled may be an event
+    shared with the caller, e.g. the one a SpeechPipeline sets on barge-in.
+    """
+
+    def __init__(self, samples, cancelled=None):
+        self.samples = samples
+        self.position = 0  # Frames handed to the device so far
+        self.stream = None
+        self.cancelled = cancelled or threading.Event()
+        self.finished = threading.Event()
+
+    def fill(self, out):
+        """ Copy the next len(out) frames into out, padding with silence. Returns False once the clip is over. """
+        if self.cancelled.is_set():
+            out.fill(0)
+            return False
+        block = self.samples[self.position:self.position + len(out)]
+        out[:len(block)] = block
+        out[len(block):] = 0
+        self.position += len(block)
+        return self.position < len(self.samples)
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def wait(self, timeout=None):
+        """ Block until the clip has played to the end or was cancelled. Returns True if it finished. """
+        return self.finished.wait(timeout)
+
+    @property
+    def fraction(self):
+        """ Share of the clip that was played. """
+        return self.position / len(self.samples) if len(self.samples) else 1.0
+
+
+class SoundDevicePlayer:
+    """ Plays sample arrays through sounddevice, one output stream per clip.
+
+    start() returns a Playback handle right away; play() blocks until the clip is done, and stop() or setting the
+    cancelled event passed in ends the clip from any thread. With the default block of 1024 frames at 44.1 kHz a cancel takes effect within
+    about 25 ms, and no other process is involved.
+    """
+
+    def __init__(self, rate=OUTPUT_RATE, channels=OUTPUT_CHANNELS, device=None, blocksize=1024):
+        import sounddevice  # Only needed once something is spoken
+        self.sd = sounddevice
+        self.rate = rate
+        self.channels = channels
+        self.device = device
+        self.blocksize = blocksize
+        self.current = None
+        self.lock = threading.Lock()
+
+    def start(self, samples, cancelled=None):
+        playback = Playback(np.asarray(samples, dtype=np.float32).reshape(len(samples), -1), cancelled)
+
+        def callback(outdata, frames, time_info, status):
+            if not playback.fill(outdata):
+                raise self.sd.CallbackStop
+
+        stream = self.sd.OutputStream(samplerate=self.rate, channels=self.channels, dtype='float32',
+                                      device=self.device, blocksize=self.blocksize, callback=callback,
+                                      finished_callback=playback.finished.set)
+        with self.lock:
+            self.current = playback
+        playback.stream = stream
+        stream.start()
+        return playback
+
+    def play(self, samples, cancelled=None):
+        """ Play a clip to the end or until cancelled is set. Returns the fraction that was played. """
+        playback = self.start(samples, cancelled)
+        playback.wait()
+        playback.stream.close()
+        return playback.fraction
+
+    def stop(self):
+        with self.lock:
+            if self.current is not None:
+                self.current.cancel()
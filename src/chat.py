@@ -1,7 +1,14 @@
 import streamlit as st
 import json
-from ollama import chat
+from chat_log import ChatLog
+from chat_catalog import ChatCatalog
+from context_window import ContextWindow, ollama_summarizer, format_report
+from ollama_session import get_session, format_metrics
+from response_cache import default_cache, format_stats
+from intent_router import default_router, format_stats as format_intent_stats
+from model_registry import AUTO, ModelRegistry, ModelRouter, format_decision
 import datetime
+import time
 import uuid
 import os
 
@@ -9,14 +16,24 @@ class ConversationalAIApp:
     """A Streamlit app for conversational AI using the Ollama."""
     def __init__(self):
         self.load_prompts('./src/prompts/system_prompts.json')
-        self.model_list = {
-            1: 'llama2:13b-chat-q8_0',
-            2: 'gemma:7b-instruct-v1.1-fp16',
-            2: 'mistral:7b-instruct-v0.2-fp16',
-            3: 'dolphin-mixtral',
-            5: 'mixtral:latest',
-            6: 'codegemma:7b-instruct-fp16'
-        }
+        if 'catalog' not in st.session_state:
+            st.session_state['catalog'] = ChatCatalog('./chats')
+        self.catalog = st.session_state['catalog']
+        self.chats_per_page = 25
+        if 'context_window' not in st.session_state:
+            # Kept in session state so calibrated token ratios and cached summaries survive reruns
+            st.session_state['context_window'] = ContextWindow(summarizer=ollama_summarizer())
+        self.context_window = st.session_state['context_window']
+        if 'response_cache' not in st.session_state:
+            st.session_state['response_cache'] = default_cache()
+        self.response_cache = st.session_state['response_cache']
+        if 'intent_router' not in st.session_state:
+            st.session_state['intent_router'] = default_router()
+        self.intent_router = st.session_state['intent_router']
+        if 'model_router' not in st.session_state:
+            st.session_state['model_router'] = ModelRouter(ModelRegistry.from_config(), counter=self.context_window.counter)
+        self.model_router = st.session_state['model_router']
+        self.model_registry = self.model_router.registry
 
         self.colors = {
             'system': '#E8E8E8',  # Light grey for system messages
@@ -24,6 +41,8 @@ class ConversationalAIApp:
             'assistant': '#D5F5E3'  # Very light green for assistant messages
         }
 
+        self.render_interval = 0.05  # Seconds between placeholder redraws while streaming
+
 
     def load_prompts(self, file_path):
         """ Load system prompts from a JSON file. Used to load system prompts for persona selection.
@@ -39,37 +58,56 @@ class ConversationalAIApp:
         return self.prompts.get(prompt_id, self.prompts['1'])['description']
 
 
-    def save_chat_history(self):
-        """ Save the chat history to a JSON file.
+    def get_chat_log(self, chat_id):
+        """ Get the append-only log for a chat, reusing the one kept in session state so it remembers what is on disk.
+        Args:
+            chat_id (str): The chat id.
+        Returns:
+            ChatLog: The log backing ./chats/chat_<chat_id>.json.
+        """
+        filepath = os.path.join('./chats', f'chat_{chat_id}.json')
+        chat_log = st.session_state.get('chat_log')
+        if chat_log is None or chat_log.path != filepath:
+            chat_log = ChatLog(filepath)
+            st.session_state['chat_log'] = chat_log
+        return chat_log
+
+
+    def save_chat_history(self, model=None):
+        """ Save the chat history, appending only the messages added since the last save, and update the chat catalog.
+        Args:
+            model (str, optional): The model used for the latest reply, recorded in the catalog.
         Returns:
             str: The filename of the saved chat history.
         """
         chat_id = st.session_state.get('chat_id', uuid.uuid4().hex)
         st.session_state['chat_id'] = chat_id  # Save the chat_id in the session state
-        filename = f'chat_{chat_id}.json'
-        filepath = os.path.join('./chats', filename)
-        with open(filepath, 'w') as file:
-            json.dump(st.session_state['conversation_history'], file, indent=4)
+        filename = ChatCatalog.filename(chat_id)
+        self.get_chat_log(chat_id).save(st.session_state['conversation_history'])
+        self.catalog.upsert(chat_id, st.session_state['conversation_history'], model=model)
         return filename
 
     def delete_chat_history(self, filename):
-        """ Delete a chat history file.
+        """ Delete a chat history file and its journal.
         Args:
             filename (str): The filename of the chat history to delete.
         """
         filepath = os.path.join('./chats', filename)
-        os.remove(filepath)
+        ChatLog(filepath).delete()
+        self.catalog.delete(filename.split('_')[1].split('.')[0])
+        if st.session_state.get('chat_log') is not None and st.session_state['chat_log'].path == filepath:
+            del st.session_state['chat_log']
 
 
 
-    def load_chat_histories(self):
-        """ Load saved chat histories from the 'chats' directory and return a list of filenames.
+    def load_chat_histories(self, page=0):
+        """ Load one page of saved chat histories from the chat catalog, most recently updated first.
+        Args:
+            page (int): The zero-based page number.
         Returns:
-            list: A list of filenames of chat histories.
+            list: Catalog entries (dicts with chat_id, title, model, message_count, created_at, updated_at).
         """
-        chat_files = [f for f in os.listdir('./chats') if f.endswith('.json')]
-        chat_files.sort(reverse=True)  # Optional: sort by creation date, newest first
-        return chat_files
+        return self.catalog.list_chats(limit=self.chats_per_page, offset=page * self.chats_per_page)
 
 
     def load_chat_history(self, filename):
@@ -81,66 +119,233 @@ class ConversationalAIApp:
         # Extract chat_id from the filename and store it in session state
         chat_id = filename.split('_')[1].split('.')[0]
         st.session_state['chat_id'] = chat_id
-        # Load the chat history as before
-        filepath = os.path.join('./chats', filename)
-        with open(filepath, 'r') as file:
-            st.session_state['conversation_history'] = json.load(file)
-            st.session_state['set_system_prompt'] = False
+        # Load the snapshot plus any journaled messages
+        st.session_state['conversation_history'] = self.get_chat_log(chat_id).load()
+        st.session_state['set_system_prompt'] = False
 
 
     def display_chat_selector(self):
-        """ Display a select box for selecting a saved chat history. """
-        chat_files = self.load_chat_histories()
+        """ Display a paginated select box for selecting a saved chat history. """
+        page_count = max(1, -(-self.catalog.count() // self.chats_per_page))
+        page = min(st.session_state.get('chat_page', 0), page_count - 1)
+        chats = {ChatCatalog.filename(entry['chat_id']): entry for entry in self.load_chat_histories(page)}
         current_chat = f'chat_{st.session_state.get("chat_id", "")}.json'
-        
-        # Set a default index for the selectbox
-        default_index = 0
-        
-        # If the current chat is in the chat_files, set that as the default index
-        if current_chat in chat_files:
-            default_index = chat_files.index(current_chat) + 1  # +1 because of the empty string at the start
+
+        def format_chat(filename):
+            if not filename:
+                return ""
+            entry = chats[filename]
+            updated = datetime.datetime.fromtimestamp(entry['updated_at']).strftime("%Y-%m-%d %H:%M")
+            return f"{entry['title']} ({updated})"
+
+        # Preselect the current chat if it is on this page
+        options = [""] + list(chats)
+        default_index = options.index(current_chat) if current_chat in chats else 0
 
         # Display the select box with the default index
-        selected_chat = st.sidebar.selectbox("Select a Saved Chat:", [""] + chat_files, index=default_index)
-        
+        selected_chat = st.sidebar.selectbox("Select a Saved Chat:", options, index=default_index, format_func=format_chat)
+
+        if page_count > 1:
+            previous_col, label_col, next_col = st.sidebar.columns([1, 2, 1])
+            if previous_col.button("‹", disabled=page == 0):
+                st.session_state['chat_page'] = page - 1
+                st.rerun()
+            label_col.caption(f"Page {page + 1} of {page_count}")
+            if next_col.button("›", disabled=page >= page_count - 1):
+                st.session_state['chat_page'] = page + 1
+                st.rerun()
+
         # Load the chat history if a chat is selected
         if selected_chat and selected_chat != current_chat:
             self.load_chat_history(selected_chat)
             st.rerun()
 
 
-    def generate_response(self, question, model, system_prompt):
+    def generate_response(self, question, model, system_prompt, container=None, summarize=False, use_cache=True,
+                          use_intents=True):
         """ Generate a response to the user's question using the selected model and system prompt. 
+        Tokens are drawn into a placeholder as they arrive when a container is given.
         Args:
             question (str): The user's question.
-            model (str): The model to use for generating the response.
+            model (str): The model to use for generating the response, or 'auto' to let the model router choose and
+                escalate to a larger model when the answer looks unsure.
             system_prompt (str): The system prompt to use for the conversation.
+            container (st.container, optional): The chat container to render the new messages into.
+            summarize (bool): Replace turns that don't fit the context budget with a summary instead of dropping them.
+            use_cache (bool): Answer repeated questions from the response cache.
+            use_intents (bool): Answer known smart-home commands with the intent router, without calling the model.
         Returns:
             str: The response generated by the model.
         """
         if question.strip():  # Ensure we don't process empty questions
             st.session_state['request_in_progress'] = True
             conversation_history = st.session_state.get('conversation_history', [])
+            new_messages = []
             if st.session_state['set_system_prompt']:
-                conversation_history.append({'role': 'system', 'content': system_prompt})
+                new_messages.append({'role': 'system', 'content': system_prompt})
                 st.session_state['set_system_prompt'] = False  # Reset after adding system prompt
-            conversation_history.append({'role': 'user', 'content': question})
-            response = ""
-            stream = chat(model=model, messages=conversation_history, stream=True)
-            for chunk in stream:
-                if 'message' in chunk:
-                    content = chunk['message']['content']
-                    response += content
-                 
+            new_messages.append({'role': 'user', 'content': question})
+            conversation_history.extend(new_messages)
+
+            placeholder = None
+            if container is not None:
+                with container:
+                    for message in new_messages:
+                        self.display_message(message)
+                    placeholder = self.display_assistant_placeholder()
+
+            context = conversation_history[:-1]  # Messages before the question, part of the cache key
+            start = time.perf_counter()
+            routed = self.intent_router.route(question) if use_intents else None
+            decision = self.model_router.choose(question, context) if model == AUTO and routed is None else None
+            if decision is not None:
+                model = decision['model']
+            cached = self.response_cache.lookup(model, system_prompt, context, question) if use_cache and routed is None else None
+            if routed is not None:
+                response = routed['response']
+                stats = self.record_intent_stats(routed, start, time.perf_counter())
+            elif cached is not None:
+                response = cached
+                stats = self.record_cached_stats(model, start, time.perf_counter())
+            else:
+                response, stats = self.stream_response(model, conversation_history, summarize, placeholder, start)
+                cache_model = model  # Auto-routed answers are cached under the first choice, where the lookup happens
+                while decision is not None:
+                    truncated = (stats['ollama'] or {}).get('done_reason') == 'length'
+                    escalated = self.model_router.escalate(decision, response, truncated)
+                    if escalated is None:
+                        break
+                    decision = escalated
+                    response, stats = self.stream_response(decision['model'], conversation_history, summarize, placeholder, time.perf_counter())
+                if decision is not None:
+                    stats['routing'] = decision
+                if use_cache:
+                    self.response_cache.store(cache_model, system_prompt, context, question, response.strip())
+            # The model that gave the answer, e.g. the router's choice for 'auto'; None for intent answers
+            st.session_state['answered_by'] = None if routed is not None else decision['model'] if decision else model
+
             if response:  # Append response only if it's non-empty
                 response = response.strip()
                 response = "\n" + response 
                 conversation_history.append({'role': 'assistant', 'content': response})
+            if placeholder is not None:
+                placeholder.markdown(response, unsafe_allow_html=True)
+                with container:
+                    self.display_response_stats(stats)
             st.session_state['conversation_history'] = conversation_history
             st.session_state['request_in_progress'] = False
             return response
         return ""
 
+    def stream_response(self, model, conversation_history, summarize, placeholder, start):
+        """ Stream one answer from a model into the placeholder.
+        Returns:
+            tuple: The response text and its recorded stats.
+        """
+        response = ""
+        first_token_at = None
+        last_render = 0.0
+        final_chunk = {}
+        chunk_count = 0
+        messages, context_report = self.context_window.fit(conversation_history, model, summarize=summarize)
+        session = get_session(model)
+        stream = session.chat(messages)
+        for chunk in stream:
+            if 'message' in chunk:
+                content = chunk['message']['content']
+                if content and first_token_at is None:
+                    first_token_at = time.perf_counter()
+                response += content
+                chunk_count += 1
+                now = time.perf_counter()
+                if placeholder is not None and now - last_render >= self.render_interval:
+                    placeholder.markdown(response + "▌", unsafe_allow_html=True)
+                    last_render = now
+            if chunk.get('done'):
+                final_chunk = chunk
+        stats = self.record_response_stats(model, start, first_token_at, time.perf_counter(), chunk_count, final_chunk)
+        stats['context'] = context_report
+        stats['ollama'] = session.last_metrics
+        self.context_window.counter.observe(model, messages, final_chunk.get('prompt_eval_count'))
+        return response, stats
+
+    def record_response_stats(self, model, start, first_token_at, end, chunk_count, final_chunk):
+        """ Record time-to-first-token and generation speed for a reply.
+        Server-side counters from the final stream chunk are preferred when Ollama reports them.
+        Args:
+            model (str): The model that generated the reply.
+            start (float): perf_counter value when the request was sent.
+            first_token_at (float): perf_counter value when the first token arrived, or None.
+            end (float): perf_counter value when the stream finished.
+            chunk_count (int): Number of streamed chunks, used when the server reports no eval_count.
+            final_chunk (dict): The chunk flagged as done, carrying Ollama's timing metadata.
+        Returns:
+            dict: The recorded stats.
+        """
+        tokens = final_chunk.get('eval_count', chunk_count)
+        eval_seconds = final_chunk.get('eval_duration', 0) / 1e9
+        if not eval_seconds and first_token_at is not None:
+            eval_seconds = end - first_token_at
+        stats = {
+            'model': model,
+            'time_to_first_token': (first_token_at - start) if first_token_at is not None else None,
+            'tokens': tokens,
+            'tokens_per_second': tokens / eval_seconds if eval_seconds > 0 else None,
+            'total_time': end - start,
+        }
+        st.session_state.setdefault('response_stats', []).append(stats)
+        return stats
+
+    def record_cached_stats(self, model, start, end):
+        """ Record the stats of a reply served from the response cache. """
+        stats = {
+            'model': model,
+            'time_to_first_token': end - start,
+            'tokens': 0,
+            'tokens_per_second': None,
+            'total_time': end - start,
+            'cached': True,
+        }
+        st.session_state.setdefault('response_stats', []).append(stats)
+        return stats
+
+    def record_intent_stats(self, routed, start, end):
+        """ Record the stats of a reply given by the intent router. """
+        stats = {
+            'model': routed['intent'],
+            'time_to_first_token': end - start,
+            'tokens': 0,
+            'tokens_per_second': None,
+            'total_time': end - start,
+            'intent': routed['route'],
+        }
+        st.session_state.setdefault('response_stats', []).append(stats)
+        return stats
+
+    def display_response_stats(self, stats):
+        """ Display the timing stats of a reply as a caption. """
+        if not stats:
+            return
+        if stats.get('cached'):
+            st.caption(f"{stats['model']} | answered from cache in {stats['total_time'] * 1000:.0f} ms | {format_stats(self.response_cache.stats())}")
+            return
+        if stats.get('intent'):
+            st.caption(f"intent {stats['model']} | matched by {stats['intent']} in {stats['total_time'] * 1000:.1f} ms | {format_intent_stats(self.intent_router.stats())}")
+            return
+        parts = []
+        if stats['time_to_first_token'] is not None:
+            parts.append(f"first token {stats['time_to_first_token']:.2f}s")
+        if stats['tokens_per_second'] is not None:
+            parts.append(f"{stats['tokens_per_second']:.1f} tok/s")
+        parts.append(f"{stats['tokens']} tokens in {stats['total_time']:.1f}s")
+        if stats.get('context'):
+            parts.append(format_report(stats['context']))
+        if stats.get('ollama'):
+            parts.append(format_metrics(stats['ollama']))
+        if stats.get('routing'):
+            parts.append(format_decision(stats['routing']))
+        st.caption(f"{stats['model']} | " + " | ".join(parts))
+
     def display_chat(self):
         if 'conversation_history' in st.session_state:
             # Importing FontAwesome stylesheet
@@ -150,40 +355,62 @@ class ConversationalAIApp:
             )
 
             for message in st.session_state['conversation_history']:
-                timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                role = message['role']
-                color = self.colors[role]
-                name_map = {'user': 'You', 'assistant': 'Assistant', 'system': 'System'}
-                name = name_map[role]
-
-                icon_map = {
-                    'user': '<i class="far fa-user-circle"></i>',
-                    'assistant': '<i class="far fa-comments"></i>',
-                    'system': '<i class="fas fa-project-diagram"></i>'
-                }
-                icon = icon_map[role]
-
-                if role == 'system':
-                    html_content = f"""
-                    <div style='margin-bottom: 10px;'>
-                        <p style='background-color: {color}; color: #6c757d; padding: 8px 12px; border-radius: 12px; font-size: 0.9em;'>
-                            {icon} <strong>{name}:</strong> {message['content']}
-                        </p>
-                    </div>
-                    """
-                    st.markdown(html_content, unsafe_allow_html=True)
-                elif role == 'assistant':
-                    # Directly render the Markdown content if it's from the assistant
-                    st.markdown(f"{icon} **{name}**", unsafe_allow_html=True)
-                    st.markdown(message['content'], unsafe_allow_html=True)
-                else:
-                    # Render other messages normally
-                    content_html = f"<div style='display: inline-block; background-color: {color}; padding: 6px 12px; border-radius: 12px; max-width: 80%;'>{message['content']}</div>"
-                    align = 'right' if role == 'user' else 'left'
-                    html_content = f"<div style='text-align: {align}; padding: 4px;'>{icon} <strong>{name}</strong> <small> | {timestamp}</small><br>{content_html}</div>"
-                    st.markdown(html_content, unsafe_allow_html=True)
-                    
-            st.markdown("<hr>", unsafe_allow_html=True)
+                self.display_message(message)
+
+
+    def display_message(self, message):
+        """ Render a single chat message.
+        Args:
+            message (dict): The message with 'role' and 'content' keys.
+        """
+        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        role = message['role']
+        color = self.colors[role]
+        name_map = {'user': 'You', 'assistant': 'Assistant', 'system': 'System'}
+        name = name_map[role]
+
+        icon_map = {
+            'user': '<i class="far fa-user-circle"></i>',
+            'assistant': '<i class="far fa-comments"></i>',
+            'system': '<i class="fas fa-project-diagram"></i>'
+        }
+        icon = icon_map[role]
+
+        if role == 'system':
+            html_content = f"""
+            <div style='margin-bottom: 10px;'>
+                <p style='background-color: {color}; color: #6c757d; padding: 8px 12px; border-radius: 12px; font-size: 0.9em;'>
+                    {icon} <strong>{name}:</strong> {message['content']}
+                </p>
+            </div>
+            """
+            st.markdown(html_content, unsafe_allow_html=True)
+        elif role == 'assistant':
+            # Directly render the Markdown content if it's from the assistant
+            st.markdown(f"{icon} **{name}**", unsafe_allow_html=True)
+            st.markdown(message['content'], unsafe_allow_html=True)
+        else:
+            # Render other messages normally
+            content_html = f"<div style='display: inline-block; background-color: {color}; padding: 6px 12px; border-radius: 12px; max-width: 80%;'>{message['content']}</div>"
+            align = 'right' if role == 'user' else 'left'
+            html_content = f"<div style='text-align: {align}; padding: 4px;'>{icon} <strong>{name}</strong> <small> | {timestamp}</small><br>{content_html}</div>"
+            st.markdown(html_content, unsafe_allow_html=True)
+
+
+    def display_assistant_placeholder(self):
+        """ Render the assistant header and return an empty placeholder for the streamed reply. """
+        st.markdown('<i class="far fa-comments"></i> **Assistant**', unsafe_allow_html=True)
+        return st.empty()
+
+
+    def submit_input(self):
+        """ Send button callback. Moves the typed question into session state and resets the input box
+        before the script reruns, so the reply can be streamed in the same run.
+        """
+        user_input = st.session_state.get(f"user_input_{st.session_state.input_key}", "")
+        if user_input and not st.session_state.get('last_input', '') == user_input:
+            st.session_state['pending_input'] = user_input
+        st.session_state.input_key += 1  # Increment the key to reset the input box
 
 
     def run(self):
@@ -202,12 +429,21 @@ class ConversationalAIApp:
         st.markdown("This is an interactive chat system that allows you to chat with an AI assistant. You can select a model to your left and a system persona to start a conversation. You can also save and load chat histories.")
 
         with st.sidebar:
-            model_choice = st.selectbox("Select a Model:", list(self.model_list.values()))
+            model_choice = st.selectbox("Select a Model:", [AUTO] + self.model_registry.names(), help="auto picks a model per question by its complexity and length.")
+            # Load the model while the user types; with auto, the one simple questions go to
+            get_session(self.model_router.pick(1, 0, False) if model_choice == AUTO else model_choice).warm_in_background()
             prompt_id = st.selectbox("Select a System Persona:", list(self.prompts.keys()), format_func=lambda x: self.prompts[x]['one_word_description'])
             system_prompt = self.get_system_prompt(prompt_id)
+            use_cache = st.checkbox("Reuse cached answers", value=True, help="Answer repeated questions with the same persona and recent context from the response cache.")
+            use_intents = st.checkbox("Answer home commands directly", value=True, help="Answer known smart-home commands such as 'turn on the kitchen lights' without calling the model.")
+            summarize = st.checkbox("Summarize older turns", value=False, help="When the conversation outgrows the context budget, replace the oldest turns with a summary instead of dropping them.")
 
             self.display_chat_selector()
 
+            if st.session_state.get('response_stats'):
+                st.markdown("**Last reply**")
+                self.display_response_stats(st.session_state['response_stats'][-1])
+
             if st.button('New Chat'):
                 st.session_state['conversation_history'] = []
                 st.session_state['set_system_prompt'] = True
@@ -219,6 +455,7 @@ class ConversationalAIApp:
         chat_container = st.container()
         with chat_container:
             self.display_chat()
+        st.markdown("<hr>", unsafe_allow_html=True)
 
         if 'input_key' not in st.session_state:
             st.session_state.input_key = 0
@@ -226,18 +463,20 @@ class ConversationalAIApp:
         if 'chat_id' not in st.session_state:
             st.session_state['chat_id'] = uuid.uuid4().hex 
 
-        user_input = st.text_input("You:", key=f"user_input_{st.session_state.input_key}", disabled=st.session_state.get('request_in_progress', False))
+        st.text_input("You:", key=f"user_input_{st.session_state.input_key}", disabled=st.session_state.get('request_in_progress', False))
 
         # Send the message 
-        if st.button("Send", disabled=st.session_state.get('request_in_progress', False)) and user_input and not st.session_state.get('last_input', '') == user_input:
-            response = self.generate_response(user_input, model_choice, system_prompt)
-            st.session_state['last_input'] = user_input  # Track last input to prevent duplication
-            self.save_chat_history()  # Save after sending message
-            st.session_state.input_key += 1  # Increment the key to reset the input box
-            st.rerun()
+        st.button("Send", disabled=st.session_state.get('request_in_progress', False), on_click=self.submit_input)
+        pending_input = st.session_state.pop('pending_input', None)
+        if pending_input:
+            # Stream into the chat container and commit to history in this run, no second rerun needed
+            self.generate_response(pending_input, model_choice, system_prompt, container=chat_container, summarize=summarize, use_cache=use_cache, use_intents=use_intents)
+            st.session_state['last_input'] = pending_input  # Track last input to prevent duplication
+            self.save_chat_history(st.session_state.get('answered_by'))  # Save after sending message
 
         if st.button("Clear Chat"):
             st.session_state['conversation_history'] = []
+            self.get_chat_log(st.session_state['chat_id']).reset()  # Next save rewrites the chat instead of appending
             st.session_state['request_in_progress'] = False
             st.session_state['set_system_prompt'] = True
             st.session_state['last_input'] = ""  # Reset the last input
@@ -0,0 +1,129 @@
+import os
+import sqlite3
+import time
+from chat_log import ChatLog
+
+
+class ChatCatalog:
+    """ SQLite index of the saved chats in a directory.
+
+    Holds one row per chat (id, title, model, message count, created/updated timestamps) so the sidebar can list
+    chats newest first, one page at a time, without scanning the directory or opening every file. Rows are
+    updated on save and delete. The first time a directory is opened the index is rebuilt from the files that
+    are already there.
+    """
+
+    def __init__(self, chats_dir='./chats', db_name='catalog.sqlite3', title_length=60):
+        """ Args:
+            chats_dir (str): The directory holding chat_<id>.json files.
+            db_name (str): The index file name inside chats_dir.
+            title_length (int): Maximum number of characters kept for a chat title.
+        """
+        self.chats_dir = chats_dir
+        self.title_length = title_length
+        os.makedirs(chats_dir, exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(chats_dir, db_name), check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        created = self.conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'chats'"
+        ).fetchone() is None
+        with self.conn:
+            self.conn.execute(
+                """CREATE TABLE IF NOT EXISTS chats (
+                    chat_id TEXT PRIMARY KEY,
+                    title TEXT NOT NULL,
+                    model TEXT,
+                    message_count INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )"""
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS chats_updated_at ON chats (updated_at DESC)")
+        if created:
+            self.rebuild()
+
+    @staticmethod
+    def filename(chat_id):
+        """ The snapshot filename of a chat. """
+        return f'chat_{chat_id}.json'
+
+    def make_title(self, messages):
+        """ Build a title from the first user message of a chat. """
+        for message in messages:
+            if message.get('role') == 'user' and message.get('content', '').strip():
+                title = ' '.join(message['content'].split())
+                if len(title) > self.title_length:
+                    title = title[:self.title_length - 1].rstrip() + '…'
+                return title
+        return 'Untitled chat'
+
+    def upsert(self, chat_id, messages, model=None, updated_at=None):
+        """ Add or refresh the entry of a chat after it was saved.
+        Args:
+            chat_id (str): The chat id.
+            messages (list): The chat history.
+            model (str, optional): The model used for the latest reply. Keeps the stored one when omitted.
+            updated_at (float, optional): Unix timestamp of the save, defaults to now.
+        """
+        updated_at = time.time() if updated_at is None else updated_at
+        with self.conn:
+            self.conn.execute(
+                """INSERT INTO chats (chat_id, title, model, message_count, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(chat_id) DO UPDATE SET
+                    title = excluded.title,
+                    model = COALESCE(excluded.model, chats.model),
+                    message_count = excluded.message_count,
+                    updated_at = excluded.updated_at""",
+                (chat_id, self.make_title(messages), model, len(messages), updated_at, updated_at),
+            )
+
+    def delete(self, chat_id):
+        """ Remove the entry of a deleted chat. """
+        with self.conn:
+            self.conn.execute("DELETE FROM chats WHERE chat_id = ?", (chat_id,))
+
+    def get(self, chat_id):
+        """ Get the entry of a chat as a dict, or None if it isn't indexed. """
+        row = self.conn.execute("SELECT * FROM chats WHERE chat_id = ?", (chat_id,)).fetchone()
+        return dict(row) if row else None
+
+    def count(self):
+        """ Number of indexed chats. """
+        return self.conn.execute("SELECT COUNT(*) FROM chats").fetchone()[0]
+
+    def list_chats(self, limit=25, offset=0):
+        """ List chats, most recently updated first.
+        Args:
+            limit (int): Page size.
+            offset (int): Number of chats to skip.
+        Returns:
+            list: Entries as dicts with chat_id, title, model, message_count, created_at and updated_at.
+        """
+        rows = self.conn.execute(
+            "SELECT * FROM chats ORDER BY updated_at DESC, chat_id LIMIT ? OFFSET ?", (limit, offset)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def rebuild(self):
+        """ Re-index every chat file in the directory, using file modification times as timestamps. """
+        with self.conn:
+            self.conn.execute("DELETE FROM chats")
+        for name in os.listdir(self.chats_dir):
+            if not (name.startswith('chat_') and name.endswith('.json')):
+                continue
+            path = os.path.join(self.chats_dir, name)
+            chat_id = name[len('chat_'):-len('.json')]
+            try:
+                messages = ChatLog(path).load()
+            except ValueError:
+                continue  # Unreadable snapshot, leave it out of the index
+            journal_path = os.path.splitext(path)[0] + '.jsonl'
+            mtimes = [os.path.getmtime(p) for p in (path, journal_path) if os.path.exists(p)]
+            updated_at = max(mtimes)
+            self.upsert(chat_id, messages, updated_at=updated_at)
+            with self.conn:
+                self.conn.execute(
+                    "UPDATE chats SET created_at = ? WHERE chat_id = ?",
+                    (min(os.path.getctime(path), updated_at), chat_id),
+                )
@@ -0,0 +1,127 @@
+import json
+import os
+
+
+class ChatLog:
+    """ Append-only persistence for a single chat history.
+
+    The history lives in two files next to each other:
+        chat_<id>.json   compacted snapshot, a plain JSON list of messages (the format load_chat_history reads)
+        chat_<id>.jsonl  journal, one {"i": index, "message": {...}} line per message appended since the snapshot
+
+    Each save only appends the new messages to the journal. Once the journal holds more than
+    compact_every entries it is folded into a fresh snapshot, written to a temp file and swapped in
+    with os.replace so a crash never leaves a half-written snapshot behind.
+    """
+
+    def __init__(self, path, compact_every=50):
+        """ Args:
+            path (str): Path of the JSON snapshot, e.g. './chats/chat_<id>.json'.
+            compact_every (int): Number of journal entries after which the journal is folded into the snapshot.
+        """
+        self.path = path
+        self.journal_path = os.path.splitext(path)[0] + '.jsonl'
+        self.compact_every = compact_every
+        self.persisted = None  # Number of messages already on disk, read lazily
+        self.journal_entries = 0
+
+    def load(self):
+        """ Load the full history from the snapshot plus the journal.
+        A torn last journal line (crash mid-write) is ignored.
+        Returns:
+            list: The messages in order.
+        """
+        messages = []
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as file:
+                messages = json.load(file)
+        self.journal_entries = 0
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, 'rb+') as file:
+                good_end = 0
+                for line in file:
+                    try:
+                        if not line.endswith(b'\n'):
+                            raise ValueError('unterminated journal line')
+                        entry = json.loads(line)
+                    except ValueError:
+                        file.truncate(good_end)  # Torn write, drop it so later appends start on a clean line
+                        break
+                    good_end += len(line)
+                    self.journal_entries += 1
+                    if entry['i'] == len(messages):
+                        messages.append(entry['message'])
+                    # Entries below len(messages) were already compacted into the snapshot
+        self.persisted = len(messages)
+        return messages
+
+    def save(self, messages):
+        """ Persist the messages, writing only what is not on disk yet.
+        Args:
+            messages (list): The full in-memory history.
+        """
+        if self.persisted is None:
+            if os.path.exists(self.path) or os.path.exists(self.journal_path):
+                self.load()
+            else:
+                self.persisted = 0
+        if self.persisted == 0:
+            self.compact(messages, truncate=True)  # First save (or first after reset) writes the snapshot so the chat is listed straight away
+            return
+        if len(messages) < self.persisted:
+            self.compact(messages, truncate=True)  # History was cleared or truncated, the journal can't express that
+            return
+        new_messages = messages[self.persisted:]
+        if not new_messages:
+            return
+        lines = ''.join(
+            json.dumps({'i': self.persisted + offset, 'message': message}) + '\n'
+            for offset, message in enumerate(new_messages)
+        )
+        with open(self.journal_path, 'a') as file:
+            file.write(lines)
+            file.flush()
+            os.fsync(file.fileno())
+        self.persisted = len(messages)
+        self.journal_entries += len(new_messages)
+        if self.journal_entries >= self.compact_every:
+            self.compact(messages)
+
+    def reset(self):
+        """ Mark whatever is on disk as stale, e.g. after the in-memory history was cleared.
+        The next save rewrites the snapshot instead of appending to it.
+        """
+        self.persisted = 0
+        self.journal_entries = 0
+
+    def compact(self, messages, truncate=False):
+        """ Write a fresh snapshot atomically and empty the journal.
+        Args:
+            messages (list): The full in-memory history.
+            truncate (bool): True when messages no longer extends what is on disk. The journal is then dropped
+                before the snapshot is swapped, so a crash can't replay stale entries on top of the new history.
+        """
+        directory = os.path.dirname(self.path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        if truncate and os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as file:
+            json.dump(messages, file, indent=4)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self.path)
+        # A crash before this point leaves journal entries whose index is already covered by the snapshot,
+        # load() skips those.
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self.persisted = len(messages)
+        self.journal_entries = 0
+
+    def delete(self):
+        """ Remove the snapshot and the journal. """
+        for path in (self.path, self.journal_path):
+            if os.path.exists(path):
+                os.remove(path)
+        self.persisted = 0
+        self.journal_entries = 0
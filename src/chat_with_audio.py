@@ -1,9 +1,46 @@
+import argparse
+import contextlib
 import json
-import subprocess
-import threading
-import sounddevice as sd
-from pocketsphinx import LiveSpeech
-from ollama import chat
+import queue
+import sys
+import time
+from chat_log import ChatLog
+from context_window import ContextWindow, format_report
+from ollama_session import get_session, format_metrics
+from response_cache import default_cache, format_stats
+from speech_pipeline import SpeechPipeline, CancelToken, interruptible, format_timings
+from audio_io import PicoSynthesizer, SoundDevicePlayer
+from speech_recognizer import SpeechRecognizer, MicrophoneSource, WavSource, DEFAULT_WAKE_WORD
+from intent_router import default_router, format_stats as format_intent_stats
+from model_registry import AUTO, ModelRegistry, ModelRouter, format_decision
+
+SERVICES = {
+    'chat_log': lambda: ChatLog('chat.json'),
+    'context_window': ContextWindow,
+    'response_cache': default_cache,
+    'intent_router': default_router,
+    'model_router': lambda: ModelRouter(ModelRegistry.from_config(), counter=service('context_window').counter),
+}
+_services = {}
+_player = None
+_recognizer = None
+
+voices = {
+    '1': 'en-GB',
+    '2': 'en-US',
+    '3': 'de-DE',
+    '4': 'es-ES',
+    '5': 'fr-FR',
+    '6': 'it-IT'
+}
+
+def service(name):
+    """ The shared chat log, context window, response cache, intent router or model router, created on first use.
+    Importing the module reads no config and creates no files, so it works from any directory and --ask starts fast.
+    """
+    if name not in _services:
+        _services[name] = SERVICES[name]()
+    return _services[name]
 
 def load_prompts(file_path):
     with open(file_path, 'r') as file:
@@ -17,83 +54,239 @@ def get_system_prompt(prompts, prompt_id=None):
         return prompts['1']['description']  # Default to base assistant prompt
 
 def save_chat_history(history):
-    with open('chat.json', 'w') as file:
-        json.dump(history, file, indent=4)
+    service('chat_log').save(history)  # Appends only the new messages to chat.jsonl
 
 def load_chat_history():
-    try:
-        with open('chat.json', 'r') as file:
-            return json.load(file)
-    except FileNotFoundError:
-        return []
+    return service('chat_log').load()
 
-def generate_base_response(question, history, model, assistant_name, system_prompt, language, add_system_prompt=False):
+def generate_base_response(question, history, model, assistant_name, system_prompt, language, add_system_prompt=False,
+                           speak=True, save=True, cancel=None, store=True):
+    """ Answer a question, speaking it sentence by sentence.
+    cancel (CancelToken, optional) interrupts the answer from another thread, e.g. on barge-in: playback stops,
+    generation is abandoned and only the part the user actually heard goes into the history. Ctrl+C does the same.
+    store=False leaves caching the answer to the caller, like the router loop that may still reject it.
+    """
+    asked = time.perf_counter()
+    cancel = cancel or CancelToken()
+    intent_router, response_cache = service('intent_router'), service('response_cache')
     if add_system_prompt:
         # Add system prompt only on the first interaction of each session
         history.append({'role': 'system', 'content': system_prompt})
+    context = list(history)  # Messages before the question, part of the cache key
     history.append({'role': 'user', 'content': question})
-    stream = chat(
-        model=model,
-        messages=history,
-        stream=True,
-    )
+    # Sentences are spoken as soon as they are complete, while the model keeps generating
+    speech = SpeechPipeline(PicoSynthesizer(language), get_player() if speak else None)
+    if speak:
+        speech.start(asked)
+        cancel.on_cancel(speech.stop)  # Silences the answer right away, from whichever thread cancels
     response = ""
-    for chunk in stream:
-        if 'message' in chunk:
-            content = chunk['message']['content']
-            response += content
-            print({content}', end='', flush=True)
-    print('\n')
+    generated = None  # When the answer was complete or abandoned
+    try:
+        routed = intent_router.route(question)
+        cached = None if routed is not None else response_cache.lookup(model, system_prompt, context, question)
+        if routed is not None:
+            # Known smart-home commands are answered without calling the model
+            response = routed['response']
+            generated = time.perf_counter()
+            print(response)
+            print(f"[intent] {routed['intent']} by {routed['route']} in {routed['latency'] * 1000:.2f} ms; "
+                  f"{format_intent_stats(intent_router.stats())}")
+            if speak:
+                speech.feed(response)
+        elif cached is not None:
+            response = cached
+            generated = time.perf_counter()
+            print(response)
+            print(f'[cache] {format_stats(response_cache.stats())}')
+            if speak:
+                speech.feed(response)
+        else:
+            messages, report = service('context_window').fit(history, model)
+            print(f'[context] {format_report(report)}')
+            session = get_session(model)
+            for chunk in interruptible(session.chat(messages), cancel):
+                if 'message' in chunk:
+                    content = chunk['message']['content']
+                    response += content
+                    print(content, end='', flush=True)
+                    if speak:
+                        speech.feed(content)
+            generated = time.perf_counter()
+            print('\n')
+            if not cancel.cancelled:
+                print(f'[ollama] {format_metrics(session.last_metrics)}')
+                if store:
+                    response_cache.store(model, system_prompt, context, question, response)
+        if speak:
+            timings = speech.finish()
+            print(f'[speech] {format_timings(timings)}')
+    except KeyboardInterrupt:
+        cancel.cancel('keyboard')
+        if speak:
+            speech.finish()
+    if cancel.cancelled:
+        if generated is None or generated > cancel.requested_at:
+            generated = generated or time.perf_counter()
+            print(f"[interrupted] {cancel.reason}, generation abandoned "
+                  f"{(generated - cancel.requested_at) * 1000:.0f} ms after the interruption")
+        if speak:
+            response = speech.spoken_text()  # Only what was heard becomes part of the conversation
     history.append({'role': 'assistant', 'content': response})
-    text_to_speech_pico(response, language)
-    save_chat_history(history)  # Save chat history after each interaction
+    if save:
+        save_chat_history(history)  # Save chat history after each interaction
+    return response
+
+def generate_response(question, history, model, assistant_name, system_prompt, language, add_system_prompt=False,
+                      save=True, **kwargs):
+    """ generate_base_response for any model choice. With 'auto' the model router picks the model for the question
+    and, when the answer is empty, cut off or hedged, asks again on the next larger model; the unsure attempt is
+    dropped from the history (it has been spoken already). Interrupted answers are never escalated. Only the final
+    answer is cached, once, under the first choice, where the next lookup for the question happens.
+    """
+    if model != AUTO:
+        return generate_base_response(question, history, model, assistant_name, system_prompt, language,
+                                      add_system_prompt, save=save, **kwargs)
+    kwargs['cancel'] = kwargs.get('cancel') or CancelToken()
+    model_router = service('model_router')
+    start = len(history)
+    decision = model_router.choose(question, history)
+    cache_model = decision['model']
+    while True:
+        print(f'[router] {format_decision(decision)}')
+        asked_at = time.time()
+        response = generate_base_response(question, history, decision['model'], assistant_name, system_prompt,
+                                          language, add_system_prompt, save=False, store=False, **kwargs)
+        metrics = get_session(decision['model']).last_metrics or {}
+        generated = metrics.get('timestamp', 0) >= asked_at  # Else stale: an intent or cached answer
+        truncated = generated and metrics['done_reason'] == 'length'
+        decision = None if kwargs['cancel'].cancelled else model_router.escalate(decision, response, truncated)
+        if decision is None:
+            break
+        del history[start:]  # Ask again as if the unsure answer had not been given
+    if generated and not kwargs['cancel'].cancelled:
+        service('response_cache').store(cache_model, system_prompt, history[:start], question, response)
+    if save:
+        save_chat_history(history)
     return response
 
-def text_to_speech_pico(text, language="en-US"):
-    output = "speech.wav"
-    command = ["pico2wave", "--wave", output, "--lang", language, text]
-    subprocess.run(command, check=True)
-    enhance_audio_quality(output)
-
-def enhance_audio_quality(input_file):
-    output_file = "enhanced_speech.wav"
-    command = ["ffmpeg", "-y", "-i", input_file, "-ac", "2", "-ar", "44100", "-sample_fmt", "s16", output_file]
-    subprocess.run(command, check=True)
-    play_audio(output_file)
-
-def play_audio(file_path):
-    def run_player():
-        subprocess.run(["aplay", file_path])
-    player_thread = threading.Thread(target=run_player)
-    player_thread.start()
-    input("Press Enter to stop playback...\n")
-    subprocess.run(["pkill", "aplay"])
-
-def record_and_recognize():
-    print("Recording... Speak now. Press Enter to stop.")
-    speech = LiveSpeech(
-        verbose=False,
-        sampling_rate=16000,
-        buffer_size=2048,
-        no_search=False,
-        full_utt=True
-    )
-    recognized_text = ""
+def get_player():
+    """ The sounddevice player shared by all answers, opened on the first spoken one. """
+    global _player
+    if _player is None:
+        _player = SoundDevicePlayer()
+    return _player
+
+def get_recognizer():
+    """ The microphone recognizer behind the 'speak' command. The decoder is loaded once and the recognizer is
+    paused between commands.
+    """
+    global _recognizer
+    if _recognizer is None:
+        _recognizer = SpeechRecognizer(MicrophoneSource(), wake_word=None)
+        _recognizer.pause()
+        _recognizer.start()
+    return _recognizer
+
+def record_and_recognize(timeout=10.0):
+    recognizer = get_recognizer()
+    print("Recording... Speak now, a pause ends the recording.")
+    recognizer.resume()
     try:
-        for phrase in speech:
-            print('Recognized:', str(phrase))
-            recognized_text += str(phrase) + " "
+        utterance = recognizer.get(timeout=timeout)
+    except queue.Empty:
+        utterance = None
+    finally:
+        recognizer.pause()
+    return utterance['text'] if utterance else ""
+
+def select_model(choice):
+    """ Model for a menu number, 'auto' or a model name; the registry's default model for anything else. """
+    return service('model_router').registry.select(choice)
+
+def warm(model):
+    """ Load a model in the background; with 'auto', the one simple questions are routed to. """
+    get_session(service('model_router').pick(1, 0, False) if model == AUTO else model).warm_in_background()
+
+def ask_once(question, model_choice, prompt_id, language, speak):
+    """ Non-interactive mode for scripts and automations: print only the answer on stdout and exit, everything
+    else goes to stderr. The answer is not added to chat.json.
+    """
+    if question == '-':
+        question = sys.stdin.read()
+    model = select_model(model_choice)
+    system_prompt = get_system_prompt(load_prompts('./src/prompts/system_prompts.json'), prompt_id)
+    history = []
+    with contextlib.redirect_stdout(sys.stderr):
+        response = generate_response(question.strip(), history, model, 'Plex', system_prompt, language,
+                                     add_system_prompt=True, speak=speak, save=False)
+    print(response)
+
+def listen(wake_word, wav_paths, model_choice, prompt_id, language, barge_in=False):
+    """ Hands-free mode: answer every utterance that starts with the wake word, until the input ends or Ctrl+C.
+    wav_paths replaces the microphone with recordings. The conversation is not added to chat.json.
+    By default the recognizer is paused while an answer plays, so the assistant cannot hear itself. With barge_in,
+    speech during an answer interrupts it instead; only use it with echo cancellation on the input (a headset, or
+    e.g. PulseAudio's module-echo-cancel), otherwise the assistant interrupts itself.
+    """
+    current = {'cancel': None}
+
+    def interrupt(_onset):
+        if current['cancel'] is not None:
+            current['cancel'].cancel('barge-in')
+
+    source = WavSource(wav_paths) if wav_paths else MicrophoneSource()
+    recognizer = SpeechRecognizer(source, wake_word=wake_word or None, on_speech=interrupt if barge_in else None).start()
+    model = select_model(model_choice)
+    warm(model)
+    system_prompt = get_system_prompt(load_prompts('./src/prompts/system_prompts.json'), prompt_id)
+    history = []
+    print(f"Listening for '{wake_word}'..." if wake_word else "Listening...")
+    try:
+        for utterance in recognizer:
+            print(f"Heard: {utterance['text']} (recognized {utterance['latency'] * 1000:.0f} ms after the end of speech)")
+            if not barge_in:
+                recognizer.pause()  # Do not transcribe our own answer
+            current['cancel'] = CancelToken()
+            generate_response(utterance['text'], history, model, 'Plex', system_prompt, language,
+                              add_system_prompt=not history, save=False, cancel=current['cancel'])
+            if current['cancel'].reason == 'keyboard':
+                raise KeyboardInterrupt  # Caught while answering, but Ctrl+C still ends listening
+            current['cancel'] = None
+            recognizer.resume()
     except KeyboardInterrupt:
-        print("Recording manually stopped.")
-    return recognized_text.strip()
+        pass
+    finally:
+        recognizer.stop()
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Voice and text chat with a local model.")
+    parser.add_argument('--ask', metavar='QUESTION', help="answer one question ('-' reads it from stdin) and exit")
+    parser.add_argument('--model', default=AUTO, help="model number from the menu, a model name or 'auto'")
+    parser.add_argument('--prompt', default=None, help="system prompt ID")
+    parser.add_argument('--voice', default='en-GB', help="pico2wave language when speaking")
+    parser.add_argument('--speak', action='store_true', help="also speak the answer in --ask mode")
+    parser.add_argument('--listen', action='store_true', help="hands-free mode, triggered by the wake word")
+    parser.add_argument('--wake-word', default=DEFAULT_WAKE_WORD, help="wake word for --listen, '' for none")
+    parser.add_argument('--wav', nargs='+', help="in --listen mode, read these WAV files instead of the microphone")
+    parser.add_argument('--barge-in', action='store_true',
+                        help="in --listen mode, let speech interrupt an answer (needs echo cancellation)")
+    return parser.parse_args()
 
 def main():
+    args = parse_args()
+    if args.ask:
+        ask_once(args.ask, args.model, args.prompt, args.voice, args.speak)
+        return
+    if args.listen:
+        listen(args.wake_word, args.wav, args.model, args.prompt, args.voice, barge_in=args.barge_in)
+        return
     print("\n")
     print("Welcome to the conversational AI!")
     load_history = input("Do you want to load the previous chat history? (yes/no): ").strip().lower()
     print("\n")
     conversation_history = load_chat_history() if load_history == 'yes' else []
+    if not conversation_history:
+        service('chat_log').reset()  # Start over instead of appending to the previous chat.json
     add_system_prompt = not conversation_history  # Add system prompt only if no history loaded
 
 
@@ -106,32 +299,18 @@ def main():
     system_prompt = get_system_prompt(prompts, prompt_id)
     print("\n")
 
-    voices = {
-        '1': 'en-GB',
-        '2': 'en-US',
-        '3': 'de-DE',
-        '4': 'es-ES',
-        '5': 'fr-FR',
-        '6': 'it-IT'
-    }
-    model_list = {
-        1: 'mistral:latest',
-        2: 'mistral:7b-instruct-v0.2-fp16', 
-        3: 'dolphin-mixtral:latest'
-    }
-
     print("Select a model to use:")
     print("\n")
-    for key, value in model_list.items():
+    model_registry = service('model_router').registry
+    for key, value in model_registry.menu().items():
         print(f"{key}: {value}")
-        
+    print(f"{AUTO}: choose per question")
     print("\n")
-    model_choice = input("Enter the number of the model you want to use: ").strip()
-    if model_choice.isdigit() and int(model_choice) in model_list:
-        model = model_list[int(model_choice)]
-    else:
-        model = model_list[2]  # Default model if invalid choice
-        print(f"Invalid or no model choice. Using default model '{model}'.")
+    model_choice = input("Enter the number of the model you want to use (leave blank for auto): ").strip() or AUTO
+    model = select_model(model_choice)
+    if model == model_registry.default and model_choice not in [str(key) for key in model_registry.menu()] + [model]:
+        print(f"Invalid model choice. Using default model '{model}'.")
+    warm(model)  # Load the model while the voice and name are chosen
 
     print("Select a voice:")
     print("\n")
@@ -155,12 +334,12 @@ def main():
             recognized_text = record_and_recognize()
             if recognized_text:
                 print("Recognized text:", recognized_text)
-                generate_base_response(recognized_text, conversation_history, model, assistant_name, system_prompt, language, add_system_prompt)
+                generate_response(recognized_text, conversation_history, model, assistant_name, system_prompt, language, add_system_prompt)
                 add_system_prompt = False  # Prevent further system prompt inclusion
             else:
                 print("No speech recognized. Please try again.")
         else:
-            generate_base_response(user_input, conversation_history, model, assistant_name, system_prompt, language, add_system_prompt)
+            generate_response(user_input, conversation_history, model, assistant_name, system_prompt, language, add_system_prompt)
             add_system_prompt = False  # Prevent further system prompt inclusion
 
 if __name__ == '__main__':
@@ -0,0 +1,242 @@
+import hashlib
+import os
+from collections import OrderedDict
+
+# Rough characters per token for the model families we run. Used until real prompt_eval_count values calibrate them.
+DEFAULT_CHARS_PER_TOKEN = {
+    'llama2': 3.7,
+    'mistral': 3.8,
+    'mixtral': 3.8,
+    'dolphin-mixtral': 3.8,
+    'gemma': 4.2,
+    'codegemma': 3.6,
+}
+FALLBACK_CHARS_PER_TOKEN = 3.5  # Deliberately pessimistic for unknown models
+MESSAGE_OVERHEAD_TOKENS = 4  # Role markers and separators the chat template adds around every message
+
+# Ollama's default num_ctx is 2048, leave room for the reply
+DEFAULT_BUDGET = int(os.environ.get('CHAT_CONTEXT_BUDGET', 1536))
+SUMMARY_PREFIX = "Summary of the earlier conversation: "
+
+SUMMARY_PROMPT = """Summarize the conversation below in at most {max_words} words. Keep names, devices, settings, decisions and open questions. Write plain sentences, no preamble."""
+
+
+def model_family(model):
+    """ Strip the tag from an Ollama model name, e.g. 'mistral:7b-instruct-v0.2-fp16' -> 'mistral'. """
+    return model.split(':')[0].split('/')[-1]
+
+
+class TokenCounter:
+    """ Estimates prompt tokens per model from character counts.
+
+    Ollama doesn't expose its tokenizers, so the ratio starts from a per-family default and is calibrated with the
+    prompt_eval_count the server reports after each request.
+    """
+
+    def __init__(self, smoothing=0.3):
+        self.smoothing = smoothing
+        self.chars_per_token = {}
+
+    def ratio(self, model):
+        """ Current characters-per-token estimate for a model. """
+        if model in self.chars_per_token:
+            return self.chars_per_token[model]
+        return DEFAULT_CHARS_PER_TOKEN.get(model_family(model), FALLBACK_CHARS_PER_TOKEN)
+
+    def count_message(self, message, model):
+        """ Estimated tokens of one chat message, template overhead included. """
+        return int(len(message.get('content', '')) / self.ratio(model)) + MESSAGE_OVERHEAD_TOKENS
+
+    def count(self, messages, model):
+        """ Estimated tokens of a list of chat messages. """
+        return sum(self.count_message(message, model) for message in messages)
+
+    def observe(self, model, messages, prompt_eval_count):
+        """ Calibrate the ratio of a model with the prompt token count Ollama reported for messages.
+        Counts far off the estimate are ignored: when the server's prompt cache hits it only reports the
+        tokens it actually evaluated.
+        """
+        if not prompt_eval_count:
+            return
+        overhead = MESSAGE_OVERHEAD_TOKENS * len(messages)
+        estimate = self.count(messages, model)
+        if not estimate * 0.5 <= prompt_eval_count <= estimate * 2 or prompt_eval_count <= overhead:
+            return
+        chars = sum(len(message.get('content', '')) for message in messages)
+        observed = chars / (prompt_eval_count - overhead)
+        self.chars_per_token[model] = (1 - self.smoothing) * self.ratio(model) + self.smoothing * observed
+
+
+class ContextWindow:
+    """ Keeps the prompt sent to Ollama within a token budget.
+
+    The leading system prompt and the latest system message are always kept. The remaining budget is filled with
+    the most recent messages, newest first. Older messages are dropped or, when a summarizer is set, replaced by a
+    summary that is cached and extended incrementally as more turns fall out of the window. Once trimmed, the window
+    keeps its start message for as long as it fits, so consecutive prompts share a prefix.
+    """
+
+    def __init__(self, budget=DEFAULT_BUDGET, counter=None, summarizer=None, summary_tokens=256, cache_size=32,
+                 refill_ratio=0.75):
+        """ Args:
+            budget (int): Maximum estimated prompt tokens per request.
+            counter (TokenCounter, optional): Shared token counter, a new one is created if omitted.
+            summarizer (callable, optional): summarizer(messages, previous_summary, model) -> str.
+            summary_tokens (int): Budget reserved for the summary message when summarizing.
+            cache_size (int): Number of summaries kept.
+            refill_ratio (float): Share of the budget filled when the window has to move. The slack lets the next
+                turns reuse the same window start, which keeps the prompt prefix stable for the server's cache.
+        """
+        self.budget = budget
+        self.counter = counter or TokenCounter()
+        self.summarizer = summarizer
+        self.summary_tokens = summary_tokens
+        self.cache_size = cache_size
+        self.refill_ratio = refill_ratio
+        self.summaries = OrderedDict()  # Hash of the summarized message prefix -> summary
+        self.anchor = None  # (role, content) of the message the last trimmed window started at
+
+    def fit(self, messages, model, summarize=None, keep_last=1):
+        """ Select the messages to send for a request.
+        Args:
+            messages (list): The full conversation history, ending with the new user message.
+            model (str): The model the request goes to.
+            summarize (bool, optional): Replace dropped messages with a summary. Defaults to True when a summarizer is set.
+            keep_last (int): Number of trailing messages that are always sent, e.g. a question with its draft.
+        Returns:
+            tuple: (messages to send, report dict with budget, original_tokens, sent_tokens, saved_tokens,
+                dropped_messages and summarized).
+        """
+        summarize = self.summarizer is not None if summarize is None else summarize and self.summarizer is not None
+        costs = [self.counter.count_message(message, model) for message in messages]
+        original_tokens = sum(costs)
+        report = {
+            'budget': self.budget,
+            'original_tokens': original_tokens,
+            'sent_tokens': original_tokens,
+            'saved_tokens': 0,
+            'dropped_messages': 0,
+            'summarized': False,
+        }
+        if original_tokens <= self.budget or not messages:
+            return list(messages), report
+
+        pinned = set()
+        if messages[0]['role'] == 'system':
+            pinned.add(0)
+        system_indexes = [i for i, message in enumerate(messages) if message['role'] == 'system']
+        if system_indexes:
+            pinned.add(system_indexes[-1])
+        available = self.budget - sum(costs[i] for i in pinned) - (self.summary_tokens if summarize else 0)
+
+        start = self.anchored_start(messages, pinned, costs, available)
+        if start is None:
+            # Trim below the budget so the window start (and the prompt prefix the server caches) stays put
+            # for the next few turns instead of sliding on every request
+            remaining = int(available * self.refill_ratio)
+            start = max(0, len(messages) - keep_last)  # The last messages (the question) are always sent
+            remaining -= sum(costs[start:])
+            for i in range(start - 1, -1, -1):
+                if i in pinned:
+                    continue
+                if costs[i] > remaining:
+                    break
+                start = i
+                remaining -= costs[i]
+            # Don't open the window on an assistant reply whose question was dropped
+            while start < len(messages) - keep_last and (start in pinned or messages[start]['role'] == 'assistant'):
+                start += 1
+            self.anchor = (messages[start]['role'], messages[start].get('content', ''))
+        kept = pinned | set(range(start, len(messages)))
+
+        dropped = [message for i, message in enumerate(messages) if i not in kept]
+        selected = [message for i, message in enumerate(messages) if i in kept]
+        if summarize and dropped:
+            summary = self.summary_for(dropped, model)
+            if summary:
+                position = 1 if 0 in pinned else 0
+                selected.insert(position, {'role': 'system', 'content': SUMMARY_PREFIX + summary})
+                report['summarized'] = True
+
+        sent_tokens = self.counter.count(selected, model)
+        report.update(
+            sent_tokens=sent_tokens,
+            saved_tokens=max(0, original_tokens - sent_tokens),
+            dropped_messages=len(dropped),
+        )
+        return selected, report
+
+    def anchored_start(self, messages, pinned, costs, available):
+        """ Index of the previous window start if it is still in messages and the window from it still fits. """
+        if self.anchor is None:
+            return None
+        for i in range(len(messages) - 1, -1, -1):
+            if i not in pinned and (messages[i]['role'], messages[i].get('content', '')) == self.anchor:
+                window_cost = sum(costs[j] for j in range(i, len(messages)) if j not in pinned)
+                return i if window_cost <= available else None
+        return None
+
+    def summary_for(self, messages, model):
+        """ Summary of messages, reusing the cached summary of the longest already summarized prefix.
+        Args:
+            messages (list): The dropped messages, oldest first.
+            model (str): The model to summarize with.
+        Returns:
+            str: The summary.
+        """
+        prefix_hashes = []
+        digest = hashlib.sha1(model.encode())
+        for message in messages:
+            digest.update(f"{message['role']}\0{message.get('content', '')}\0".encode())
+            prefix_hashes.append(digest.copy().hexdigest())
+        for length in range(len(messages), 0, -1):
+            key = prefix_hashes[length - 1]
+            if key in self.summaries:
+                self.summaries.move_to_end(key)
+                if length == len(messages):
+                    return self.summaries[key]
+                previous_summary, new_messages = self.summaries[key], messages[length:]
+                break
+        else:
+            previous_summary, new_messages = None, messages
+        summary = self.summarizer(new_messages, previous_summary, model)
+        self.summaries[prefix_hashes[-1]] = summary
+        while len(self.summaries) > self.cache_size:
+            self.summaries.popitem(last=False)
+        return summary
+
+
+def ollama_summarizer(max_words=150, chat=None):
+    """ Build a summarizer that asks the request's model for a rolling summary.
+    Args:
+        max_words (int): Length limit given to the model.
+        chat (callable, optional): chat(model, messages) -> response dict. Defaults to the model's shared OllamaSession.
+    Returns:
+        callable: summarizer(messages, previous_summary, model) -> str.
+    """
+    if chat is None:
+        from ollama_session import get_session
+
+        def chat(model, messages):
+            return get_session(model).chat(messages, stream=False)
+
+    def summarize(messages, previous_summary, model):
+        transcript = "\n".join(f"{message['role']}: {message.get('content', '')}" for message in messages)
+        if previous_summary:
+            transcript = f"Earlier summary: {previous_summary}\n{transcript}"
+        response = chat(model=model, messages=[
+            {'role': 'system', 'content': SUMMARY_PROMPT.format(max_words=max_words)},
+            {'role': 'user', 'content': transcript},
+        ])
+        return response['message']['content'].strip()
+
+    return summarize
+
+
+def format_report(report):
+    """ One-line description of a fit() report for logs and captions. """
+    line = f"~{report['sent_tokens']} prompt tokens"
+    if report['saved_tokens']:
+        line += f", saved ~{report['saved_tokens']} ({report['dropped_messages']} older messages"
+        line += ", summarized)" if report['summarized'] else " dropped)"
+    return line
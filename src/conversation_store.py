@@ -0,0 +1,88 @@
+from collections import deque
+from context_window import ContextWindow, TokenCounter, DEFAULT_BUDGET, MESSAGE_OVERHEAD_TOKENS
+
+
+class ConversationStore:
+    """ Conversation state for the three-agent loop.
+
+    The canonical dialogue holds only what the user saw: their questions and the final answers. Drafts and
+    critiques are kept per turn as scratch and never fed back into later prompts. Each stage gets its own view:
+
+        base     [base system prompt] + dialogue + [question]
+        refiner  [refiner system prompt] + [question and draft]
+        final    [final system prompt] + dialogue + [question, draft, critique]
+
+    The system prompt always comes first and the dialogue only grows at the end, so consecutive prompts of the
+    same stage share a prefix the server can cache. The dialogue part is trimmed by one ContextWindow per stage
+    (each remembers its own window start), which keeps every prompt within the budget no matter how long the
+    conversation gets.
+    """
+
+    def __init__(self, budget=DEFAULT_BUDGET, counter=None, scratch_turns=20):
+        """ Args:
+            budget (int): Token budget of the base and final views.
+            counter (TokenCounter, optional): Token counter shared by the stage windows.
+            scratch_turns (int): Number of turns whose drafts and critiques are kept for inspection.
+        """
+        counter = counter or TokenCounter()
+        self.windows = {stage: ContextWindow(budget=budget, counter=counter) for stage in ('base', 'final')}
+        self.reports = {}  # Stage -> ContextWindow report of its latest view
+        self.dialogue = []
+        self.scratch = deque(maxlen=scratch_turns)
+
+    def add_turn(self, question, answer, **scratch):
+        """ Record a finished turn.
+        Args:
+            question (str): The user's question.
+            answer (str): The answer shown to the user.
+            **scratch: Intermediate stage outputs of the turn, e.g. base and refiner.
+        """
+        self.dialogue.append({'role': 'user', 'content': question})
+        self.dialogue.append({'role': 'assistant', 'content': answer})
+        self.scratch.append(dict(scratch, question=question, answer=answer))
+
+    def base_view(self, system_prompt, question, model):
+        messages = [{'role': 'system', 'content': system_prompt}] + self.dialogue + [{'role': 'user', 'content': question}]
+        return self.fit('base', messages, model)
+
+    def refiner_view(self, system_prompt, question, draft):
+        return [
+            {'role': 'system', 'content': system_prompt},
+            {'role': 'user', 'content': f"Question: {question}\n\nDraft answer:\n{draft}"},
+        ]
+
+    def final_view(self, system_prompt, question, draft, critique, model):
+        """ The question, draft and critique are always sent. When they don't fit the budget next to the system
+        prompt, the longer of draft and critique is cut first, so the question itself is never dropped.
+        """
+        system = {'role': 'system', 'content': system_prompt}
+        asked = {'role': 'user', 'content': question}
+        counter = self.windows['final'].counter
+        room = self.windows['final'].budget - counter.count([system, asked], model) - 2 * MESSAGE_OVERHEAD_TOKENS
+        draft, critique = self.shorten([draft, critique], max(0, room), model)
+        messages = [system] + self.dialogue + [
+            asked,
+            {'role': 'assistant', 'content': draft},
+            {'role': 'user', 'content': critique},
+        ]
+        return self.fit('final', messages, model, keep_last=3)
+
+    def shorten(self, texts, tokens, model):
+        """ Cut texts, longest first, until their estimated tokens add up to at most tokens. """
+        ratio = self.windows['final'].counter.ratio(model)
+        texts = list(texts)
+        for i in sorted(range(len(texts)), key=lambda i: -len(texts[i])):
+            excess = sum(len(text) for text in texts) / ratio - tokens
+            if excess <= 0:
+                break
+            keep = max(0, len(texts[i]) - int(excess * ratio) - 1)
+            texts[i] = texts[i][:keep].rstrip() + '…' if keep else ''
+        return texts
+
+    def fit(self, stage, messages, model, keep_last=1):
+        messages, self.reports[stage] = self.windows[stage].fit(messages, model, keep_last=keep_last)
+        return messages
+
+    def messages(self):
+        """ The canonical dialogue, e.g. for saving. """
+        return list(self.dialogue)
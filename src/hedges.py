@@ -0,0 +1,21 @@
+import re
+
+# Phrases of an unsure or refusing answer, grouped by where they count as a hedge
+UNSURE = ("i'm not sure", "i am not sure", "i don't know", "i do not know")  # Anywhere, as whole phrases
+REFUSALS = ("as an ai", "i cannot", "i can't")  # Only when they open the answer
+NON_ANSWERS = ("unclear", "it depends")  # Only as a sentence of their own; "It depends on the mode: ..." answers
+HEDGES = UNSURE + REFUSALS + NON_ANSWERS
+
+HEDGE = re.compile(r"\b(?:{})\b|^(?:{})\b|(?:^|[.!?]\s+)(?:{})\s*(?:[.!?]+|$)".format(
+    *('|'.join(map(re.escape, phrases)) for phrases in (UNSURE, REFUSALS, NON_ANSWERS))))
+
+
+def find_hedge(answer):
+    """ The phrase by which an answer hedges or refuses, or None.
+    Args:
+        answer (str): The answer.
+    Returns:
+        str: The hedge, lowercase, or None.
+    """
+    match = HEDGE.search(answer.strip().lower().replace('’', "'"))
+    return match.group().strip(' .!?') if match else None
@@ -0,0 +1,202 @@
+import datetime
+import os
+import re
+import time
+import numpy as np
+import yaml
+
+DEFAULT_INTENTS_PATH = os.environ.get('INTENTS_PATH', './configs/intents.yaml')
+SLOT = re.compile(r'\{(\w+)\}')
+POLITE_PREFIX = r'(?:(?:hey |ok )?(?:please |can you |could you |would you )*)'
+POLITE_SUFFIX = r'(?: please| thanks| thank you)?'
+
+HANDLERS = {
+    'time': lambda slots: datetime.datetime.now().strftime("It's %H:%M."),
+}
+
+
+def normalize(text):
+    """ Lowercase, punctuation other than apostrophes, % and decimal points dropped, single spaces. """
+    text = re.sub(r"[^\w\s'%.]|\.(?!\d)", ' ', text.lower())
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def slot_pattern(values):
+    """ Regex source for a slot given as a list of words or a regex. """
+    if isinstance(values, str):
+        return values
+    return '|'.join(re.escape(str(value)) for value in sorted(values, key=lambda value: -len(str(value))))
+
+
+class Intent:
+    """ One command: its compiled patterns and how to answer it. """
+
+    def __init__(self, name, patterns=(), response=None, handler=None, examples=(), slots=None):
+        self.name = name
+        self.response = response
+        self.handler = HANDLERS[handler] if handler else None
+        self.examples = list(examples)
+        self.slot_sources = slots or {}
+        sources = [f'(?:{self.expand(pattern, index)})' for index, pattern in enumerate(patterns)]
+        self.regex = re.compile(f'{POLITE_PREFIX}(?:{"|".join(sources)}){POLITE_SUFFIX}') if sources else None
+        self.required = set(SLOT.findall(response or ''))
+
+    def expand(self, pattern, index):
+        # Group names must be unique across the alternation, so every slot group is tagged with its pattern index
+        return SLOT.sub(lambda match: f'(?P<{match.group(1)}__{index}>{slot_pattern(self.slot_sources[match.group(1)])})',
+                        pattern)
+
+    def match(self, text):
+        """ Slots of a full match of text, or None. """
+        match = self.regex.fullmatch(text) if self.regex else None
+        if match is None:
+            return None
+        return {name.split('__')[0]: value for name, value in match.groupdict().items() if value is not None}
+
+    def find_slots(self, text):
+        """ Slot values found anywhere in text, for matches that did not come from a pattern. None if a slot the
+        response needs is missing.
+        """
+        slots = {}
+        for name in self.required:
+            found = re.search(rf'\b(?:{slot_pattern(self.slot_sources[name])})\b', text)
+            if found is None:
+                return None
+            slots[name] = found.group()
+        return slots
+
+    def answer(self, slots):
+        return self.handler(slots) if self.handler else self.response.format(**slots)
+
+
+class EmbeddingClassifier:
+    """ Nearest-neighbour intent classifier over embedded example utterances.
+
+    The query is compared with every example by cosine similarity. It is accepted when the best example clears
+    threshold and beats the best example of any other intent by margin, so near-ties fall through to the model.
+    """
+
+    def __init__(self, intents, embed_fn, threshold=0.8, margin=0.03):
+        """ Args:
+            intents (list): Intent objects whose examples are embedded.
+            embed_fn (callable): embed_fn(text) -> vector, e.g. response_cache.ollama_embedder().
+            threshold (float): Minimum cosine similarity of a hit.
+            margin (float): Minimum lead over the best example of another intent.
+        """
+        self.embed_fn = embed_fn
+        self.threshold = threshold
+        self.margin = margin
+        self.labels = [intent.name for intent in intents for _ in intent.examples]
+        self.texts = [normalize(example) for intent in intents for example in intent.examples]
+        self.matrix = None  # Embedded on first use
+
+    def embed(self, text):
+        vector = np.asarray(self.embed_fn(text), dtype=np.float32)
+        return vector / (np.linalg.norm(vector) + 1e-12)
+
+    def classify(self, text):
+        """ (intent name, similarity) of a confident match, or None. """
+        if not self.texts:
+            return None
+        if self.matrix is None:
+            self.matrix = np.stack([self.embed(example) for example in self.texts])
+        scores = self.matrix @ self.embed(text)
+        best = int(np.argmax(scores))
+        others = [score for label, score in zip(self.labels, scores) if label != self.labels[best]]
+        if scores[best] < self.threshold or (others and scores[best] - max(others) < self.margin):
+            return None
+        return self.labels[best], float(scores[best])
+
+
+class IntentRouter:
+    """ Answers common smart-home commands before any model is called.
+
+    Every utterance is first matched against the compiled patterns of all intents, which takes microseconds and
+    never guesses. With a classifier, what the patterns miss is compared with embedded examples next. Anything
+    that is still not a confident match returns None and goes to the model as before. Routing counts and the
+    latency of each route are kept in metrics.
+    """
+
+    def __init__(self, intents, classifier=None, on_action=None):
+        """ Args:
+            intents (list): Intent objects, tried in order.
+            classifier (EmbeddingClassifier, optional): Second stage for paraphrases.
+            on_action (callable, optional): on_action(intent, slots), called for every match, e.g. to drive the
+                devices. Its return value is ignored.
+        """
+        self.intents = list(intents)
+        self.by_name = {intent.name: intent for intent in self.intents}
+        self.classifier = classifier
+        self.on_action = on_action
+        self.metrics = {route: {'count': 0, 'seconds': 0.0} for route in ('pattern', 'embedding', 'fallthrough')}
+
+    @classmethod
+    def from_config(cls, path=DEFAULT_INTENTS_PATH, embed_fn=None, **kwargs):
+        """ Load intents from a YAML file (see configs/intents.yaml). embed_fn enables the embedding classifier. """
+        with open(path, 'r') as file:
+            config = yaml.safe_load(file)
+        slots = config.get('slots', {})
+        intents = [Intent(name, slots=slots, **spec) for name, spec in config['intents'].items()]
+        classifier = EmbeddingClassifier(intents, embed_fn) if embed_fn else None
+        return cls(intents, classifier=classifier, **kwargs)
+
+    def route(self, text):
+        """ Answer text if it is a known command.
+        Returns:
+            dict: intent, slots, response, route ('pattern' or 'embedding') and latency in seconds; None when the
+                model should answer.
+        """
+        started = time.perf_counter()
+        text = normalize(text)
+        for intent in self.intents:
+            slots = intent.match(text)
+            if slots is not None:
+                return self.result(intent, slots, 'pattern', started)
+        if self.classifier is not None:
+            classified = self.classifier.classify(text)
+            if classified is not None:
+                intent = self.by_name[classified[0]]
+                slots = intent.find_slots(text)
+                if slots is not None:
+                    return self.result(intent, slots, 'embedding', started)
+        self.record('fallthrough', started)
+        return None
+
+    def result(self, intent, slots, route, started):
+        response = intent.answer(slots)
+        if self.on_action is not None:
+            self.on_action(intent.name, slots)
+        return {'intent': intent.name, 'slots': slots, 'response': response, 'route': route,
+                'latency': self.record(route, started)}
+
+    def record(self, route, started):
+        seconds = time.perf_counter() - started
+        self.metrics[route]['count'] += 1
+        self.metrics[route]['seconds'] += seconds
+        return seconds
+
+    def stats(self):
+        """ Counts and mean latency per route plus the share of utterances answered without the model. """
+        requests = sum(metric['count'] for metric in self.metrics.values())
+        hits = self.metrics['pattern']['count'] + self.metrics['embedding']['count']
+        stats = {'requests': requests, 'hit_rate': hits / requests if requests else 0.0}
+        for route, metric in self.metrics.items():
+            stats[f'{route}_hits' if route != 'fallthrough' else route] = metric['count']
+            stats[f'{route}_ms'] = 1000 * metric['seconds'] / metric['count'] if metric['count'] else 0.0
+        return stats
+
+
+def default_router(path=DEFAULT_INTENTS_PATH, embeddings=None):
+    """ The router used by the chat front-ends. The embedding classifier follows INTENT_EMBEDDINGS unless given. """
+    if embeddings is None:
+        embeddings = os.environ.get('INTENT_EMBEDDINGS', '0') == '1'
+    if embeddings:
+        from response_cache import ollama_embedder
+        return IntentRouter.from_config(path, embed_fn=ollama_embedder())
+    return IntentRouter.from_config(path)
+
+
+def format_stats(stats):
+    """ One-line description of stats() for logs and captions. """
+    return ("{requests} utterances, {pattern_hits} by pattern ({pattern_ms:.2f} ms), {embedding_hits} by embedding "
+            "({embedding_ms:.0f} ms), {fallthrough} to the model ({rate:.0%} handled)").format(rate=stats['hit_rate'], **stats)
@@ -1,39 +1,14 @@
-import ollama
-import random
-import re
-import subprocess
+import asyncio
+from context_window import format_report
+from conversation_store import ConversationStore
+from ollama_session import get_session
+from agent_pipeline import AgentPipeline, format_timings
+from response_cache import default_cache, format_stats
+from model_registry import AUTO, ModelRegistry, ModelRouter, format_decision
 
-def generate_model_input(question):
-    question = question.lower()
-    return question
+BASE_SYSTEM_PROMPT = "Provide a concise and relevant response to the user's query. Your name is Plex."
 
-def generate_base_response(question, history, model='mixtral'):
-    system_prompt = "Provide a concise and relevant response to the user's query. Your name is Plex."
-    # system_prompt = """
-    # You are Claude, an AI assistant created by Anthropic to be helpful, harmless, and honest. Your purpose is to provide accurate, relevant, and comprehensive responses to the user's questions, while maintaining a friendly, respectful, and professional tone. Focus on addressing the user's specific needs and keep the conversation on-topic. 
-    # If you need to break down complex topics, use clear explanations, analogies, or examples to ensure the user's understanding. Rely on your vast knowledge to provide insightful and valuable information. Always prioritize the user's well-being and aim to have a positive impact through your interactions.
-    # """
-    history.append({'role': 'system', 'content': system_prompt})
-    history.append({'role': 'user', 'content': question})
-    stream = ollama.chat(
-        model=model,
-        messages=history,
-        stream=True,
-    )
-    print('Base Assistant: ', end='', flush=True)
-    response = ""
-    for chunk in stream:
-        if 'message' in chunk:
-            content = chunk['message']['content']
-            response += content
-            print(content, end='', flush=True)
-    print('\n')
-    history.append({'role': 'assistant', 'content': response})
-    return response
-
-def generate_refiner_response(base_response, history, model='mixtral'):
-
-    system_prompt = """
+REFINER_SYSTEM_PROMPT = """
     YOU SHOULD NEVER OUTPUT MORE THAN A FEW SENTENCES.
     As a refiner assistant, your role is to provide concise, actionable feedback to improve the base assistant's responses, focusing on enhancing clarity, relevance, and overall helpfulness. Analyze the response and identify specific areas for improvement, such as:
     - Removing unnecessary or redundant information
@@ -43,91 +18,85 @@ def generate_refiner_response(base_response, history, model='mixtral'):
     - Recommending additional relevant information or examples to include
     Provide your feedback in a clear, bullet-pointed format, and prioritize the most impactful changes. Avoid engaging in conversations with the base assistant or making subjective comments.
     """
-    history_subset = history[-3:]  # Use only the last 3 messages for the refiner
-    history_subset.append({'role': 'system', 'content': system_prompt})
-    history_subset.append({'role': 'user', 'content': base_response})
-    stream = ollama.chat(
-        model=model,
-        messages=history_subset,
-        stream=True,
-
-    )
-    print('Refiner Assistant: ', end='', flush=True)
-    response = ""
-    for chunk in stream:
-        if 'message' in chunk:
-            content = chunk['message']['content']
-            response += content
-            print(content, end='', flush=True)
-    print('\n')
-    history.append({'role': 'assistant', 'content': response})
-    return response
-
-def generate_final_response(question, base_response, refiner_response, history, model='mixtral'):
-    system_prompt = """You are an agent meant to take the data from the refiner, and provide a final message back to the user. The user doesn't know you are talking with a refiner agent. Ensure you focus on providing a concise and meaningful answer to the user, never mentioning the refiner agents. Enhance the response for clarity and conciseness, focusing on directly answering the user's question with minimal additional information."""
 
-    # system_prompt = """
-    # As Claude, your primary goal is to provide a concise, relevant, and helpful response to the user's question or request. Carefully review the refiner assistant's feedback and incorporate their suggestions to improve your response, without mentioning the refiner's involvement.
+FINAL_SYSTEM_PROMPT = """You are an agent meant to take the data from the refiner, and provide a final message back to the user. The user doesn't know you are talking with a refiner agent. Ensure you focus on providing a concise and meaningful answer to the user, never mentioning the refiner agents. Enhance the response for clarity and conciseness, focusing on directly answering the user's question with minimal additional information."""
 
-    # When crafting your refined response:
-    # - Greet the user warmly and acknowledge their question or request
-    # - Directly address the user's specific needs or inquiries in a clear and concise manner
-    # - Provide well-structured information that is easy for the user to understand
-    # - Use examples, analogies, or explanations only when necessary to clarify complex topics
-    # - If relevant, offer additional insights or resources that add value to the user's query
-    # - Maintain a friendly and conversational tone, while keeping the response focused and on-topic
-    # - Conclude by asking if there's anything else you can assist the user with
-
-    # Remember, your aim is to deliver a high-quality, user-centered response that demonstrates your expertise and commitment to being helpful, honest, and concise. Keep the conversation focused on the user's needs and strive to provide a valuable interaction in as few words as possible. Make the user feel heard and supported, without overwhelming them with unnecessary details.    """
-    history.append({'role': 'system', 'content': system_prompt})
-    history.append({'role': 'user', 'content': question})
-    history.append({'role': 'assistant', 'content': base_response})
-    history.append({'role': 'user', 'content': refiner_response})
-    stream = ollama.chat(
-        model=model,
-        messages=history,
-        stream=True,
-    )
-    print('Final Response: ', end='', flush=True)
-    response = ""
-    for chunk in stream:
-        if 'message' in chunk:
-            content = chunk['message']['content']
-            response += content
-            print(content, end='', flush=True)
-    print('\n')
-    history.append({'role': 'assistant', 'content': response})
-    return response
 
 def main():
     print("Welcome to the conversational AI!")
     print("Type 'quit' to exit the conversation.\n")
-    model_list = {1: 'mixtral', 
-    2: 'mistral:7b-instruct-v0.2-fp16', 
-    3: 'dolphin-mixtral'}
+    registry = ModelRegistry.from_config()
 
     print("Select a model to use:")
-    for key, value in model_list.items():
+    for key, value in registry.menu().items():
         print(f"{key}: {value}")
-    model_choice = input("Enter the number of the model you want to use: ")
+    print(f"{AUTO}: choose per question")
+    model_choice = input("Enter the number of the model you want to use (leave blank for auto): ").strip() or AUTO
+    model = registry.select(model_choice)
+    if model == registry.default and model_choice not in [str(key) for key in registry.menu()] + [model]:
+        print(f"Invalid model choice. Using default model '{model}'.")
+    router = ModelRouter(registry) if model == AUTO else None
 
-    if model_choice.isdigit():
-        model_choice = int(model_choice)
-        if model_choice in model_list:
-            model = model_list[model_choice]
-        else:
-            print("Invalid model choice. Using default model 'mixtral'.")
-            model = 'mixtral'
+    pipeline_modes = {1: 'speculative', 2: 'fast', 3: 'sequential'}
+    print("Select a pipeline mode:")
+    print("1: speculative - refiner and final start on partial drafts")
+    print("2: fast - skip refinement when the base answer is short or already on point")
+    print("3: sequential - base, refiner and final one after another")
+    mode_choice = input("Enter the number of the mode you want to use: ").strip()
+    mode = pipeline_modes.get(int(mode_choice), 'speculative') if mode_choice.isdigit() else 'speculative'
 
-    conversation_history = []
+    # Load the model while the user types the first question; with auto, the one simple questions go to
+    get_session(router.pick(1, 0, False) if router else model).warm_in_background()
+    pipeline = AgentPipeline(
+        registry.default if router else model,
+        {'base': BASE_SYSTEM_PROMPT, 'refiner': REFINER_SYSTEM_PROMPT, 'final': FINAL_SYSTEM_PROMPT},
+        speculative=mode != 'sequential',
+        fast_path=mode == 'fast',
+    )
+    asyncio.run(chat_loop(pipeline, router))
+
+async def chat_loop(pipeline, router=None):
+    """ Read questions until 'quit'. With a router every question picks its own model, and the turn is run again on
+    a larger model when the final answer looks unsure.
+    """
+    # One event loop for the whole session, so the pooled async client is reused across turns
+    store = ConversationStore()
+    response_cache = default_cache()
     while True:
-        user_input = input("You: ")
+        user_input = await asyncio.to_thread(input, "You: ")
         if user_input.lower() == 'quit':
             print("Goodbye!")
             break
-        base_response = generate_base_response(user_input, conversation_history, model=model)
-        refiner_response = generate_refiner_response(base_response, conversation_history, model=model)
-        final_response = generate_final_response(user_input, base_response, refiner_response, conversation_history, model=model)
+        decision = router.choose(user_input, store.dialogue) if router else None
+        if decision is not None:
+            pipeline.model = decision['model']
+            print(f"[router] {format_decision(decision)}")
+        cached = response_cache.lookup(pipeline.model, BASE_SYSTEM_PROMPT, store.dialogue, user_input)
+        if cached is not None:
+            print(f"Final Response (cached): {cached}\n")
+            print(f"[cache] {format_stats(response_cache.stats())}")
+            store.add_turn(user_input, cached)
+            continue
+        cache_model = pipeline.model
+        print('Base Assistant: ', end='', flush=True)
+        result = await pipeline.run(user_input, store, on_base_token=lambda token: print(token, end='', flush=True))
+        print('\n')
+        while decision is not None:
+            decision = router.escalate(decision, result['final'])
+            if decision is None:
+                break
+            pipeline.model = decision['model']
+            print(f"[router] {format_decision(decision)}")
+            print('Base Assistant: ', end='', flush=True)
+            result = await pipeline.run(user_input, store, on_base_token=lambda token: print(token, end='', flush=True))
+            print('\n')
+        if not result['fast_path']:
+            print(f"Refiner Assistant: {result['refiner']}\n")
+            print(f"Final Response: {result['final']}\n")
+        print(format_timings(result))
+        print(f"[context] base {format_report(store.reports['base'])}")
+        response_cache.store(cache_model, BASE_SYSTEM_PROMPT, store.dialogue, user_input, result['final'])
+        pipeline.commit(user_input, store, result)
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
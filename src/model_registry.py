@@ -0,0 +1,226 @@
+import json
+import os
+import re
+import time
+import yaml
+from hedges import find_hedge
+from context_window import TokenCounter
+
+DEFAULT_MODELS_PATH = os.environ.get('MODELS_PATH', './configs/models.yaml')
+DEFAULT_ROUTING_LOG = os.environ.get('MODEL_ROUTING_LOG', './cache/routing.jsonl')
+AUTO = 'auto'
+
+# Profile assumed for models that are not in the registry, e.g. one typed by name on the command line
+FALLBACK_PROFILE = {'tier': 2, 'first_token': 0.5, 'tokens_per_second': 20, 'cost': 3, 'context': 4096,
+                    'auto': False, 'strengths': []}
+
+REASONING = re.compile(r"\b(?:explain|why|how (?:does|do|can|would)|compare|difference|analy[sz]e|summari[sz]e|plan|"
+                       r"design|step by step|pros and cons|write|debug|prove|derive|translate|recommend)\b")
+CODE = re.compile(r"```|^\s*(?:def|class|import|from \S+ import|function|SELECT)\b|[{};]\s*$|Traceback \(most recent",
+                  re.MULTILINE)
+
+
+def looks_like_code(text):
+    return CODE.search(text) is not None
+
+
+def complexity(prompt, context_tokens=0):
+    """ Cheap 0..1 estimate of how much model a prompt needs, from its length, words that ask for reasoning
+    or writing, the number of sentences, code and the size of the conversation so far.
+    Args:
+        prompt (str): The user's question.
+        context_tokens (int): Estimated tokens of the earlier conversation.
+    Returns:
+        float: The score.
+    """
+    lowered = prompt.lower()
+    score = 0.4 * min(len(prompt.split()) / 150, 1.0)
+    score += 0.2 * min(len(REASONING.findall(lowered)), 2)
+    score += 0.05 * min(max(len(re.findall(r'[.?!](?:\s|$)', prompt)) - 1, 0), 2)
+    score += 0.3 if looks_like_code(prompt) else 0.0
+    score += 0.1 * min(context_tokens / 4000, 1.0)
+    return min(score, 1.0)
+
+
+class ModelRegistry:
+    """ The models the front-ends offer, with a cost and latency profile for each.
+
+    Menus number the models in registry order starting at 1, so every front-end shows the same list.
+    """
+
+    def __init__(self, models, default=None, routing=None):
+        """ Args:
+            models (dict): Model name -> profile (tier, first_token, tokens_per_second, cost, context, auto,
+                strengths). Missing fields take FALLBACK_PROFILE values.
+            default (str, optional): Model used when a choice is invalid. Defaults to the first model.
+            routing (dict, optional): tier_limits and answer_tokens for ModelRouter.
+        """
+        self.models = {name: {**FALLBACK_PROFILE, 'auto': True, **(profile or {})} for name, profile in models.items()}
+        self.default = default or next(iter(self.models))
+        self.routing = {'tier_limits': [0.3, 0.6], 'answer_tokens': 200, **(routing or {})}
+
+    @classmethod
+    def from_config(cls, path=DEFAULT_MODELS_PATH):
+        """ Load the registry from a YAML file (see configs/models.yaml). """
+        with open(path, 'r') as file:
+            config = yaml.safe_load(file)
+        return cls(config['models'], default=config.get('default'), routing=config.get('routing'))
+
+    def names(self):
+        return list(self.models)
+
+    def menu(self):
+        """ {number: model name} in registry order. """
+        return {number: name for number, name in enumerate(self.models, start=1)}
+
+    def profile(self, name):
+        return self.models.get(name, FALLBACK_PROFILE)
+
+    def select(self, choice):
+        """ Model for a menu number, 'auto' or a model name; the default model for anything else. """
+        choice = str(choice).strip()
+        menu = self.menu()
+        if choice.isdigit() and int(choice) in menu:
+            return menu[int(choice)]
+        if choice.lower() == AUTO:
+            return AUTO
+        return choice if choice in self.models or ':' in choice else self.default
+
+    def estimate(self, name, prompt_tokens, answer_tokens=None):
+        """ Expected seconds and relative cost of answering with a model.
+        Returns:
+            dict: seconds (first token plus generation) and cost (profile cost scaled to the tokens processed).
+        """
+        profile = self.profile(name)
+        answer_tokens = self.routing['answer_tokens'] if answer_tokens is None else answer_tokens
+        return {'seconds': profile['first_token'] + answer_tokens / profile['tokens_per_second'],
+                'cost': profile['cost'] * (prompt_tokens + answer_tokens) / 1000}
+
+
+class ModelRouter:
+    """ Chooses a model per question.
+
+    The prompt's complexity decides the smallest tier that should answer it. Among the models of that tier or
+    above that take part in routing and whose context fits the conversation, the lowest tier wins, then a model
+    with a matching strength, then the lowest estimated latency and cost. When the answer is empty, cut off or
+    hedged (see unsure_reason), escalate() names the model of the next tier up. Every decision is appended as a
+    JSON line to log_path and counted in stats().
+    """
+
+    def __init__(self, registry, log_path=DEFAULT_ROUTING_LOG, counter=None):
+        """ Args:
+            registry (ModelRegistry): Models and routing thresholds.
+            log_path (str, optional): JSONL file the decisions are appended to, None to only count them.
+            counter (TokenCounter, optional): Prompt token estimates, e.g. the context window's calibrated counter.
+        """
+        self.registry = registry
+        self.log_path = log_path
+        self.counter = counter or TokenCounter()
+        self.metrics = {'decisions': 0, 'escalations': 0, 'complexity': 0.0, 'models': {}}
+
+    def required_tier(self, score):
+        for tier, limit in enumerate(self.registry.routing['tier_limits'], start=1):
+            if score <= limit:
+                return tier
+        return len(self.registry.routing['tier_limits']) + 1
+
+    def pick(self, min_tier, tokens, code):
+        """ Best routable model of at least min_tier whose context holds tokens, or None. """
+        candidates = [name for name, profile in self.registry.models.items()
+                      if profile['auto'] and profile['tier'] >= min_tier and profile['context'] >= tokens]
+        if not candidates:
+            return None
+
+        def rank(name):
+            profile = self.registry.profile(name)
+            estimate = self.registry.estimate(name, tokens)
+            return profile['tier'], not (code and 'code' in profile['strengths']), estimate['seconds'], estimate['cost']
+
+        return min(candidates, key=rank)
+
+    def choose(self, prompt, context=()):
+        """ Pick the model for a question.
+        Args:
+            prompt (str): The user's question.
+            context (list): Chat messages before the question.
+        Returns:
+            dict: model, tier, complexity, tokens, code, reason and the latency/cost estimate.
+        """
+        context_tokens = self.counter.count(list(context), self.registry.default)
+        tokens = context_tokens + self.counter.count_message({'content': prompt}, self.registry.default)
+        score = complexity(prompt, context_tokens)
+        tier = self.required_tier(score)
+        code = looks_like_code(prompt)
+        model = self.pick(tier, tokens, code)
+        reason = f"complexity {score:.2f} needs tier {tier}"
+        if model is None:
+            # Nothing of that tier fits: take the routable model with the longest context
+            model = max(self.registry.names(), key=lambda name: (self.registry.profile(name)['auto'],
+                                                                   self.registry.profile(name)['context']))
+            reason += ", no model of that tier fits the context"
+        return self.record({'model': model, 'tier': self.registry.profile(model)['tier'], 'complexity': score,
+                            'tokens': tokens, 'code': code, 'reason': reason,
+                            'estimate': self.registry.estimate(model, tokens), 'escalated_from': None})
+
+    def escalate(self, decision, answer, truncated=False):
+        """ Decision for asking again with a larger model when the answer looks unsure, else None.
+        decision gets the reason, or None, as 'unsure' either way.
+        Args:
+            decision (dict): The decision the answer was generated with.
+            answer (str): The answer.
+            truncated (bool): Generation stopped at its token limit.
+        """
+        reason = unsure_reason(answer, truncated)
+        decision['unsure'] = reason
+        if reason is None:
+            return None
+        model = self.pick(decision['tier'] + 1, decision['tokens'], decision['code'])
+        if model is None:
+            return None
+        self.metrics['escalations'] += 1
+        return self.record({**decision, 'model': model, 'tier': self.registry.profile(model)['tier'],
+                            'reason': f"{reason} from {decision['model']}",
+                            'estimate': self.registry.estimate(model, decision['tokens']),
+                            'escalated_from': decision['model'], 'unsure': None})
+
+    def record(self, decision):
+        self.metrics['decisions'] += 1
+        self.metrics['complexity'] += decision['complexity']
+        self.metrics['models'][decision['model']] = self.metrics['models'].get(decision['model'], 0) + 1
+        if self.log_path:
+            os.makedirs(os.path.dirname(self.log_path) or '.', exist_ok=True)
+            with open(self.log_path, 'a') as file:
+                file.write(json.dumps({'time': time.time(), **decision}) + '\n')
+        return decision
+
+    def stats(self):
+        """ Decisions, escalations, mean complexity and how often each model was picked. """
+        decisions = self.metrics['decisions']
+        return {'decisions': decisions, 'escalations': self.metrics['escalations'],
+                'mean_complexity': self.metrics['complexity'] / decisions if decisions else 0.0,
+                'models': dict(self.metrics['models'])}
+
+
+def unsure_reason(answer, truncated=False):
+    """ Why an answer should be asked again on a larger model, or None when it stands. Only clear signals count:
+    nothing came back, generation hit its token limit, or the model hedged or refused. How many of the question's
+    words the answer repeats does not matter, "Paris." is a complete answer.
+    Args:
+        answer (str): The answer.
+        truncated (bool): Generation stopped at its token limit (Ollama's done_reason 'length').
+    Returns:
+        str: The reason, or None.
+    """
+    if not answer.strip():
+        return "empty answer"
+    if truncated:
+        return "answer cut off"
+    hedge = find_hedge(answer)
+    return f"hedged ('{hedge}')" if hedge else None
+
+
+def format_decision(decision):
+    """ One-line description of a routing decision for logs and captions. """
+    line = "{model} (tier {tier}): {reason}, ~{seconds:.1f}s, cost {cost:.2f}".format(
+        seconds=decision['estimate']['seconds'], cost=decision['estimate']['cost'], **decision)
+    return line if not decision['escalated_from'] else "escalated to " + line
@@ -0,0 +1,204 @@
+import os
+import threading
+import time
+from collections import deque
+import httpx
+import ollama
+
+# How long the server keeps a model loaded after a request. Negative pins it until the server restarts.
+DEFAULT_KEEP_ALIVE = os.environ.get('OLLAMA_KEEP_ALIVE', '30m')
+COLD_LOAD_SECONDS = 0.5  # load_duration above this means the model had to be (re)loaded
+
+_clients = {}
+_sessions = {}
+_lock = threading.RLock()
+
+
+def get_client(host=None):
+    """ Get the shared ollama.Client for a host, so every request reuses one pooled HTTP connection.
+    Args:
+        host (str, optional): Ollama server URL, defaults to OLLAMA_HOST or the library default.
+    Returns:
+        ollama.Client: The pooled client.
+    """
+    host = host or os.environ.get('OLLAMA_HOST')
+    with _lock:
+        if host not in _clients:
+            _clients[host] = ollama.Client(host=host)
+        return _clients[host]
+
+
+def get_session(model, host=None, keep_alive=DEFAULT_KEEP_ALIVE):
+    """ Get the session for a model, creating it on first use.
+    Args:
+        model (str): The model name.
+        host (str, optional): Ollama server URL.
+        keep_alive (str or float): keep_alive policy used when the session is created.
+    Returns:
+        OllamaSession: The shared session.
+    """
+    with _lock:
+        key = (model, host)
+        if key not in _sessions:
+            _sessions[key] = OllamaSession(model, keep_alive=keep_alive, host=host)
+        return _sessions[key]
+
+
+def response_metrics(response):
+    """ Extract the timing metadata Ollama attaches to a finished response (the final chunk when streaming).
+    Args:
+        response (dict): The response or final chunk.
+    Returns:
+        dict: Durations in seconds and token counts. cold_load is True when the model had to be loaded.
+    """
+    load_duration = response.get('load_duration', 0) / 1e9
+    return {
+        'load_duration': load_duration,
+        'prompt_eval_count': response.get('prompt_eval_count', 0),
+        'prompt_eval_duration': response.get('prompt_eval_duration', 0) / 1e9,
+        'eval_count': response.get('eval_count', 0),
+        'eval_duration': response.get('eval_duration', 0) / 1e9,
+        'total_duration': response.get('total_duration', 0) / 1e9,
+        'done_reason': response.get('done_reason'),  # 'length' when the answer hit num_predict
+        'cold_load': load_duration > COLD_LOAD_SECONDS,
+    }
+
+
+def format_metrics(metrics):
+    """ One-line description of response_metrics() output for logs and captions. """
+    if not metrics:
+        return "no metrics"
+    line = "cold load {:.1f}s".format(metrics['load_duration']) if metrics['cold_load'] else "warm model"
+    line += ", prompt eval {} tokens in {:.2f}s".format(metrics['prompt_eval_count'], metrics['prompt_eval_duration'])
+    if 'shared_prefix_messages' in metrics:
+        line += ", {} messages reused from the last prompt".format(metrics['shared_prefix_messages'])
+    return line
+
+
+class OllamaSession:
+    """ Client-side session for one model.
+
+    Every request goes through the same pooled client with the same keep_alive and options, so the server keeps
+    the model resident and never reloads it because a parameter changed. The session also tracks how much of each
+    prompt repeats the previous one (the part the server's prompt cache can reuse) and records the load and
+    prompt-eval durations Ollama reports.
+    """
+
+    def __init__(self, model, keep_alive=DEFAULT_KEEP_ALIVE, host=None, options=None, history_size=100):
+        """ Args:
+            model (str): The model name.
+            keep_alive (str or float): How long the server keeps the model loaded, e.g. '30m' or -1 to pin it.
+            host (str, optional): Ollama server URL.
+            options (dict, optional): Model options sent with every request. Keep them fixed, changing num_ctx reloads the model.
+            history_size (int): Number of per-request metrics kept.
+        """
+        self.model = model
+        self.keep_alive = keep_alive
+        self.options = options
+        self.host = host
+        self.client = get_client(host)
+        self.async_client = None  # Created on first achat(), bound to the event loop running it
+        self.last_messages = []
+        self.last_metrics = None
+        self.metrics = deque(maxlen=history_size)
+        self.warmed = False
+
+    def chat(self, messages, stream=True):
+        """ Send a chat request.
+        Args:
+            messages (list): The messages to send.
+            stream (bool): Stream the response chunk by chunk.
+        Returns:
+            The response dict, or an iterator over chunks when streaming.
+        """
+        shared = self.shared_prefix(messages)
+        self.last_messages = list(messages)
+        response = self.client.chat(
+            model=self.model,
+            messages=messages,
+            stream=stream,
+            options=self.options,
+            keep_alive=self.keep_alive,
+        )
+        if not stream:
+            self.record(response, shared)
+            return response
+        return self.stream(response, shared)
+
+    def stream(self, response, shared):
+        for chunk in response:
+            if chunk.get('done'):
+                self.record(chunk, shared)
+            yield chunk
+
+    async def achat(self, messages):
+        """ Stream a chat request from async code. Use it from one long-lived event loop so the pooled
+        AsyncClient is reused across turns.
+        Args:
+            messages (list): The messages to send.
+        Yields:
+            dict: Response chunks.
+        """
+        if self.async_client is None:
+            self.async_client = ollama.AsyncClient(host=self.host or os.environ.get('OLLAMA_HOST'))
+        shared = self.shared_prefix(messages)
+        self.last_messages = list(messages)
+        response = await self.async_client.chat(
+            model=self.model,
+            messages=messages,
+            stream=True,
+            options=self.options,
+            keep_alive=self.keep_alive,
+        )
+        async for chunk in response:
+            if chunk.get('done'):
+                self.record(chunk, shared)
+            yield chunk
+
+    def shared_prefix(self, messages):
+        """ Number of leading messages identical to the previous request's. """
+        shared = 0
+        for previous, current in zip(self.last_messages, messages):
+            if previous != current:
+                break
+            shared += 1
+        return shared
+
+    def record(self, response, shared):
+        metrics = response_metrics(response)
+        metrics['shared_prefix_messages'] = shared
+        metrics['timestamp'] = time.time()
+        self.last_metrics = metrics
+        self.metrics.append(metrics)
+        self.warmed = True
+
+    def warm(self):
+        """ Load the model without generating anything, so the first real request doesn't pay the cold load.
+        Returns:
+            dict: The load metrics.
+        """
+        response = self.client.generate(model=self.model, prompt='', options=self.options, keep_alive=self.keep_alive)
+        self.warmed = True
+        return response_metrics(response)
+
+    def warm_in_background(self):
+        """ Start warm() on a daemon thread unless the model was already used or warmed. """
+        if self.warmed:
+            return None
+        self.warmed = True
+
+        def run():
+            try:
+                self.warm()
+            except (ollama.ResponseError, httpx.HTTPError) as exc:
+                self.warmed = False
+                print(f"Could not preload {self.model}: {exc}")
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+    def release(self):
+        """ Ask the server to unload the model now. """
+        self.client.generate(model=self.model, prompt='', keep_alive=0)
+        self.warmed = False
@@ -0,0 +1 @@
+""" Retrieval-augmented generation building blocks for llm-smarthome-nb.py. """
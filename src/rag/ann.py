@@ -0,0 +1,187 @@
+import numpy as np
+from rag.knn import normalize_rows, top_k
+
+
+class IVFIndex:
+    """ Inverted-file approximate nearest-neighbour index over cosine similarity, in pure NumPy.
+
+    Training runs spherical k-means on a sample to get n_lists centroids; every vector is stored in the list of
+    its nearest centroid. A query scores the centroids, then only the vectors of its n_probe best lists, so the
+    cost per query is about n_probe / n_lists of a brute-force scan. More probes buy recall for latency.
+
+    Inserts after training go to the nearest existing centroid. When the corpus has grown far beyond the
+    training sample, retrain() redistributes everything over fresh centroids.
+
+    The lists only hold row numbers. An index built with from_store() reads the vectors of those rows from the
+    MmapEmbeddingStore (float16 or int8) when it scores them, so the corpus is never copied into memory; an index
+    filled with add() keeps its own float32 rows.
+    """
+
+    def __init__(self, n_lists=None, n_probe=8, train_iterations=10, sample_per_list=64, seed=0, store=None):
+        """ Args:
+            n_lists (int, optional): Number of lists; defaults to 2 * sqrt(n) of the first training set.
+            n_probe (int): Lists scanned per query unless search() overrides it.
+            train_iterations (int): k-means iterations.
+            sample_per_list (int): Training sample size per list.
+            seed (int): Seed of the training sample and initial centroids.
+            store (MmapEmbeddingStore, optional): Where the vectors of the rows live, set by from_store().
+        """
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.train_iterations = train_iterations
+        self.sample_per_list = sample_per_list
+        self.rng = np.random.default_rng(seed)
+        self.centroids = None
+        self.store = store
+        self.ids = []  # Id of every row added with add()
+        self.vectors = None  # Rows added with add(), with spare capacity
+        self.count = 0
+        self.lists = []  # Per list: [row numbers with spare capacity, size]
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def trained(self):
+        return self.centroids is not None
+
+    @classmethod
+    def from_store(cls, store, block_size=65536, **kwargs):
+        """ Build an index over the live rows of a MmapEmbeddingStore, reading it block by block. The index keeps
+        only row numbers into the store.
+        """
+        index = cls(store=store, **kwargs)
+        rows, _ = store.live_ids()
+        if not len(rows):
+            return index
+        if index.n_lists is None:
+            index.n_lists = max(1, int(2 * np.sqrt(len(rows))))
+        sample = np.sort(index.rng.choice(rows, size=min(len(rows), index.sample_size(len(rows))), replace=False))
+        index.train(store.get_rows(sample))
+        for start in range(0, len(rows), block_size):
+            block = rows[start:start + block_size]
+            index.insert(normalize_rows(store.get_rows(block)), block)
+            index.count += len(block)
+        return index
+
+    def row_vectors(self, rows):
+        """ Normalized float32 vectors of row numbers, from the store or the index's own rows. """
+        return self.store.get_rows(rows) if self.store is not None else self.vectors[rows]
+
+    def row_id(self, row):
+        return self.store.id_of(int(row)) if self.store is not None else self.ids[row]
+
+    def sample_size(self, n):
+        n_lists = self.n_lists or max(1, int(2 * np.sqrt(n)))
+        return n_lists * self.sample_per_list
+
+    def assign(self, vectors, block_size=16384):
+        """ Nearest centroid of every (normalized) vector. """
+        return np.concatenate([
+            np.argmax(vectors[start:start + block_size] @ self.centroids.T, axis=1)
+            for start in range(0, len(vectors), block_size)
+        ]) if len(vectors) else np.empty(0, dtype=np.int64)
+
+    def train(self, vectors):
+        """ Fit the centroids on a representative sample. Any vectors already added are redistributed. """
+        sample = normalize_rows(vectors)
+        if self.n_lists is None:
+            self.n_lists = max(1, int(2 * np.sqrt(len(sample))))
+        if len(sample) > self.sample_size(len(sample)):
+            sample = sample[self.rng.choice(len(sample), size=self.sample_size(len(sample)), replace=False)]
+        n_lists = min(self.n_lists, len(sample))
+        self.centroids = sample[self.rng.choice(len(sample), size=n_lists, replace=False)].copy()
+        for _ in range(self.train_iterations):
+            assignment = self.assign(sample)
+            sums = np.zeros_like(self.centroids)
+            np.add.at(sums, assignment, sample)
+            empty = np.bincount(assignment, minlength=n_lists) == 0
+            sums[empty] = sample[self.rng.choice(len(sample), size=int(empty.sum()))]  # Reseed empty lists
+            self.centroids = normalize_rows(sums)
+        self.n_lists = n_lists
+        existing = self.stored_rows()
+        self.lists = [[np.empty(0, dtype=np.int64), 0] for _ in range(n_lists)]
+        for start in range(0, len(existing), 65536):
+            block = existing[start:start + 65536]
+            self.insert(self.row_vectors(block), block)
+
+    def retrain(self):
+        """ Train fresh centroids on a sample of everything stored and redistribute the vectors. """
+        rows = self.stored_rows()
+        if not len(rows):
+            return  # Nothing stored yet, the first add() trains the index
+        self.n_lists = max(1, int(2 * np.sqrt(len(rows))))
+        sample = np.sort(self.rng.choice(rows, size=min(len(rows), self.sample_size(len(rows))), replace=False))
+        self.train(self.row_vectors(sample))
+
+    def stored_rows(self):
+        """ Row numbers of every vector in the lists, ascending. """
+        filled = [rows[:size] for rows, size in self.lists if size]
+        return np.sort(np.concatenate(filled)) if filled else np.empty(0, dtype=np.int64)
+
+    def add(self, ids, vectors):
+        """ Insert vectors under the given ids. The first insert trains the index if train() was not called. """
+        if self.store is not None:
+            raise ValueError("An index built from a store is rebuilt with from_store(), not added to")
+        vectors = normalize_rows(vectors)
+        if not len(vectors):
+            return
+        if self.vectors is None:
+            self.vectors = np.empty((0, vectors.shape[1]), dtype=np.float32)
+        if self.count + len(vectors) > len(self.vectors):  # Grow geometrically so repeated small adds stay cheap
+            grown = np.empty((max(self.count + len(vectors), 2 * len(self.vectors)), vectors.shape[1]), dtype=np.float32)
+            grown[:self.count] = self.vectors[:self.count]
+            self.vectors = grown
+        rows = np.arange(self.count, self.count + len(vectors))
+        self.vectors[rows] = vectors
+        self.ids.extend(ids)
+        self.count += len(vectors)
+        if not self.trained:
+            self.train(vectors)
+        self.insert(vectors, rows)
+
+    def insert(self, vectors, rows):
+        """ Put rows into the lists of their nearest centroids; vectors are their normalized vectors. """
+        assignment = self.assign(vectors)
+        order = np.argsort(assignment, kind='stable')
+        bounds = np.searchsorted(assignment[order], np.arange(self.n_lists + 1))
+        for list_number in np.flatnonzero(np.diff(bounds)):
+            members = order[bounds[list_number]:bounds[list_number + 1]]
+            entry = self.lists[list_number]
+            size = entry[1] + len(members)
+            if size > len(entry[0]):  # Grow geometrically so repeated small inserts stay cheap
+                grown = np.empty(max(size, 2 * len(entry[0]), 16), dtype=np.int64)
+                grown[:entry[1]] = entry[0][:entry[1]]
+                entry[0] = grown
+            entry[0][entry[1]:size] = rows[members]
+            entry[1] = size
+
+    def search(self, queries, k=5, n_probe=None):
+        """ Approximate top-k for every query.
+        Args:
+            queries (array-like): (N, d) query matrix, or a single (d,) vector.
+            k (int): Results per query.
+            n_probe (int, optional): Lists scanned per query, overriding the index default.
+        Returns:
+            tuple: (ids, scores) as BatchKNN.search. If the probed lists hold fewer than k vectors, the id list is
+                shorter and the missing scores are -inf.
+        """
+        queries = normalize_rows(queries)
+        if not len(queries):
+            return [], np.empty((0, k), dtype=np.float32)
+        if not self.trained or not len(self):
+            return [[] for _ in range(len(queries))], np.empty((len(queries), 0), dtype=np.float32)
+        n_probe = min(n_probe or self.n_probe, self.n_lists)
+        probes, _ = top_k(queries @ self.centroids.T, n_probe)
+        all_ids, all_scores = [], []
+        for query, lists in zip(queries, probes):
+            members = [self.lists[list_number] for list_number in lists if self.lists[list_number][1]]
+            rows = np.concatenate([rows[:size] for rows, size in members]) if members else np.empty(0, dtype=np.int64)
+            scores = self.row_vectors(rows) @ query if len(rows) else np.empty(0, dtype=np.float32)
+            columns, best = top_k(scores[None, :], k)
+            all_ids.append([self.row_id(row) for row in rows[columns[0]]])
+            all_scores.append(best[0])
+        padded = np.full((len(queries), max(len(scores) for scores in all_scores)), -np.inf, dtype=np.float32)
+        for i, scores in enumerate(all_scores):
+            padded[i, :len(scores)] = scores
+        return all_ids, padded
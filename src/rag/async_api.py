@@ -0,0 +1,128 @@
+import asyncio
+import queue
+import threading
+import time
+from rag.retrieval_cache import StageTimer, format_stage_timings
+
+
+class AsyncRAG:
+    """ Streaming asyncio front for a RAG chain (anything with astream(question), e.g. setup_chain's LCEL chain).
+
+    Any number of questions may be in progress; at most max_concurrency of them retrieve and generate at the
+    same time, the others wait their turn, which keeps the local Ollama server from being flooded with parallel
+    generations it would only serve more slowly. Each request fills a timings dict: queued (waiting for a slot),
+    first_token, total, generate, plus expand/retrieve when the retriever records them in the StageTimer.
+    """
+
+    def __init__(self, chain, max_concurrency=2):
+        """ Args:
+            chain: Runnable with astream(question) yielding answer text.
+            max_concurrency (int): Requests allowed to run at once; match it to OLLAMA_NUM_PARALLEL.
+        """
+        self.chain = chain
+        self.max_concurrency = max_concurrency
+        self.semaphores = {}  # Event loop -> semaphore, so one instance can serve several loops
+        self.metrics = {'requests': 0, 'completed': 0, 'failed': 0, 'waiting': 0, 'in_flight': 0}
+
+    def semaphore(self):
+        loop = asyncio.get_running_loop()
+        if loop not in self.semaphores:
+            self.semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return self.semaphores[loop]
+
+    async def astream(self, question, timings=None):
+        """ Yield the answer to a question token by token.
+        Args:
+            question (str): The question.
+            timings (dict, optional): Filled with the latency breakdown of the request.
+        """
+        timings = StageTimer.start(timings)
+        started = time.perf_counter()
+        self.metrics['requests'] += 1
+        self.metrics['waiting'] += 1
+        try:
+            async with self.semaphore():
+                self.metrics['waiting'] -= 1
+                self.metrics['in_flight'] += 1
+                timings['queued'] = time.perf_counter() - started
+                try:
+                    async for token in self.chain.astream(question):
+                        if 'first_token' not in timings:
+                            timings['first_token'] = time.perf_counter() - started
+                        yield token
+                finally:
+                    self.metrics['in_flight'] -= 1
+        except BaseException:
+            self.metrics['failed'] += 1
+            raise
+        finally:
+            if timings.get('queued') is None:
+                self.metrics['waiting'] -= 1  # Cancelled while waiting for a slot
+                timings['queued'] = time.perf_counter() - started
+        self.metrics['completed'] += 1
+        timings['total'] = time.perf_counter() - started
+        timings['generate'] = timings['total'] - timings['queued'] - timings.get('expand', 0.0) - timings.get('retrieve', 0.0)
+
+    async def ask(self, question):
+        """ The full answer and its timings. """
+        timings = {}
+        answer = ''.join([token async for token in self.astream(question, timings)])
+        return answer, timings
+
+
+class RAGService:
+    """ Runs an AsyncRAG on a background event loop so synchronous callers (the Streamlit app, the CLI) can
+    stream answers and share one concurrency limit, e.g. st.write_stream(service.stream(question)).
+    """
+
+    def __init__(self, rag):
+        self.rag = rag
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def stream(self, question, timings=None):
+        """ Synchronous generator of answer tokens. Closing it early cancels the request. """
+        tokens = queue.Queue()
+        done = object()
+
+        async def pump():
+            try:
+                async for token in self.rag.astream(question, timings):
+                    tokens.put(token)
+            except Exception as exc:
+                tokens.put(exc)
+            finally:
+                tokens.put(done)
+
+        future = asyncio.run_coroutine_threadsafe(pump(), self.loop)
+        try:
+            while True:
+                token = tokens.get()
+                if token is done:
+                    break
+                if isinstance(token, Exception):
+                    raise token
+                yield token
+        finally:
+            future.cancel()
+
+    def ask(self, question):
+        """ Blocking full answer and timings. """
+        return asyncio.run_coroutine_threadsafe(self.rag.ask(question), self.loop).result()
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+
+def format_timings(timings):
+    """ One line of request latencies: queue wait, time to first token, stages and total. """
+    fields = [f"queued {timings.get('queued', 0.0):.2f}s"]
+    if 'first_token' in timings:
+        fields.append(f"first token {timings['first_token']:.2f}s")
+    stages = format_stage_timings(timings)
+    if stages:
+        fields.append(stages)
+    fields.append(f"total {timings.get('total', 0.0):.2f}s")
+    return ", ".join(fields)
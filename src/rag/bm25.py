@@ -0,0 +1,217 @@
+import json
+import math
+import os
+import re
+import numpy as np
+from rag.knn import top_k
+
+TOKEN = re.compile(r"[a-z0-9]+(?:[-._/][a-z0-9]+)*")
+JOINERS = re.compile(r"[-._/]")
+
+
+def tokenize(text):
+    """ Lowercased terms that keep device names and codes intact: "E-42" gives e-42, e42 and 42, "Hue bridge
+    v2" gives hue, bridge and v2, so both exact codes and their loose spellings match.
+    """
+    tokens = []
+    for token in TOKEN.findall(text.lower()):
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.append(JOINERS.sub('', token))
+            tokens.extend(part for part in JOINERS.split(token) if len(part) > 1)
+    return tokens
+
+
+class BM25Index:
+    """ In-process BM25 inverted index with compact postings.
+
+    Postings are kept in CSR form: for term t, doc numbers docs[offsets[t]:offsets[t + 1]] (uint32, ascending)
+    with term frequencies in tfs (uint16), about 6 bytes per posting, next to a uint32 array of document lengths.
+    A query scores each of its terms with one vectorized pass over that term's postings. New documents are
+    collected in a small pending table and merged into the arrays on the next search or save. Deletion
+    tombstones the document; re-adding an id replaces it.
+    """
+
+    def __init__(self, k1=1.2, b=0.75):
+        """ Args:
+            k1 (float): Term frequency saturation.
+            b (float): Document length normalization.
+        """
+        self.k1 = k1
+        self.b = b
+        self.ids = []
+        self.doc_of = {}  # Id -> live doc number
+        self.terms = {}  # Term -> row in offsets
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.docs = np.empty(0, dtype=np.uint32)
+        self.tfs = np.empty(0, dtype=np.uint16)
+        self.lengths = np.empty(0, dtype=np.uint32)
+        self.deleted = np.empty(0, dtype=bool)
+        self.pending = {}  # Term -> [(doc, tf)] not merged yet
+        self.pending_lengths = []
+
+    def __len__(self):
+        return len(self.doc_of)
+
+    def add(self, ids, texts):
+        """ Index texts under the given ids. """
+        for chunk_id, text in zip(ids, texts):
+            self.delete([chunk_id])
+            doc = len(self.ids)
+            self.ids.append(chunk_id)
+            self.doc_of[chunk_id] = doc
+            counts = {}
+            tokens = tokenize(text)
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for term, tf in counts.items():
+                self.pending.setdefault(term, []).append((doc, min(tf, 65535)))
+            self.pending_lengths.append(len(tokens))
+
+    def delete(self, ids):
+        """ Tombstone the documents of the given ids. """
+        for chunk_id in ids:
+            doc = self.doc_of.pop(chunk_id, None)
+            if doc is None:
+                continue
+            if doc < len(self.deleted):
+                self.deleted[doc] = True
+            else:
+                self.pending_lengths[doc - len(self.deleted)] = -1  # Marked when merged
+
+    def merge(self):
+        """ Fold pending documents into the postings arrays. """
+        if not self.pending_lengths:
+            return
+        pending_lengths = np.asarray(self.pending_lengths, dtype=np.int64)
+        all_terms = list(self.terms) + [term for term in self.pending if term not in self.terms]
+        docs, tfs, offsets = [], [], [0]
+        for term in all_terms:
+            count = 0
+            row = self.terms.get(term)
+            if row is not None:
+                docs.append(self.docs[self.offsets[row]:self.offsets[row + 1]])
+                tfs.append(self.tfs[self.offsets[row]:self.offsets[row + 1]])
+                count += len(docs[-1])
+            added = self.pending.get(term)
+            if added:
+                docs.append(np.fromiter((doc for doc, _ in added), dtype=np.uint32, count=len(added)))
+                tfs.append(np.fromiter((tf for _, tf in added), dtype=np.uint16, count=len(added)))
+                count += len(added)
+            offsets.append(offsets[-1] + count)
+        self.docs = np.concatenate(docs) if docs else np.empty(0, dtype=np.uint32)
+        self.tfs = np.concatenate(tfs) if tfs else np.empty(0, dtype=np.uint16)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.terms = {term: row for row, term in enumerate(all_terms)}
+        self.lengths = np.concatenate([self.lengths, np.maximum(pending_lengths, 0).astype(np.uint32)])
+        self.deleted = np.concatenate([self.deleted, pending_lengths < 0])
+        self.pending = {}
+        self.pending_lengths = []
+
+    def search(self, query, k=10):
+        """ Top-k documents for a query.
+        Args:
+            query (str): Query text.
+            k (int): Results to return.
+        Returns:
+            list: (id, score) pairs, best first. Only documents sharing a term with the query are returned.
+        """
+        self.merge()
+        if not len(self):
+            return []
+        live_lengths = self.lengths[~self.deleted]
+        average_length = max(float(live_lengths.mean()), 1.0)
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        for term in set(tokenize(query)):
+            row = self.terms.get(term)
+            if row is None:
+                continue
+            docs = self.docs[self.offsets[row]:self.offsets[row + 1]]
+            tfs = self.tfs[self.offsets[row]:self.offsets[row + 1]].astype(np.float32)
+            document_frequency = len(docs)
+            idf = math.log(1 + (len(self) - document_frequency + 0.5) / (document_frequency + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * self.lengths[docs] / average_length)
+            scores[docs] += idf * tfs * (self.k1 + 1) / (tfs + norm)
+        scores[self.deleted] = 0
+        hits = np.flatnonzero(scores)
+        if not len(hits):
+            return []
+        columns, best = top_k(scores[hits][None, :], k)
+        return [(self.ids[doc], float(score)) for doc, score in zip(hits[columns[0]], best[0])]
+
+    def stats(self):
+        """ Documents, terms, postings and bytes held by the arrays. """
+        self.merge()
+        arrays = (self.offsets, self.docs, self.tfs, self.lengths, self.deleted)
+        return {'documents': len(self), 'terms': len(self.terms), 'postings': len(self.docs),
+                'bytes': sum(array.nbytes for array in arrays)}
+
+    def save(self, path):
+        """ Write the index to an .npz file atomically. """
+        self.merge()
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as file:
+            np.savez(file, offsets=self.offsets, docs=self.docs, tfs=self.tfs, lengths=self.lengths,
+                     deleted=self.deleted, header=np.frombuffer(json.dumps({
+                         'k1': self.k1, 'b': self.b, 'ids': self.ids, 'terms': list(self.terms),
+                     }).encode(), dtype=np.uint8))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """ Read an index written by save(). """
+        with np.load(path) as data:
+            header = json.loads(data['header'].tobytes())
+            index = cls(k1=header['k1'], b=header['b'])
+            index.offsets, index.docs, index.tfs = data['offsets'], data['docs'], data['tfs']
+            index.lengths, index.deleted = data['lengths'], data['deleted']
+        index.ids = header['ids']
+        index.terms = {term: row for row, term in enumerate(header['terms'])}
+        index.doc_of = {chunk_id: doc for doc, chunk_id in enumerate(index.ids) if not index.deleted[doc]}
+        return index
+
+
+def reciprocal_rank_fusion(rankings, k=60, weights=None):
+    """ Fuse ranked id lists: every list adds weight / (k + rank) to each id it contains.
+    Args:
+        rankings (list): Lists of ids, best first.
+        k (int): Damping constant; larger values flatten the difference between top ranks.
+        weights (list, optional): Weight per ranking, 1.0 each by default.
+    Returns:
+        list: (id, fused score) pairs, best first.
+    """
+    fused = {}
+    for ranking, weight in zip(rankings, weights or [1.0] * len(rankings)):
+        for rank, chunk_id in enumerate(ranking, start=1):
+            fused[chunk_id] = fused.get(chunk_id, 0.0) + weight / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+
+class HybridSearch:
+    """ Lexical plus vector retrieval in one call: BM25 and embedding search each return their candidates and
+    reciprocal rank fusion merges the two lists. Exact codes and device names come in through BM25, paraphrases
+    through the vectors, without generating extra queries with the LLM.
+    """
+
+    def __init__(self, bm25, vector_search, embed_fn, candidates=50, rrf_k=60, weights=(1.0, 1.0)):
+        """ Args:
+            bm25 (BM25Index): The lexical index.
+            vector_search (callable): vector_search(query_matrix, k) -> (ids, scores), e.g. MmapEmbeddingStore.search.
+            embed_fn (callable): embed_fn(text) -> query vector.
+            candidates (int): Candidates taken from each side before fusion.
+            rrf_k (int): Reciprocal rank fusion constant.
+            weights (tuple): (lexical, vector) weights.
+        """
+        self.bm25 = bm25
+        self.vector_search = vector_search
+        self.embed_fn = embed_fn
+        self.candidates = candidates
+        self.rrf_k = rrf_k
+        self.weights = weights
+
+    def search(self, query, k=5, query_vector=None):
+        """ Fused top-k (id, score) pairs for a query. query_vector skips embedding the query again. """
+        lexical = [chunk_id for chunk_id, _ in self.bm25.search(query, self.candidates)]
+        vector = query_vector if query_vector is not None else self.embed_fn(query)
+        semantic = self.vector_search(np.asarray(vector, dtype=np.float32)[None, :], self.candidates)[0][0]
+        return reciprocal_rank_fusion([lexical, semantic], k=self.rrf_k, weights=list(self.weights))[:k]
@@ -0,0 +1,180 @@
+import asyncio
+import itertools
+import os
+import random
+import time
+import httpx
+
+DEFAULT_HOST = os.environ.get('OLLAMA_HOST', 'http://localhost:11434')
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class EmbeddingError(Exception):
+    """ A batch that still failed after all retries. """
+
+
+class OllamaBatchEmbedder:
+    """ Embeds a list of texts per request through /api/embed, falling back to concurrent /api/embeddings calls
+    on servers that predate the batch endpoint. One pooled httpx.AsyncClient serves all requests.
+    """
+
+    def __init__(self, model='mxbai-embed-large', host=DEFAULT_HOST, timeout=120.0):
+        self.model = model
+        self.host = host if '://' in host else f'http://{host}'
+        self.timeout = timeout
+        self.client = None
+        self.batch_endpoint = True
+
+    async def __call__(self, texts):
+        if self.client is None:
+            self.client = httpx.AsyncClient(base_url=self.host, timeout=self.timeout)
+        if self.batch_endpoint:
+            response = await self.client.post('/api/embed', json={'model': self.model, 'input': texts})
+            if response.status_code != 404:
+                response.raise_for_status()
+                return response.json()['embeddings']
+            self.batch_endpoint = False
+        responses = await asyncio.gather(*(
+            self.client.post('/api/embeddings', json={'model': self.model, 'prompt': text}) for text in texts
+        ))
+        for response in responses:
+            response.raise_for_status()
+        return [response.json()['embedding'] for response in responses]
+
+    async def aclose(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+
+class EmbeddingPipeline:
+    """ Batched, concurrent embedding stage for ingestion.
+
+    Items are grouped into batches of batch_size; at most max_concurrency batches are in flight against the
+    server. Failed batches are retried with exponential backoff and jitter. Each finished batch is handed to the
+    sink as soon as it completes (in a worker thread, so writing to the store overlaps with embedding), so memory
+    holds only the in-flight batches.
+    """
+
+    def __init__(self, model='mxbai-embed-large', batch_size=16, max_concurrency=4, max_retries=3, backoff=0.5,
+                 embed_batch=None):
+        """ Args:
+            model (str): Ollama embedding model.
+            batch_size (int): Texts per request.
+            max_concurrency (int): Requests in flight at once.
+            max_retries (int): Retries per batch before it is reported as failed.
+            backoff (float): Base delay in seconds, doubled on every retry.
+            embed_batch (callable, optional): async embed_batch(texts) -> vectors. Defaults to OllamaBatchEmbedder.
+        """
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.embed_batch = embed_batch or OllamaBatchEmbedder(model)
+
+    async def embed_with_retry(self, texts, stats):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await self.embed_batch(texts)
+            except (httpx.TransportError, httpx.HTTPStatusError) as exc:
+                retryable = not isinstance(exc, httpx.HTTPStatusError) or exc.response.status_code in RETRY_STATUS
+                if not retryable or attempt == self.max_retries:
+                    raise EmbeddingError(f"Embedding batch of {len(texts)} failed: {exc}") from exc
+                stats['retries'] += 1
+                await asyncio.sleep(self.backoff * 2 ** attempt * (0.5 + random.random()))
+
+    def next_batch(self, iterator):
+        return list(itertools.islice(iterator, self.batch_size))
+
+    async def run(self, items, sink):
+        """ Embed items and stream the results into sink.
+        Args:
+            items (iterable): (id, text, metadata) tuples. May be a generator: it is consumed lazily, one batch at
+                a time from a worker thread, so it may block (e.g. on parsing) without stalling requests in flight.
+            sink (callable): sink(ids, texts, metadatas, vectors), called once per finished batch.
+        Returns:
+            dict: chunks, batches, retries, failed_batches, seconds and chunks_per_second.
+        """
+        stats = {'chunks': 0, 'batches': 0, 'retries': 0, 'failed_batches': 0}
+        started = time.perf_counter()
+        slots = asyncio.Semaphore(self.max_concurrency)
+        done = asyncio.Queue()
+
+        async def embed(batch):
+            try:
+                vectors = await self.embed_with_retry([text for _, text, _ in batch], stats)
+                await done.put((batch, vectors))
+            except EmbeddingError as exc:
+                print(exc)
+                await done.put((batch, None))
+            finally:
+                slots.release()
+
+        async def produce():
+            tasks = []
+            iterator = iter(items)
+            try:
+                while True:
+                    await slots.acquire()
+                    batch = await asyncio.to_thread(self.next_batch, iterator)
+                    if not batch:
+                        slots.release()
+                        break
+                    tasks.append(asyncio.ensure_future(embed(batch)))
+                await asyncio.gather(*tasks)
+            except BaseException:
+                for task in tasks:
+                    task.cancel()
+                raise
+            finally:
+                done.put_nowait(None)  # Ends the consumer loop, which then re-raises through await producer
+
+        producer = asyncio.ensure_future(produce())
+        try:
+            while True:
+                finished = await done.get()
+                if finished is None:
+                    break
+                batch, vectors = finished
+                if vectors is None:
+                    stats['failed_batches'] += 1
+                    continue
+                ids, texts, metadatas = (list(column) for column in zip(*batch))
+                await asyncio.to_thread(sink, ids, texts, metadatas, vectors)
+                stats['chunks'] += len(batch)
+                stats['batches'] += 1
+            await producer
+        finally:
+            producer.cancel()
+            if hasattr(self.embed_batch, 'aclose'):
+                await self.embed_batch.aclose()
+        stats['seconds'] = time.perf_counter() - started
+        stats['chunks_per_second'] = stats['chunks'] / stats['seconds'] if stats['seconds'] else 0.0
+        return stats
+
+    def run_sync(self, items, sink):
+        """ run() for synchronous callers. """
+        return asyncio.run(self.run(items, sink))
+
+    def embed_texts(self, texts):
+        """ Embed a list of texts, returning the vectors in input order. """
+        vectors = [None] * len(texts)
+
+        def collect(ids, _texts, _metadatas, batch_vectors):
+            for index, vector in zip(ids, batch_vectors):
+                vectors[index] = vector
+
+        stats = self.run_sync(((i, text, None) for i, text in enumerate(texts)), collect)
+        if stats['failed_batches']:
+            raise EmbeddingError(f"{stats['failed_batches']} batch(es) failed")
+        return vectors
+
+
+def format_stats(stats):
+    """ One-line summary of run() stats. """
+    line = "{chunks} chunks in {seconds:.1f}s ({chunks_per_second:.1f} chunks/s, {batches} batches".format(**stats)
+    if stats['retries']:
+        line += ", {} retries".format(stats['retries'])
+    if stats['failed_batches']:
+        line += ", {} failed".format(stats['failed_batches'])
+    return line + ")"
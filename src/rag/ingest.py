@@ -0,0 +1,137 @@
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+
+def find_pdfs(directory):
+    """ PDF files below a directory, sorted by path. """
+    found = []
+    for root, _, files in os.walk(directory):
+        found.extend(os.path.join(root, name) for name in files if name.lower().endswith('.pdf'))
+    return sorted(found)
+
+
+def count_pages(path):
+    from pdfminer.pdfpage import PDFPage
+    with open(path, 'rb') as file:
+        return sum(1 for _ in PDFPage.get_pages(file))
+
+
+def parse_pages(path, start, stop):
+    """ Text of pages start..stop-1 of a PDF as (page_number, text) pairs. Runs in a worker process. """
+    from pdfminer.high_level import extract_pages
+    from pdfminer.layout import LTTextContainer
+    pages = []
+    for number, layout in zip(range(start, stop), extract_pages(path, page_numbers=range(start, stop))):
+        pages.append((number, ''.join(element.get_text() for element in layout if isinstance(element, LTTextContainer))))
+    return pages
+
+
+class PDFIngestor:
+    """ Streams the pages of many PDFs, parsed in a process pool.
+
+    Every file is cut into tasks of pages_per_task pages. At most window tasks are submitted at a time and a new
+    one is only submitted when the consumer has taken the pages of a finished one, so memory stays bounded no
+    matter how large the corpus is and a slow consumer (the embedding stage) slows parsing down rather than
+    letting pages pile up. Pages are yielded as their task finishes, not in document order.
+
+    A file that cannot be opened or parsed is recorded in stats['errors'] and skipped; the run goes on.
+    """
+
+    def __init__(self, workers=None, window=None, pages_per_task=4, parse_fn=parse_pages, count_fn=count_pages):
+        """ Args:
+            workers (int, optional): Worker processes, os.cpu_count() by default. 0 parses in this process.
+            window (int, optional): Tasks in flight, twice the workers by default.
+            pages_per_task (int): Pages parsed per task.
+            parse_fn (callable): parse_fn(path, start, stop) -> [(page_number, text)]. Must be picklable.
+            count_fn (callable): count_fn(path) -> number of pages.
+        """
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.window = window or max(1, 2 * self.workers)
+        self.pages_per_task = pages_per_task
+        self.parse_fn = parse_fn
+        self.count_fn = count_fn
+        self.stats = None
+
+    def tasks(self, paths):
+        for path in paths:
+            self.stats['files'] += 1
+            try:
+                count = self.count_fn(path)
+            except Exception as exc:
+                self.fail(path, exc)
+                continue
+            for start in range(0, count, self.pages_per_task):
+                yield path, start, min(start + self.pages_per_task, count)
+
+    def fail(self, path, exc):
+        if path not in self.stats['errors']:
+            self.stats['errors'][path] = f"{type(exc).__name__}: {exc}"
+            print(f"Skipping {path}: {self.stats['errors'][path]}")
+
+    def pages(self, paths):
+        """ Yield (path, page_number, text) for every page of every file. Pages of a file that fails part-way
+        may already have been yielded; check stats['errors'] once the generator is exhausted.
+        Args:
+            paths (list): PDF paths.
+        """
+        self.stats = {'files': 0, 'pages': 0, 'errors': {}, 'started': time.perf_counter()}
+        if not self.workers:
+            for path, start, stop in self.tasks(paths):
+                if path in self.stats['errors']:
+                    continue
+                try:
+                    pages = self.parse_fn(path, start, stop)
+                except Exception as exc:
+                    self.fail(path, exc)
+                    continue
+                yield from self.take(path, pages)
+            return
+        tasks = self.tasks(paths)
+        executor = ProcessPoolExecutor(max_workers=self.workers)
+        in_flight = {}
+        try:
+            while True:
+                while len(in_flight) < self.window:
+                    task = next(tasks, None)
+                    if task is None:
+                        break
+                    in_flight[executor.submit(self.parse_fn, *task)] = task[0]
+                if not in_flight:
+                    break
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    path = in_flight.pop(future)
+                    try:
+                        pages = future.result()
+                    except Exception as exc:
+                        self.fail(path, exc)
+                        continue
+                    if path not in self.stats['errors']:
+                        yield from self.take(path, pages)
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def take(self, path, pages):
+        for page_number, text in pages:
+            self.stats['pages'] += 1
+            yield path, page_number, text
+
+    def report(self):
+        """ files, failed, pages, seconds and pages_per_second of the current or latest run. """
+        seconds = time.perf_counter() - self.stats['started']
+        return {
+            'files': self.stats['files'] - len(self.stats['errors']),
+            'failed': len(self.stats['errors']),
+            'pages': self.stats['pages'],
+            'seconds': seconds,
+            'pages_per_second': self.stats['pages'] / seconds if seconds else 0.0,
+        }
+
+
+def format_report(report):
+    """ One-line summary of PDFIngestor.report(). """
+    line = "{pages} pages from {files} files in {seconds:.1f}s ({pages_per_second:.1f} pages/s".format(**report)
+    if report['failed']:
+        line += ", {} failed".format(report['failed'])
+    return line + ")"
@@ -0,0 +1,123 @@
+import numpy as np
+
+
+def normalize_rows(matrix):
+    """ float32 copy of matrix with unit-length rows (zero rows stay zero). """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix[None, :]
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def top_k(scores, k):
+    """ Column indices and values of the k largest scores in every row, best first. """
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return np.empty((scores.shape[0], 0), dtype=np.int64), np.empty((scores.shape[0], 0), dtype=scores.dtype)
+    if k < scores.shape[1]:
+        indices = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        indices = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+    values = np.take_along_axis(scores, indices, axis=1)
+    order = np.argsort(-values, axis=1, kind='stable')
+    return np.take_along_axis(indices, order, axis=1), np.take_along_axis(values, order, axis=1)
+
+
+def matches(metadata, where):
+    """ Chroma-style equality filter: every key in where must have that value (or one of a list of values). """
+    if metadata is None:
+        return False
+    for key, wanted in where.items():
+        value = metadata.get(key)
+        if isinstance(wanted, (list, tuple, set)):
+            if value not in wanted:
+                return False
+        elif value != wanted:
+            return False
+    return True
+
+
+class BatchKNN:
+    """ Exact cosine top-k for a whole batch of queries at once.
+
+    The corpus is an (M, d) matrix of unit-length rows. A search normalizes the (N, d) query matrix and scores it
+    against the corpus with one matrix multiply per block of block_size corpus rows (a single one unless the
+    corpus is larger), merging the per-block top-k. The matrix may be float32, float16 or int8 with per-row
+    scales, including a read-only memmap, so a compact on-disk store can be searched without copying it.
+    """
+
+    def __init__(self, ids=None, vectors=None, metadatas=None, normalized=False, scales=None, block_size=65536):
+        """ Args:
+            ids (list, optional): Row ids.
+            vectors (array-like, optional): (M, d) corpus vectors.
+            metadatas (list, optional): One metadata dict (or None) per row, for pre-filtering.
+            normalized (bool): The rows are already unit length; use vectors as they are, without a copy.
+            scales (array-like, optional): Per-row dequantization scale of an int8 matrix.
+            block_size (int): Corpus rows scored per matrix multiply.
+        """
+        self.ids = list(ids or [])
+        if vectors is None:
+            self.matrix = None
+        else:
+            self.matrix = vectors if normalized else normalize_rows(vectors)
+        self.metadatas = list(metadatas) if metadatas is not None else [None] * len(self.ids)
+        self.scales = scales
+        self.block_size = block_size
+
+    @classmethod
+    def from_collection(cls, vector_db, **kwargs):
+        """ Load the vectors, ids and metadata of a langchain Chroma store into memory. """
+        data = vector_db.get(include=['embeddings', 'metadatas'])
+        return cls(data['ids'], np.asarray(data['embeddings'], dtype=np.float32), data['metadatas'], **kwargs)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, ids, vectors, metadatas=None):
+        """ Append rows to an in-memory float32 index. """
+        rows = normalize_rows(vectors)
+        self.matrix = rows if self.matrix is None else np.concatenate([np.asarray(self.matrix, dtype=np.float32), rows])
+        self.ids.extend(ids)
+        self.metadatas.extend(metadatas if metadatas is not None else [None] * len(ids))
+
+    def candidates(self, where):
+        """ Row numbers passing the pre-filter: a dict for equality matching or a callable on the metadata. """
+        test = where if callable(where) else (lambda metadata: matches(metadata, where))
+        return np.fromiter((i for i, metadata in enumerate(self.metadatas) if test(metadata)), dtype=np.int64)
+
+    def score_block(self, queries, rows):
+        block = np.asarray(self.matrix[rows], dtype=np.float32)
+        scores = queries @ block.T
+        if self.scales is not None:
+            scores *= np.asarray(self.scales[rows], dtype=np.float32)
+        return scores
+
+    def search(self, queries, k=5, where=None):
+        """ Top-k rows for every query.
+        Args:
+            queries (array-like): (N, d) query matrix, or a single (d,) vector.
+            k (int): Results per query.
+            where (dict or callable, optional): Metadata pre-filter; only matching rows are scored.
+        Returns:
+            tuple: (ids, scores), a list of N id lists and an (N, k) array of cosine scores, best first.
+                Fewer than k columns when fewer rows pass the filter.
+        """
+        queries = normalize_rows(queries)
+        if self.matrix is None or not len(self.ids):
+            return [[] for _ in range(len(queries))], np.empty((len(queries), 0), dtype=np.float32)
+        rows = self.candidates(where) if where is not None else None
+        total = len(rows) if rows is not None else len(self.ids)
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        for start in range(0, total, self.block_size):
+            stop = min(start + self.block_size, total)
+            block_rows = rows[start:stop] if rows is not None else slice(start, stop)
+            block_index = rows[start:stop] if rows is not None else np.arange(start, stop)
+            columns, scores = top_k(self.score_block(queries, block_rows), k)
+            best_rows = np.concatenate([best_rows, block_index[columns]], axis=1)
+            best_scores = np.concatenate([best_scores, scores], axis=1)
+            if best_rows.shape[1] > k:
+                columns, best_scores = top_k(best_scores, k)
+                best_rows = np.take_along_axis(best_rows, columns, axis=1)
+        return [[self.ids[row] for row in query_rows] for query_rows in best_rows], best_scores
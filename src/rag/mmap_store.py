@@ -0,0 +1,230 @@
+import json
+import os
+import sqlite3
+import threading
+import numpy as np
+from rag.knn import BatchKNN, normalize_rows
+
+DTYPES = {'float16': np.float16, 'int8': np.int8}
+
+
+class RowIds:
+    """ Read-only sequence view of the ids of a store, fetched from SQLite on access. """
+
+    def __init__(self, store):
+        self.store = store
+
+    def __len__(self):
+        return len(self.store)
+
+    def __getitem__(self, row):
+        return self.store.id_of(int(row))
+
+
+class MmapEmbeddingStore:
+    """ Append-only embedding store backed by a memory-mapped file.
+
+    Vectors are normalized and written as contiguous float16 rows (2 bytes per dimension) or int8 rows with a
+    per-row float32 scale (1 byte per dimension), in one flat file per store. Ids and metadata live in a SQLite
+    table keyed by row number. Opening a store only maps the file and reads a small header, so startup time does
+    not depend on the corpus size, and store.vectors[a:b] is a zero-copy view for search.
+
+    Appends write the vectors, then the rows, then bump the row count in the header; rows past the count left by
+    an interrupted append are ignored and overwritten. Deletion only tombstones rows, which search then skips.
+    One writer per store is assumed.
+    """
+
+    def __init__(self, directory, dim=None, dtype='float16'):
+        """ Args:
+            directory (str): Where the store lives; created on first use.
+            dim (int, optional): Vector dimension. Taken from the header of an existing store or the first append.
+            dtype (str): 'float16' or 'int8', for new stores.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.header_path = os.path.join(directory, 'header.json')
+        self.header = {'dim': dim, 'dtype': dtype, 'count': 0, 'deleted': 0}
+        if os.path.exists(self.header_path):
+            with open(self.header_path, 'r') as file:
+                self.header = json.load(file)
+        if self.header['dtype'] not in DTYPES:
+            raise ValueError(f"Unsupported dtype {self.header['dtype']!r}, expected one of {sorted(DTYPES)}")
+        self.vectors_path = os.path.join(directory, f"vectors.{self.header['dtype']}")
+        self.scales_path = os.path.join(directory, 'scales.float32')
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(directory, 'rows.sqlite3'), check_same_thread=False)
+        with self.conn:
+            self.conn.execute(
+                """CREATE TABLE IF NOT EXISTS rows (
+                    row INTEGER PRIMARY KEY,
+                    id TEXT NOT NULL,
+                    metadata TEXT,
+                    deleted INTEGER NOT NULL DEFAULT 0
+                )"""
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS rows_id ON rows (id)")
+        self._vectors = None
+        self._scales = None
+
+    def __len__(self):
+        return self.header['count']
+
+    @property
+    def dim(self):
+        return self.header['dim']
+
+    @property
+    def quantized(self):
+        return self.header['dtype'] == 'int8'
+
+    @property
+    def vectors(self):
+        """ Read-only (count, dim) memmap of the stored rows, as written (float16 or int8). """
+        if self._vectors is None:
+            self._vectors = self.map(self.vectors_path, DTYPES[self.header['dtype']], (len(self), self.dim))
+        return self._vectors
+
+    @property
+    def scales(self):
+        """ Per-row dequantization scales of an int8 store, None for float16. """
+        if self.quantized and self._scales is None:
+            self._scales = self.map(self.scales_path, np.float32, (len(self),))
+        return self._scales
+
+    def map(self, path, dtype, shape):
+        if not shape[0]:
+            return np.empty((0,) + shape[1:], dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode='r', shape=shape)
+
+    def encode(self, vectors):
+        rows = normalize_rows(vectors)
+        if rows.shape[1] != self.dim:
+            raise ValueError(f"Expected vectors of dimension {self.dim}, got {rows.shape[1]}")
+        if not self.quantized:
+            return rows.astype(np.float16), None
+        scales = np.maximum(np.abs(rows).max(axis=1), 1e-12) / 127.0
+        return np.round(rows / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+    def append(self, ids, vectors, metadatas=None):
+        """ Add vectors under the given ids.
+        Args:
+            ids (list): One id per vector. Re-adding an id tombstones its previous row.
+            vectors (array-like): (n, dim) vectors; normalized before storing.
+            metadatas (list, optional): One JSON-serializable dict (or None) per vector.
+        """
+        if not len(ids):
+            return
+        if self.dim is None:
+            self.header['dim'] = int(np.asarray(vectors[0]).shape[-1])
+        rows, scales = self.encode(vectors)
+        metadatas = metadatas if metadatas is not None else [None] * len(ids)
+        with self.lock:
+            start = len(self)
+            self.write_at(self.vectors_path, rows, start * self.dim * rows.itemsize)
+            if scales is not None:
+                self.write_at(self.scales_path, scales, start * scales.itemsize)
+            with self.conn:
+                self.tombstone(ids)
+                self.conn.execute("DELETE FROM rows WHERE row >= ?", (start,))  # Leftovers of an interrupted append
+                self.conn.executemany(
+                    "INSERT INTO rows (row, id, metadata) VALUES (?, ?, ?)",
+                    [(start + i, chunk_id, json.dumps(metadata) if metadata is not None else None)
+                     for i, (chunk_id, metadata) in enumerate(zip(ids, metadatas))],
+                )
+            self.header['count'] = start + len(ids)
+            self.save_header()
+            self._vectors = self._scales = None  # Remapped on next access
+
+    def write_at(self, path, array, offset):
+        with open(path, 'r+b' if os.path.exists(path) else 'wb') as file:
+            file.truncate(offset)
+            file.seek(offset)
+            file.write(np.ascontiguousarray(array).tobytes())
+            file.flush()
+            os.fsync(file.fileno())
+
+    def save_header(self):
+        tmp_path = self.header_path + '.tmp'
+        with open(tmp_path, 'w') as file:
+            json.dump(self.header, file)
+        os.replace(tmp_path, self.header_path)
+
+    def tombstone(self, ids):
+        cursor = self.conn.executemany("UPDATE rows SET deleted = 1 WHERE id = ? AND deleted = 0", [(i,) for i in ids])
+        self.header['deleted'] += max(cursor.rowcount, 0)
+
+    def delete(self, ids):
+        """ Tombstone the rows of the given ids. Their space is not reclaimed. """
+        with self.lock:
+            with self.conn:
+                self.tombstone(ids)
+            self.save_header()
+
+    def id_of(self, row):
+        found = self.conn.execute("SELECT id FROM rows WHERE row = ?", (row,)).fetchone()
+        return found[0] if found else None
+
+    def rows_of(self, ids):
+        """ Live row numbers of the given ids, in the order given (missing ids are skipped). """
+        found = dict(self.conn.execute(
+            f"SELECT id, row FROM rows WHERE deleted = 0 AND id IN ({','.join('?' * len(ids))})", list(ids)
+        ).fetchall()) if ids else {}
+        return [found[chunk_id] for chunk_id in ids if chunk_id in found]
+
+    def get(self, ids):
+        """ Dequantized float32 vectors of the given ids, one row per id found. """
+        return self.get_rows(np.asarray(self.rows_of(ids), dtype=np.int64))
+
+    def get_rows(self, rows):
+        """ Dequantized float32 vectors of the given row numbers. """
+        vectors = np.asarray(self.vectors[rows], dtype=np.float32)
+        return vectors * self.scales[rows][:, None] if self.quantized else vectors
+
+    def live_ids(self):
+        """ (row numbers, ids) of every live row, in row order. """
+        found = self.conn.execute("SELECT row, id FROM rows WHERE deleted = 0 AND row < ? ORDER BY row", (len(self),)).fetchall()
+        return np.fromiter((row for row, _ in found), dtype=np.int64, count=len(found)), [chunk_id for _, chunk_id in found]
+
+    def live_rows(self, where=None):
+        """ Row numbers that are not deleted and, if where is given, match the metadata filter.
+        where is a dict of metadata equalities (a list value matches any of its items) or a callable on the metadata dict.
+        """
+        query, params = "SELECT row, metadata FROM rows WHERE deleted = 0 AND row < ?", [len(self)]
+        if isinstance(where, dict):
+            for key, wanted in where.items():
+                values = list(wanted) if isinstance(wanted, (list, tuple, set)) else [wanted]
+                query += f" AND json_extract(metadata, ?) IN ({','.join('?' * len(values))})"
+                params += [f'$.{key}'] + values
+        rows = self.conn.execute(query + " ORDER BY row", params).fetchall()
+        if callable(where):
+            rows = [(row, metadata) for row, metadata in rows if where(json.loads(metadata) if metadata else None)]
+        return np.fromiter((row for row, _ in rows), dtype=np.int64, count=len(rows))
+
+    def knn(self, block_size=65536):
+        """ BatchKNN over the mapped rows, without copying them into memory. """
+        return StoreKNN(self, block_size)
+
+    def search(self, queries, k=5, where=None):
+        """ Top-k ids and cosine scores for every query, as BatchKNN.search. """
+        return self.knn().search(queries, k=k, where=where)
+
+    def close(self):
+        self._vectors = self._scales = None
+        self.conn.close()
+
+
+class StoreKNN(BatchKNN):
+    """ BatchKNN reading a MmapEmbeddingStore: filters run in SQLite and ids are fetched only for the results. """
+
+    def __init__(self, store, block_size=65536):
+        super().__init__(vectors=store.vectors, normalized=True, scales=store.scales, block_size=block_size)
+        self.store = store
+        self.ids = RowIds(store)
+
+    def candidates(self, where):
+        return self.store.live_rows(where)
+
+    def search(self, queries, k=5, where=None):
+        if where is None and self.store.header['deleted']:
+            where = {}  # Skip tombstoned rows
+        return super().search(queries, k=k, where=where)
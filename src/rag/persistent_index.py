@@ -0,0 +1,211 @@
+import hashlib
+import json
+import os
+import uuid
+from rag.embedding_pipeline import EmbeddingPipeline, format_stats
+from rag.mmap_store import MmapEmbeddingStore
+from rag.ingest import PDFIngestor, format_report
+from rag.splitter import TextSplitter
+from rag.bm25 import BM25Index
+
+
+def file_hash(path, block_size=1 << 20):
+    """ sha256 of a file's contents, read in blocks. """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class PersistentIndex:
+    """ Chroma collection persisted on disk, with content-addressed chunk ids.
+
+    Every chunk id is a hash of the collection, the embedding model, the chunk parameters, the source path, the
+    page and the chunk text, so an unchanged chunk always maps to the same id. A manifest records the file hash and chunk ids of every
+    indexed source. On ingest:
+        - sources whose file hash is unchanged are skipped without being parsed
+        - changed sources are re-split, only chunks with new ids are embedded and stale ids are deleted
+        - new sources are embedded in full
+    Different collection names, models or chunk parameters get their own collection, manifest and files, so
+    several collections can share a directory and switching back and forth never mixes vectors. Every vector is
+    also appended to a compact MmapEmbeddingStore, which batch search reads without loading the collection, and
+    every chunk text goes into a BM25Index for lexical and hybrid search.
+    """
+
+    def __init__(self, persist_directory='./data/index', collection_name='GE-2024-8K', embedding_model='mxbai-embed-large',
+                 chunk_size=512, chunk_overlap=51, pipeline=None, store_dtype='float16', vector_db=None, embeddings=None):
+        """ Args:
+            persist_directory (str): Where Chroma and the manifest live.
+            collection_name (str): Base name of the Chroma collection.
+            embedding_model (str): Ollama embedding model.
+            chunk_size (int): Chunk size passed to the splitter.
+            chunk_overlap (int): Chunk overlap passed to the splitter.
+            pipeline (EmbeddingPipeline, optional): Embeds new chunks. Defaults to batched requests to embedding_model.
+            store_dtype (str): 'float16' or 'int8' storage of the memory-mapped vectors.
+            vector_db (optional): Chroma-compatible vector store. Defaults to the persisted Chroma collection.
+            embeddings (optional): Query embedder with embed_query(). Defaults to OllamaEmbeddings.
+        """
+        self.persist_directory = persist_directory
+        self.collection_name = collection_name
+        self.embedding_model = embedding_model
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.params_key = hashlib.sha256(
+            f"{collection_name}\0{embedding_model}\0{chunk_size}\0{chunk_overlap}".encode()
+        ).hexdigest()[:12]
+        os.makedirs(persist_directory, exist_ok=True)
+        self.manifest_path = os.path.join(persist_directory, f'manifest-{self.params_key}.json')
+        self.manifest = self.load_manifest()
+        if 'id' not in self.manifest or not os.path.exists(self.manifest_path):
+            # The id is fixed when the index is created; manifests from before ids existed get one now
+            self.manifest.setdefault('id', uuid.uuid4().hex)
+            self.save_manifest()
+        self.pipeline = pipeline or EmbeddingPipeline(embedding_model)
+        self.embedding_stats = None  # Stats of the latest embed run
+        if embeddings is None:
+            from langchain_community.embeddings import OllamaEmbeddings  # Heavy, imported once an index is opened
+            embeddings = OllamaEmbeddings(model=embedding_model, show_progress=True)
+        self.embeddings = embeddings
+        if vector_db is None:
+            from langchain_community.vectorstores import Chroma
+            vector_db = Chroma(
+                collection_name=f'{collection_name}-{self.params_key}',
+                embedding_function=self.embeddings,
+                persist_directory=persist_directory,
+            )
+        self.vector_db = vector_db
+        self.store = MmapEmbeddingStore(os.path.join(persist_directory, f'vectors-{self.params_key}'), dtype=store_dtype)
+        if not len(self.store) and self.manifest['sources']:
+            self.backfill_store()
+        self.bm25_path = os.path.join(persist_directory, f'bm25-{self.params_key}.npz')
+        self.bm25 = BM25Index.load(self.bm25_path) if os.path.exists(self.bm25_path) else BM25Index()
+        if not os.path.exists(self.bm25_path) and self.manifest['sources']:
+            self.backfill_bm25()
+
+    @property
+    def version(self):
+        """ Counter bumped on every change to the indexed content. """
+        return self.manifest['version']
+
+    @property
+    def cache_key(self):
+        """ Identifies the indexed content for caches shared between indexes: the collection, its parameters, an
+        id created with the manifest (so a rebuilt index never matches the old one) and the version.
+        """
+        return f"{self.collection_name}-{self.params_key}-{self.manifest['id']} v{self.version}"
+
+    def load_manifest(self):
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r') as file:
+                return json.load(file)
+        return {
+            'id': uuid.uuid4().hex,
+            'version': 0,
+            'embedding_model': self.embedding_model,
+            'chunk_size': self.chunk_size,
+            'chunk_overlap': self.chunk_overlap,
+            'sources': {},
+        }
+
+    def save_manifest(self):
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w') as file:
+            json.dump(self.manifest, file, indent=4)
+        os.replace(tmp_path, self.manifest_path)
+
+    def embed(self, items):
+        """ Embed (id, text, metadata) items and write them to the collection and the store batch by batch. """
+        def sink(batch_ids, texts, metadatas, vectors):
+            self.vector_db._collection.upsert(ids=batch_ids, embeddings=vectors, documents=texts, metadatas=metadatas)
+            self.store.append(batch_ids, vectors, metadatas)
+            self.bm25.add(batch_ids, texts)
+
+        self.embedding_stats = self.pipeline.run_sync(items, sink)
+        print(f"Embedded {format_stats(self.embedding_stats)}")
+        if self.embedding_stats['failed_batches']:
+            raise RuntimeError(f"{self.embedding_stats['failed_batches']} embedding batch(es) failed, index not updated")
+
+    def ingest(self, paths, splitter=None, ingestor=None, prune=False):
+        """ Bring the index in line with a set of PDFs. Pages of all changed files are parsed in parallel and their
+        chunks flow straight into the embedding pipeline, without materializing whole documents.
+        Args:
+            paths (list): PDF paths.
+            splitter (TextSplitter, optional): Page splitter. Defaults to chunk_size/chunk_overlap with ids
+                namespaced by the index parameters.
+            ingestor (PDFIngestor, optional): Page source, a default process pool if not given.
+            prune (bool): Also drop indexed sources that are not in paths.
+        Returns:
+            dict: Counts of unchanged, updated, removed and failed (unparseable, left as they were) sources, of
+                embedded and reused chunks, and the ingestor report.
+        """
+        ingestor = ingestor or PDFIngestor()
+        splitter = splitter or TextSplitter(self.chunk_size, self.chunk_overlap, namespace=self.params_key)
+        report = {'unchanged': 0, 'updated': 0, 'removed': 0, 'failed': 0, 'embedded_chunks': 0, 'reused_chunks': 0}
+        sources = self.manifest['sources']
+        changed = {}  # Path -> (source, file hash, previous chunk ids)
+        for path in paths:
+            source = os.path.abspath(path)
+            digest = file_hash(path)
+            entry = sources.get(source)
+            if entry and entry['file_hash'] == digest:
+                report['unchanged'] += 1
+            else:
+                changed[path] = (source, digest, set(entry['chunk_ids']) if entry else set())
+        new_ids = {path: [] for path in changed}
+
+        def items():
+            for path, page_number, text in ingestor.pages(list(changed)):
+                source, _, old_ids = changed[path]
+                for chunk in splitter.split(text, source=source, page=page_number):
+                    new_ids[path].append(chunk.id)
+                    if chunk.id in old_ids:
+                        report['reused_chunks'] += 1
+                    else:
+                        report['embedded_chunks'] += 1
+                        yield chunk.id, chunk.text, chunk.metadata
+
+        if changed:
+            self.embed(items())
+            report['ingest'] = ingestor.report()
+            print(f"Parsed {format_report(report['ingest'])}")
+        for path, (source, digest, old_ids) in changed.items():
+            if path in ingestor.stats['errors']:
+                self.delete_chunks(list(set(new_ids[path]) - old_ids))  # Keep the previous version of the file
+                report['failed'] += 1
+                continue
+            stale = old_ids - set(new_ids[path])
+            if stale:
+                self.delete_chunks(list(stale))
+            sources[source] = {'file_hash': digest, 'chunk_ids': new_ids[path]}
+            report['updated'] += 1
+        if prune:
+            wanted = {os.path.abspath(path) for path in paths}
+            for source in [source for source in sources if source not in wanted]:
+                self.delete_chunks(sources.pop(source)['chunk_ids'])
+                report['removed'] += 1
+        if report['updated'] or report['removed']:
+            self.manifest['version'] += 1
+            self.bm25.save(self.bm25_path)
+            self.save_manifest()
+        return report
+
+    def delete_chunks(self, ids):
+        self.vector_db.delete(ids=ids)
+        self.store.delete(ids)
+        self.bm25.delete(ids)
+
+    def backfill_store(self, page_size=5000):
+        """ Copy the vectors of a collection built before the memory-mapped store existed. """
+        collection = self.vector_db._collection
+        for offset in range(0, collection.count(), page_size):
+            page = collection.get(include=['embeddings', 'metadatas'], limit=page_size, offset=offset)
+            self.store.append(page['ids'], page['embeddings'], page['metadatas'])
+
+    def backfill_bm25(self, page_size=5000):
+        """ Build the BM25 index from the texts of a collection indexed before it existed. """
+        collection = self.vector_db._collection
+        for offset in range(0, collection.count(), page_size):
+            page = collection.get(include=['documents'], limit=page_size, offset=offset)
+            self.bm25.add(page['ids'], page['documents'])
+        self.bm25.save(self.bm25_path)
@@ -0,0 +1,103 @@
+import contextvars
+import json
+import os
+import time
+from contextlib import contextmanager
+from response_cache import DiskBackend, ResponseCache
+
+DEFAULT_CACHE_PATH = os.environ.get('RETRIEVAL_CACHE_PATH', './cache/retrieval.sqlite3')
+STAGES = ('expand', 'retrieve', 'generate')
+
+
+class RetrievalCache:
+    """ Caches the query expansions and retrieved documents of a question.
+
+    Entries live in a ResponseCache partitioned by kind and index key, so exact lookups match on the normalized
+    question (and, with semantic matching on, on similar questions) and every change to the index switches to a
+    fresh partition. Entries of older versions are never read again and age out of the backend. The key must tell
+    apart every index that shares the cache file, not just versions of one index.
+    """
+
+    def __init__(self, key_fn, cache=None):
+        """ Args:
+            key_fn (callable): Returns the current index key, e.g. lambda: index.cache_key.
+            cache (ResponseCache, optional): Storage; an in-memory cache without context by default.
+        """
+        self.key_fn = key_fn
+        self.cache = cache or ResponseCache(context_messages=0)
+
+    def partition(self):
+        return f"index {self.key_fn()}"
+
+    def get(self, kind, question):
+        found = self.cache.lookup(kind, self.partition(), [], question)
+        return json.loads(found) if found is not None else None
+
+    def put(self, kind, question, value):
+        self.cache.store(kind, self.partition(), [], question, json.dumps(value))
+
+    def expansion(self, question):
+        """ Cached list of generated queries for the question, or None. """
+        return self.get('expand', question)
+
+    def store_expansion(self, question, queries):
+        self.put('expand', question, list(queries))
+
+    def documents(self, question):
+        """ Cached retrieved documents as dicts with page_content and metadata, or None. """
+        return self.get('retrieve', question)
+
+    def store_documents(self, question, documents):
+        self.put('retrieve', question, [{'page_content': document['page_content'], 'metadata': document.get('metadata') or {}}
+                                        for document in documents])
+
+
+def default_retrieval_cache(key_fn, path=DEFAULT_CACHE_PATH, semantic=None):
+    """ On-disk RetrievalCache. Semantic matching follows RESPONSE_CACHE_SEMANTIC unless given. """
+    if semantic is None:
+        semantic = os.environ.get('RESPONSE_CACHE_SEMANTIC', '0') == '1'
+    return RetrievalCache(key_fn, ResponseCache(backend=DiskBackend(path), context_messages=0, semantic=semantic))
+
+
+_timings = contextvars.ContextVar('stage_timings', default=None)
+
+
+class StageTimer:
+    """ Per-request stage latencies. start() opens a record in the current context; stage() blocks add to it.
+    The record is shared with threads and tasks started from that context, so concurrent requests each get
+    their own.
+    """
+
+    @staticmethod
+    def start(timings=None):
+        """ Open a record in the current context, optionally filling a dict the caller holds. """
+        timings = timings if timings is not None else {}
+        timings.setdefault('cached', set())
+        _timings.set(timings)
+        return timings
+
+    @staticmethod
+    @contextmanager
+    def stage(name):
+        timings = _timings.get()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            if timings is not None:
+                timings[name] = timings.get(name, 0.0) + time.perf_counter() - started
+
+    @staticmethod
+    def mark_cached(name):
+        timings = _timings.get()
+        if timings is not None:
+            timings['cached'].add(name)
+
+
+def format_stage_timings(timings):
+    """ One line with the expand, retrieve and generate latency of a request, noting cache hits. """
+    fields = []
+    for name in STAGES:
+        if name in timings:
+            fields.append(f"{name} {timings[name]:.2f}s" + (" (cached)" if name in timings.get('cached', ()) else ""))
+    return ", ".join(fields)
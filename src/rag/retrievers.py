@@ -0,0 +1,94 @@
+from langchain.retrievers.multi_query import MultiQueryRetriever
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from rag.ann import IVFIndex
+from rag.bm25 import HybridSearch
+from rag.persistent_index import PersistentIndex
+from rag.retrieval_cache import RetrievalCache, StageTimer
+import numpy as np
+
+
+class ANNRetriever(BaseRetriever):
+    """ Retriever that finds chunk ids in an IVF index and fetches their text from the Chroma collection. """
+    index: PersistentIndex
+    ann: IVFIndex
+    k: int = 4
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        ids, _ = self.ann.search(np.asarray(self.index.embeddings.embed_query(query)), k=self.k)
+        return documents_by_id(self.index, ids[0])
+
+
+class HybridRetriever(BaseRetriever):
+    """ One BM25 + vector retrieval per question, fused by rank, instead of several LLM-generated rewrites. """
+    index: PersistentIndex
+    hybrid: HybridSearch
+    k: int = 4
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        with StageTimer.stage("retrieve"):
+            return documents_by_id(self.index, [chunk_id for chunk_id, _ in self.hybrid.search(query, k=self.k)])
+
+
+class CachedMultiQueryRetriever(MultiQueryRetriever):
+    """ MultiQueryRetriever that reuses the generated queries and the retrieved documents of questions it has
+    already answered at the same index version, and records expand/retrieve latency in the StageTimer.
+    """
+    cache: RetrievalCache
+
+    def cached_documents(self, query):
+        cached = self.cache.documents(query)
+        if cached is None:
+            return None
+        StageTimer.mark_cached("expand")
+        StageTimer.mark_cached("retrieve")
+        return [Document(**document) for document in cached]
+
+    def store_documents(self, query, documents):
+        self.cache.store_documents(query, [{"page_content": document.page_content, "metadata": document.metadata}
+                                           for document in documents])
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        with StageTimer.stage("retrieve"):
+            documents = self.cached_documents(query)
+        if documents is not None:
+            return documents
+        with StageTimer.stage("expand"):
+            queries = self.cache.expansion(query)
+            if queries is None:
+                queries = self.generate_queries(query, run_manager)
+                self.cache.store_expansion(query, queries)
+            else:
+                StageTimer.mark_cached("expand")
+        if self.include_original:
+            queries = queries + [query]
+        with StageTimer.stage("retrieve"):
+            documents = self.unique_union(self.retrieve_documents(queries, run_manager))
+        self.store_documents(query, documents)
+        return documents
+
+    async def _aget_relevant_documents(self, query, *, run_manager):
+        with StageTimer.stage("retrieve"):
+            documents = self.cached_documents(query)
+        if documents is not None:
+            return documents
+        with StageTimer.stage("expand"):
+            queries = self.cache.expansion(query)
+            if queries is None:
+                queries = await self.agenerate_queries(query, run_manager)
+                self.cache.store_expansion(query, queries)
+            else:
+                StageTimer.mark_cached("expand")
+        if self.include_original:
+            queries = queries + [query]
+        with StageTimer.stage("retrieve"):
+            documents = self.unique_union(await self.aretrieve_documents(queries, run_manager))
+        self.store_documents(query, documents)
+        return documents
+
+
+def documents_by_id(index, ids):
+    """ Documents of the given chunk ids from the Chroma collection, in the order given. """
+    found = index.vector_db.get(ids=ids)
+    by_id = dict(zip(found["ids"], zip(found["documents"], found["metadatas"])))
+    return [Document(page_content=by_id[i][0], metadata=by_id[i][1] or {}) for i in ids if i in by_id]
@@ -0,0 +1,123 @@
+import hashlib
+import re
+
+SEPARATORS = ('\n\n', '\n', '. ', ' ')
+NON_SPACE = re.compile(r'\S')
+MXBAI_MAX_TOKENS = 512
+
+
+class Chunk:
+    """ A span of a page's text. The text is only sliced out when asked for. """
+
+    __slots__ = ('page_text', 'start', 'end', 'id', 'metadata')
+
+    def __init__(self, page_text, start, end, chunk_id, metadata):
+        self.page_text = page_text
+        self.start = start
+        self.end = end
+        self.id = chunk_id
+        self.metadata = metadata
+
+    @property
+    def text(self):
+        return self.page_text[self.start:self.end]
+
+    def __repr__(self):
+        return f"Chunk({self.id!r}, {self.start}:{self.end})"
+
+
+class TextSplitter:
+    """ Splits text into overlapping chunks by offset, like RecursiveCharacterTextSplitter but without copies.
+
+    Each chunk ends at the last paragraph break inside the size limit, else the last line break, sentence end or
+    space, else at the limit. The next chunk starts chunk_overlap characters before that end, moved forward to a
+    word boundary. Only (start, end) offsets are computed; substrings are made once, when a chunk's text is used.
+
+    Chunks are also capped at max_tokens of the embedding model, estimated from chars_per_token or counted exactly
+    with count_tokens. Chunk ids hash the namespace, source, page and chunk text (plus an occurrence number for
+    repeats), so an unchanged chunk keeps its id when other parts of the document change.
+    """
+
+    def __init__(self, chunk_size=512, chunk_overlap=51, max_tokens=MXBAI_MAX_TOKENS, chars_per_token=3.0,
+                 count_tokens=None, separators=SEPARATORS, namespace=''):
+        """ Args:
+            chunk_size (int): Maximum chunk length in characters.
+            chunk_overlap (int): Characters repeated from the end of the previous chunk.
+            max_tokens (int): Token budget of the embedding model per chunk.
+            chars_per_token (float): Conservative characters per token, for the estimate.
+            count_tokens (callable, optional): count_tokens(text) -> tokens, checked for every chunk when given.
+            separators (tuple): Break points, most preferred first.
+            namespace (str): Mixed into every chunk id, e.g. to separate splitter settings or embedding models.
+        """
+        if chunk_overlap >= chunk_size:
+            raise ValueError("chunk_overlap must be smaller than chunk_size")
+        self.max_chars = min(chunk_size, int(max_tokens * chars_per_token))
+        self.chunk_overlap = min(chunk_overlap, self.max_chars // 2)
+        self.max_tokens = max_tokens
+        self.count_tokens = count_tokens
+        self.separators = separators
+        self.namespace = namespace
+
+    def break_point(self, text, start, limit):
+        """ End offset of a chunk starting at start and ending no later than limit. """
+        if limit >= len(text):
+            return len(text)
+        floor = start + self.max_chars // 4  # Don't settle for tiny chunks when a separator sits near the start
+        for separator in self.separators:
+            position = text.rfind(separator, floor, limit)
+            if position != -1:
+                return position + (1 if separator == '. ' else 0)  # Keep the full stop with its sentence
+        return limit
+
+    def spans(self, text):
+        """ Yield (start, end) offsets of the chunks of text. """
+        match = NON_SPACE.search(text)
+        start = match.start() if match else len(text)
+        while start < len(text):
+            limit = start + self.max_chars
+            end = self.break_point(text, start, limit)
+            while self.count_tokens and end - start > 1 and self.count_tokens(text[start:end]) > self.max_tokens:
+                limit = start + (end - start) * 3 // 4
+                end = self.break_point(text, start, limit)
+            last = end >= len(text)
+            while end > start and text[end - 1].isspace():
+                end -= 1
+            if end <= start:
+                end = min(limit, len(text))
+            yield start, end
+            if last:
+                break
+            next_start = max(end - self.chunk_overlap, start + 1)
+            if next_start < end:
+                space = text.find(' ', next_start, end)  # Don't open the overlap mid-word
+                next_start = space + 1 if space != -1 else end
+            match = NON_SPACE.search(text, next_start)
+            start = match.start() if match else len(text)
+
+    def split(self, text, source=None, page=None):
+        """ Chunks of one page.
+        Args:
+            text (str): The page text.
+            source (str, optional): Source path, stored in metadata and mixed into the ids.
+            page (int, optional): Page number, stored in metadata and mixed into the ids.
+        Returns:
+            list: Chunk objects with id and source/page/start/end metadata.
+        """
+        chunks = []
+        seen = {}
+        prefix = f"{self.namespace}\0{source}\0{page}\0".encode()
+        for start, end in self.spans(text):
+            digest = hashlib.sha256(prefix + text[start:end].encode()).hexdigest()[:32]
+            occurrence = seen.get(digest, 0)
+            seen[digest] = occurrence + 1
+            metadata = {'start': start, 'end': end}
+            if source is not None:
+                metadata['source'] = source
+            if page is not None:
+                metadata['page'] = page
+            chunks.append(Chunk(text, start, end, f"{digest}-{occurrence}", metadata))
+        return chunks
+
+    def split_text(self, text):
+        """ Chunk texts only, as RecursiveCharacterTextSplitter.split_text. """
+        return [text[start:end] for start, end in self.spans(text)]
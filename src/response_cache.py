@@ -0,0 +1,261 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+
+DEFAULT_CACHE_PATH = os.environ.get('RESPONSE_CACHE_PATH', './cache/responses.sqlite3')
+DEFAULT_TTL = int(os.environ.get('RESPONSE_CACHE_TTL', 3600))
+EMBEDDING_MODEL = 'mxbai-embed-large'
+# Device commands: "turn on the lights" and "turn off the lights" embed almost identically but must never share an answer
+COMMAND = re.compile(
+    r'^(?:hey |ok )?(?:please |can you |could you |would you )*'
+    r'(?:turn|switch|set|dim|brighten|open|close|lock|unlock|start|stop|play|pause|resume|raise|lower|increase|'
+    r'decrease|activate|deactivate|enable|disable|toggle|arm|disarm|mute|unmute)\b|\b(?:on|off)$'
+)
+
+
+def normalize(text):
+    """ Lowercase, collapse whitespace and drop trailing punctuation, so trivially different phrasings share a key. """
+    return re.sub(r'\s+', ' ', text.lower()).strip().rstrip('.!?').strip()
+
+
+class MemoryBackend:
+    """ In-process LRU store. Entries are dicts with response, partition, expires_at and an optional embedding. """
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry['expires_at'] < time.time():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def partition(self, partition):
+        """ Live (key, entry) pairs of a partition that carry an embedding. """
+        now = time.time()
+        with self.lock:
+            return [(key, entry) for key, entry in self.entries.items()
+                    if entry['partition'] == partition and entry['expires_at'] >= now and entry.get('embedding') is not None]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class DiskBackend:
+    """ SQLite store that survives restarts. Least recently used entries are evicted past max_entries. """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=10000):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.conn:
+            self.conn.execute(
+                """CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    partition TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    embedding BLOB,
+                    expires_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )"""
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS entries_partition ON entries (partition)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+
+    @staticmethod
+    def to_entry(row):
+        response, partition, embedding, expires_at = row
+        return {
+            'response': response,
+            'partition': partition,
+            'embedding': np.frombuffer(embedding, dtype=np.float32) if embedding is not None else None,
+            'expires_at': expires_at,
+        }
+
+    def get(self, key):
+        now = time.time()
+        with self.lock, self.conn:
+            row = self.conn.execute(
+                "SELECT response, partition, embedding, expires_at FROM entries WHERE key = ? AND expires_at >= ?", (key, now)
+            ).fetchone()
+            if row is None:
+                return None
+            self.conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (now, key))
+        return self.to_entry(row)
+
+    def set(self, key, entry):
+        now = time.time()
+        embedding = entry.get('embedding')
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO entries (key, partition, response, embedding, expires_at, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, entry['partition'], entry['response'],
+                 np.asarray(embedding, dtype=np.float32).tobytes() if embedding is not None else None,
+                 entry['expires_at'], now),
+            )
+            self.conn.execute("DELETE FROM entries WHERE expires_at < ?", (now,))
+            self.conn.execute(
+                """DELETE FROM entries WHERE key IN (
+                    SELECT key FROM entries ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                )""",
+                (self.max_entries,),
+            )
+
+    def partition(self, partition):
+        with self.lock:
+            rows = self.conn.execute(
+                """SELECT key, response, partition, embedding, expires_at FROM entries
+                WHERE partition = ? AND expires_at >= ? AND embedding IS NOT NULL""",
+                (partition, time.time()),
+            ).fetchall()
+        return [(row[0], self.to_entry(row[1:])) for row in rows]
+
+    def clear(self):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM entries")
+
+
+class ResponseCache:
+    """ Caches model answers in front of the chat calls.
+
+    Exact matches are keyed on model, system prompt, the normalized last context_messages messages and the
+    normalized question. With semantic matching on, a miss falls back to the cached question in the same
+    (model, system prompt, context) partition whose embedding is most similar, if it clears the threshold.
+    Device commands (see COMMAND) only ever hit exactly: opposite commands differ by a single word.
+    """
+
+    def __init__(self, backend=None, ttl=DEFAULT_TTL, context_messages=2, semantic=False, embed_fn=None, threshold=0.92):
+        """ Args:
+            backend (MemoryBackend or DiskBackend, optional): Storage, in-memory LRU by default.
+            ttl (float): Seconds an answer stays valid.
+            context_messages (int): Number of preceding non-system messages that are part of the key.
+            semantic (bool): Fall back to embedding similarity on exact misses.
+            embed_fn (callable, optional): embed_fn(text) -> vector. Defaults to mxbai-embed-large through Ollama.
+            threshold (float): Minimum cosine similarity of a semantic hit.
+        """
+        self.backend = backend or MemoryBackend()
+        self.ttl = ttl
+        self.context_messages = context_messages
+        self.semantic = semantic
+        self.embed_fn = embed_fn or (ollama_embedder() if semantic else None)
+        self.threshold = threshold
+        self.embeddings = OrderedDict()  # Question -> embedding computed on a miss, reused by store()
+        self.metrics = {'hits': 0, 'semantic_hits': 0, 'misses': 0, 'stores': 0}
+
+    def keys(self, model, system_prompt, history, question):
+        """ (exact key, partition) of a request. history holds the messages before the question. """
+        context = [message for message in history if message['role'] != 'system']
+        context = context[-self.context_messages:] if self.context_messages else []
+        partition = hashlib.sha256('\0'.join(
+            [model, system_prompt or ''] + [f"{message['role']}:{normalize(message['content'])}" for message in context]
+        ).encode()).hexdigest()
+        key = hashlib.sha256(f"{partition}\0{normalize(question)}".encode()).hexdigest()
+        return key, partition
+
+    def lookup(self, model, system_prompt, history, question):
+        """ Return the cached answer for a request, or None.
+        Args:
+            model (str): The model that would answer.
+            system_prompt (str): The active system prompt.
+            history (list): Messages before the question.
+            question (str): The user's question.
+        Returns:
+            str: The cached answer, or None on a miss.
+        """
+        key, partition = self.keys(model, system_prompt, history, question)
+        entry = self.backend.get(key)
+        if entry is not None:
+            self.metrics['hits'] += 1
+            return entry['response']
+        if self.semantic and not is_command(question):
+            match = self.semantic_match(partition, question)
+            if match is not None:
+                self.metrics['semantic_hits'] += 1
+                return match
+        self.metrics['misses'] += 1
+        return None
+
+    def semantic_match(self, partition, question):
+        candidates = self.backend.partition(partition)
+        if not candidates:
+            return None
+        query = self.embedding(question)
+        matrix = np.stack([entry['embedding'] for _, entry in candidates])
+        scores = matrix @ query / (np.linalg.norm(matrix, axis=1) * np.linalg.norm(query) + 1e-12)
+        best = int(np.argmax(scores))
+        return candidates[best][1]['response'] if scores[best] >= self.threshold else None
+
+    def embedding(self, question):
+        if question not in self.embeddings:
+            self.embeddings[question] = np.asarray(self.embed_fn(question), dtype=np.float32)
+            while len(self.embeddings) > 64:
+                self.embeddings.popitem(last=False)
+        return self.embeddings[question]
+
+    def store(self, model, system_prompt, history, question, response):
+        """ Cache an answer. Empty answers are not cached. Arguments as in lookup(). """
+        if not response.strip():
+            return
+        key, partition = self.keys(model, system_prompt, history, question)
+        self.backend.set(key, {
+            'response': response,
+            'partition': partition,
+            'embedding': self.embedding(question) if self.semantic and not is_command(question) else None,
+            'expires_at': time.time() + self.ttl,
+        })
+        self.metrics['stores'] += 1
+
+    def stats(self):
+        """ Hit/miss counters plus the overall hit rate. """
+        lookups = self.metrics['hits'] + self.metrics['semantic_hits'] + self.metrics['misses']
+        hit_rate = (self.metrics['hits'] + self.metrics['semantic_hits']) / lookups if lookups else 0.0
+        return dict(self.metrics, lookups=lookups, hit_rate=hit_rate)
+
+
+def is_command(question):
+    """ Whether a question reads as a device command, which the semantic tier must not answer. """
+    return COMMAND.search(normalize(question)) is not None
+
+
+def ollama_embedder(model=EMBEDDING_MODEL):
+    """ embed_fn backed by the Ollama embeddings endpoint on the shared client. """
+    from ollama_session import get_client
+
+    def embed(text):
+        return get_client().embeddings(model=model, prompt=text)['embedding']
+
+    return embed
+
+
+def default_cache(path=DEFAULT_CACHE_PATH, semantic=None):
+    """ The on-disk cache used by the chat front-ends. Semantic matching follows RESPONSE_CACHE_SEMANTIC unless given. """
+    if semantic is None:
+        semantic = os.environ.get('RESPONSE_CACHE_SEMANTIC', '0') == '1'
+    return ResponseCache(backend=DiskBackend(path), semantic=semantic)
+
+
+def format_stats(stats):
+    """ One-line description of stats() for logs and captions. """
+    return "{lookups} lookups, {hits} hits, {semantic_hits} similar, {misses} misses ({rate:.0%} hit rate)".format(
+        rate=stats['hit_rate'], **stats)
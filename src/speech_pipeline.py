@@ -0,0 +1,290 @@
+import queue
+import re
+import threading
+import time
+
+SENTENCE_END = re.compile(r'[.!?]+["\')\]]*\s|\n\s*\n|\n(?=\s*(?:[-*•]|\d+\.)\s)')
+ABBREVIATIONS = {'e.g', 'i.e', 'etc', 'vs', 'mr', 'mrs', 'ms', 'dr', 'st', 'no', 'approx', 'min', 'max', 'fig'}
+MARKDOWN = re.compile(r'[*_`#>]+')
+
+
+class SentenceSplitter:
+    """ Cuts a token stream into sentences as soon as they are complete.
+
+    A sentence ends at . ! or ? followed by whitespace, at a blank line, or before a list item. Abbreviations,
+    list numbers ("1.") and fragments shorter than min_chars do not end a sentence. A run of text longer than
+    max_chars without a sentence end is cut at the last comma or space, so synthesis never waits on a long
+    unpunctuated answer.
+    """
+
+    def __init__(self, min_chars=12, max_chars=300):
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self.buffer = ''
+
+    def feed(self, text):
+        """ Add streamed text. Returns the sentences it completed. """
+        self.buffer += text
+        sentences = []
+        while True:
+            cut = self.boundary()
+            if cut is None:
+                break
+            sentence, self.buffer = self.buffer[:cut].strip(), self.buffer[cut:]
+            if sentence:
+                sentences.append(sentence)
+        return sentences
+
+    def flush(self):
+        """ Whatever is left once the stream has ended. """
+        rest, self.buffer = self.buffer.strip(), ''
+        return [rest] if rest else []
+
+    def boundary(self):
+        for match in SENTENCE_END.finditer(self.buffer):
+            head = self.buffer[:match.start()].strip()
+            if len(head) < self.min_chars:
+                continue
+            word = head.rsplit(None, 1)[-1].lower().rstrip('.')
+            if match.group().startswith('.') and (word in ABBREVIATIONS or word.isdigit() or len(word) == 1):
+                continue
+            return match.end()
+        if len(self.buffer) > self.max_chars:
+            window = self.buffer[:self.max_chars]
+            cut = window.rfind(', ')  # A clause break reads better than any word break
+            if cut <= 0:
+                cut = window.rfind(' ')
+            return cut + 1 if cut > 0 else self.max_chars
+        return None
+
+
+class CancelToken:
+    """ Cooperative cancellation shared by everything working on one spoken answer.
+
+    cancel() may be called from any thread, e.g. the recognizer's when the user starts talking. It runs the
+    registered callbacks right away (stopping playback is one), while loops that poll the token, like the token
+    stream, stop at their next check.
+    """
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.lock = threading.Lock()
+        self.callbacks = []
+        self.reason = None
+        self.requested_at = None  # perf_counter time of cancel()
+
+    @property
+    def cancelled(self):
+        return self.event.is_set()
+
+    def cancel(self, reason='cancelled'):
+        with self.lock:
+            if self.event.is_set():
+                return
+            self.reason = reason
+            self.requested_at = time.perf_counter()
+            self.event.set()
+            callbacks = list(self.callbacks)
+        for callback in callbacks:
+            callback()
+
+    def on_cancel(self, callback):
+        """ Call callback on cancel(), or now if that already happened. """
+        with self.lock:
+            if not self.event.is_set():
+                self.callbacks.append(callback)
+                return
+        callback()
+
+
+def interruptible(chunks, token, poll=0.02):
+    """ Iterate chunks (e.g. an Ollama response stream) until token is cancelled.
+
+    A blocking stream cannot be closed from another thread, so it is read by a worker thread: a cancel ends this
+    generator within poll seconds even while the server is still evaluating the prompt, and the worker closes the
+    stream, which drops the connection and stops the generation, as soon as its next chunk arrives.
+    """
+    pending = queue.Queue()
+    done = object()
+
+    def read():
+        try:
+            for chunk in chunks:
+                if token.cancelled:
+                    break
+                pending.put(chunk)
+        except Exception as exc:
+            pending.put(exc)
+        finally:
+            close = getattr(chunks, 'close', None)
+            if close is not None:
+                close()
+            pending.put(done)
+
+    threading.Thread(target=read, daemon=True).start()
+    while not token.cancelled:
+        try:
+            chunk = pending.get(timeout=poll)
+        except queue.Empty:
+            continue
+        if chunk is done:
+            return
+        if isinstance(chunk, Exception):
+            raise chunk
+        yield chunk
+
+
+def spoken_prefix(sentence, fraction):
+    """ The words of sentence that fit in the played fraction of its audio, marked as cut off. """
+    words = sentence.split()
+    count = int(len(words) * fraction)
+    return ' '.join(words[:count]) + '...' if count else ''
+
+
+def speakable(text):
+    """ Sentence text without the markdown the model likes to emit, which TTS would read out loud. """
+    return re.sub(r'\s+', ' ', MARKDOWN.sub('', text)).strip()
+
+
+class SpeechPipeline:
+    """ Speaks an answer while it is still being generated.
+
+        tokens --feed()--> sentences --[max_sentences]--> synthesis thread --[max_clips]--> playback thread
+
+    Completed sentences are synthesized one after another in a worker thread and handed to a second thread that
+    plays them back to back, so the first sentence is audible while the model is still writing the rest. Both
+    queues are bounded: a slow synthesizer eventually holds up feed() (and with it the token stream) instead of
+    buffering the whole answer, and at most max_clips synthesized clips sit in memory.
+    """
+
+    def __init__(self, synthesize, player, max_sentences=8, max_clips=2, splitter=None):
+        """ Args:
+            synthesize (callable): synthesize(text) -> clip, anything player.play accepts.
+            player: Object with a blocking play(clip, cancelled) that returns early once the threading.Event
+                cancelled is set, optionally returning the fraction of the clip that was played.
+            max_sentences (int): Sentences waiting for synthesis.
+            max_clips (int): Synthesized clips waiting for playback.
+            splitter (SentenceSplitter, optional): Sentence boundary detection.
+        """
+        self.synthesize = synthesize
+        self.player = player
+        self.splitter = splitter or SentenceSplitter()
+        self.sentences = queue.Queue(max_sentences)
+        self.clips = queue.Queue(max_clips)
+        self.stopped = threading.Event()
+        self.stop_requested = None
+        self.spoken = []  # Sentences that were played, in order, ending with the cut-off part of an interrupted one
+        self.error = None
+        self.timings = {}
+        self.threads = []
+
+    def start(self, started=None):
+        """ Start the worker threads. started is the perf_counter time latencies are measured from, e.g. the end of
+        the user's question; defaults to now.
+        """
+        self.started = started if started is not None else time.perf_counter()
+        self.timings = {'sentences': 0, 'synthesize': 0.0, 'play': 0.0}
+        self.threads = [threading.Thread(target=self.synthesis_loop, daemon=True),
+                        threading.Thread(target=self.playback_loop, daemon=True)]
+        for thread in self.threads:
+            thread.start()
+        return self
+
+    def feed(self, text):
+        """ Add a piece of the streamed answer. """
+        for sentence in self.splitter.feed(text):
+            self.put(sentence)
+
+    def put(self, sentence):
+        if self.stopped.is_set():
+            return
+        self.timings.setdefault('first_sentence', time.perf_counter() - self.started)
+        self.timings['sentences'] += 1
+        self.sentences.put(sentence)
+
+    def finish(self):
+        """ Speak the rest of the answer and wait until playback has ended.
+        Returns:
+            dict: Seconds from start to the first complete sentence and to the first audio, total synthesis and
+                playback seconds, the number of sentences and the total.
+        """
+        for sentence in self.splitter.flush():
+            self.put(sentence)
+        self.sentences.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.timings['total'] = time.perf_counter() - self.started
+        if self.error is not None:
+            raise self.error
+        return self.timings
+
+    def stop(self):
+        """ Stop playback now and drop everything that was not spoken yet. Safe to call from any thread; the
+        worker threads skip what is still queued, so finish() returns promptly. The time until the player has
+        actually gone quiet is reported as stop_latency.
+        """
+        if self.stopped.is_set():
+            return
+        self.stop_requested = time.perf_counter()
+        self.stopped.set()  # The player checks it between audio blocks
+
+    def spoken_text(self):
+        """ What the listener actually heard. """
+        return ' '.join(self.spoken)
+
+    def synthesis_loop(self):
+        while True:
+            sentence = self.sentences.get()
+            if sentence is None:
+                break
+            text = speakable(sentence)
+            if self.stopped.is_set() or self.error is not None or not text:
+                continue  # Keep draining so feed() never blocks on a dead stage
+            try:
+                began = time.perf_counter()
+                clip = self.synthesize(text)
+                self.timings['synthesize'] += time.perf_counter() - began
+            except Exception as exc:
+                self.error = exc
+                continue
+            self.clips.put((sentence, clip))
+        self.clips.put(None)
+
+    def playback_loop(self):
+        while True:
+            item = self.clips.get()
+            if item is None:
+                break
+            sentence, clip = item
+            if self.stopped.is_set() or self.error is not None:
+                continue
+            began = time.perf_counter()
+            self.timings.setdefault('first_audio', began - self.started)
+            try:
+                played = self.player.play(clip, self.stopped)  # Fraction of the clip played, if the player knows
+            except Exception as exc:
+                self.error = exc
+                continue
+            ended = time.perf_counter()
+            self.timings['play'] += ended - began
+            if not self.stopped.is_set():
+                self.spoken.append(sentence)
+                continue
+            if self.stop_requested is not None:
+                self.timings['stop_latency'] = ended - self.stop_requested
+            partial = spoken_prefix(sentence, played or 0.0)
+            if partial:
+                self.spoken.append(partial)
+
+
+def format_timings(timings):
+    """ One-line summary of SpeechPipeline.finish() timings. """
+    line = f"{timings.get('sentences', 0)} sentences"
+    if 'first_audio' in timings:
+        line += f", first audio after {timings['first_audio']:.2f}s"
+    if 'first_sentence' in timings:
+        line += f" (first sentence {timings['first_sentence']:.2f}s)"
+    line += f", synthesis {timings.get('synthesize', 0.0):.2f}s, total {timings.get('total', 0.0):.2f}s"
+    if 'stop_latency' in timings:
+        line += f", stopped {timings['stop_latency'] * 1000:.0f} ms after the interruption"
+    return line
@@ -0,0 +1,347 @@
+import os
+import queue
+import re
+import threading
+import time
+from collections import deque
+import numpy as np
+from audio_io import convert, read_wav
+
+SAMPLE_RATE = 16000
+DEFAULT_WAKE_WORD = os.environ.get('WAKE_WORD', 'computer')
+
+
+class EnergyVAD:
+    """ Frame-level voice activity from RMS energy against an adaptive noise floor.
+
+    A frame is speech when its RMS exceeds both min_rms and ratio times the noise floor. The floor follows the
+    energy of non-speech frames, so a humming fridge raises the threshold while a pause in speech does not.
+    """
+
+    def __init__(self, ratio=3.0, min_rms=300.0, adapt=0.05):
+        """ Args:
+            ratio (float): Speech/noise energy ratio that counts as speech.
+            min_rms (float): Absolute RMS floor in 16-bit sample units.
+            adapt (float): How fast the noise floor follows quiet frames.
+        """
+        self.ratio = ratio
+        self.min_rms = min_rms
+        self.adapt = adapt
+        self.noise = min_rms / ratio
+
+    def is_speech(self, frame):
+        rms = float(np.sqrt(np.mean(np.square(frame, dtype=np.float64))))
+        speech = rms > max(self.min_rms, self.noise * self.ratio)
+        if not speech:
+            self.noise += self.adapt * (rms - self.noise)
+        return speech
+
+
+class Endpointer:
+    """ Cuts a stream of 16 kHz samples into utterances.
+
+    Samples are processed in frames of frame_ms. While nobody speaks, the last pre_roll_ms of audio sit in a
+    ring buffer, so the start of an utterance is not clipped when the VAD fires a frame late. An utterance ends
+    after hangover_ms of non-speech or at max_utterance_ms; one with less than min_speech_ms of speech is dropped
+    as a click or cough. push() returns events:
+        ('start', pre-roll samples), ('speech', frame), ('end', whole utterance or None if it was dropped)
+    """
+
+    def __init__(self, vad=None, rate=SAMPLE_RATE, frame_ms=30, pre_roll_ms=300, hangover_ms=600, min_speech_ms=150,
+                 max_utterance_ms=15000):
+        self.vad = vad or EnergyVAD()
+        self.rate = rate
+        self.frame = rate * frame_ms // 1000
+        self.ring = deque(maxlen=max(1, pre_roll_ms // frame_ms))
+        self.hangover = max(1, hangover_ms // frame_ms)
+        self.min_speech = max(1, min_speech_ms // frame_ms)
+        self.max_frames = max_utterance_ms // frame_ms
+        self.pending = np.empty(0, dtype=np.int16)
+        self.position = 0  # Samples processed so far
+        self.reset()
+
+    def reset(self):
+        """ Forget the current utterance and the pre-roll, e.g. after a pause in listening. """
+        self.ring.clear()
+        self.frames = None  # Frames of the current utterance, None between utterances
+        self.voiced = 0
+        self.silence = 0
+        self.start = 0
+
+    @property
+    def in_speech(self):
+        return self.frames is not None
+
+    def push(self, samples):
+        """ Process int16 samples. Returns the events they produced. """
+        samples = np.concatenate([self.pending, np.asarray(samples, dtype=np.int16)])
+        usable = len(samples) - len(samples) % self.frame
+        self.pending = samples[usable:]
+        events = []
+        for offset in range(0, usable, self.frame):
+            events += self.process(samples[offset:offset + self.frame])
+        return events
+
+    def flush(self):
+        """ End of stream: close an utterance that is still open. """
+        return [self.end()] if self.in_speech else []
+
+    def process(self, frame):
+        self.position += len(frame)
+        speech = self.vad.is_speech(frame)
+        if not self.in_speech:
+            self.ring.append(frame)
+            if not speech:
+                return []
+            self.frames = list(self.ring)
+            self.ring.clear()
+            self.start = self.position - len(self.frames) * self.frame
+            self.voiced, self.silence = 1, 0
+            return [('start', np.concatenate(self.frames[:-1] or [frame[:0]])), ('speech', frame)]
+        self.frames.append(frame)
+        if speech:
+            self.voiced += 1
+            self.silence = 0
+        else:
+            self.silence += 1
+        events = [('speech', frame)]
+        if self.silence >= self.hangover or len(self.frames) >= self.max_frames:
+            events.append(self.end())
+        return events
+
+    def end(self):
+        audio = np.concatenate(self.frames) if self.voiced >= self.min_speech else None
+        self.frames = None
+        return ('end', audio)
+
+
+class WakeWord:
+    """ Wake word gate on recognized text.
+
+    "computer, turn on the lights" passes as "turn on the lights". The wake word on its own arms the gate, and
+    the next utterance within follow_up seconds passes whole. Everything else is ignored. A wake word of None
+    lets everything through.
+    """
+
+    def __init__(self, phrase=DEFAULT_WAKE_WORD, follow_up=8.0, max_offset=2):
+        """ Args:
+            phrase (str): Wake word or phrase, None to disable the gate.
+            follow_up (float): Seconds a bare wake word keeps the gate open.
+            max_offset (int): Words allowed before the wake word, e.g. "hey" or "ok".
+        """
+        self.words = words(phrase) if phrase else None
+        self.follow_up = follow_up
+        self.max_offset = max_offset
+        self.armed_until = None
+
+    def __call__(self, text, now):
+        """ The command in text, or None if it was not addressed to the assistant. now is in seconds. """
+        if self.words is None:
+            return text
+        spoken = words(text)
+        for offset in range(min(self.max_offset, len(spoken)) + 1):
+            if spoken[offset:offset + len(self.words)] == self.words:
+                command = ' '.join(spoken[offset + len(self.words):])
+                if not command:
+                    self.armed_until = now + self.follow_up
+                    return None
+                self.armed_until = None
+                return command
+        if self.armed_until is not None and now <= self.armed_until:
+            self.armed_until = None
+            return ' '.join(spoken)
+        return None
+
+
+def words(text):
+    return re.findall(r"[a-z0-9']+", text.lower())
+
+
+class PocketsphinxDecoder:
+    """ Streaming pocketsphinx decoder that stays loaded between utterances. """
+
+    def __init__(self, rate=SAMPLE_RATE, **config):
+        from pocketsphinx import Decoder  # Loading the acoustic model takes a while, so it happens once
+        self.decoder = Decoder(samprate=rate, **config)
+
+    def start(self):
+        self.decoder.start_utt()
+
+    def feed(self, samples):
+        self.decoder.process_raw(samples.tobytes(), False, False)
+
+    def end(self):
+        self.decoder.end_utt()
+        hypothesis = self.decoder.hyp()
+        return hypothesis.hypstr if hypothesis is not None else ''
+
+
+class MicrophoneSource:
+    """ 16 kHz mono int16 blocks from the default input device. """
+
+    def __init__(self, rate=SAMPLE_RATE, block_ms=30, device=None):
+        self.rate = rate
+        self.block = rate * block_ms // 1000
+        self.device = device
+        self.closed = threading.Event()
+
+    def __iter__(self):
+        import sounddevice
+        with sounddevice.RawInputStream(samplerate=self.rate, blocksize=self.block, channels=1, dtype='int16',
+                                        device=self.device) as stream:
+            while not self.closed.is_set():
+                data, _overflowed = stream.read(self.block)
+                yield np.frombuffer(data, dtype=np.int16)
+
+    def close(self):
+        self.closed.set()
+
+
+class WavSource:
+    """ Blocks from WAV files in place of the microphone, converted to 16 kHz mono. gap seconds of silence follow
+    each file so its last utterance is closed. With realtime=True blocks arrive at the speed they would be spoken.
+    """
+
+    def __init__(self, paths, rate=SAMPLE_RATE, block_ms=30, gap=1.0, realtime=False):
+        self.paths = [paths] if isinstance(paths, str) else list(paths)
+        self.rate = rate
+        self.block = rate * block_ms // 1000
+        self.gap = gap
+        self.realtime = realtime
+        self.closed = threading.Event()
+
+    def __iter__(self):
+        for path in self.paths:
+            with open(path, 'rb') as file:
+                samples, rate = read_wav(file.read())
+            pcm = (np.clip(convert(samples, rate, self.rate, 1)[:, 0], -1.0, 1.0) * 32767).astype(np.int16)
+            pcm = np.concatenate([pcm, np.zeros(int(self.gap * self.rate), dtype=np.int16)])
+            for offset in range(0, len(pcm), self.block):
+                if self.closed.is_set():
+                    return
+                if self.realtime:
+                    time.sleep(self.block / self.rate)
+                yield pcm[offset:offset + self.block]
+
+    def close(self):
+        self.closed.set()
+
+
+class SpeechRecognizer:
+    """ Always-on speech recognition service.
+
+    A background thread reads the source, endpoints the audio and streams each utterance into a decoder that
+    stays loaded, so recognition runs while the user is still talking and finishes right after the endpoint.
+    Utterances addressed to the assistant go into a bounded queue; when the consumer falls behind, the oldest
+    one is dropped rather than stalling the audio. Each queued utterance is a dict with the text, its start
+    and end in stream seconds and latency, the seconds between the endpoint and the text being available.
+    """
+
+    def __init__(self, source, decoder=None, wake_word=DEFAULT_WAKE_WORD, endpointer=None, queue_size=8,
+                 on_speech=None):
+        """ Args:
+            source (iterable): Yields int16 sample blocks, e.g. MicrophoneSource or WavSource.
+            decoder (optional): Object with start(), feed(samples) and end() -> text. Defaults to pocketsphinx.
+            wake_word (str or WakeWord): Wake word, or None to pass every utterance.
+            endpointer (Endpointer, optional): Utterance segmentation.
+            queue_size (int): Utterances waiting for the consumer.
+            on_speech (callable, optional): Called from the recognizer thread with the stream time in seconds as
+                soon as speech starts, before anything is recognized, e.g. to barge in on the assistant.
+        """
+        self.source = source
+        self.decoder = decoder or PocketsphinxDecoder()
+        self.gate = wake_word if isinstance(wake_word, WakeWord) else WakeWord(wake_word)
+        self.endpointer = endpointer or Endpointer()
+        self.on_speech = on_speech
+        self.utterances = queue.Queue(queue_size)
+        self.listening = threading.Event()
+        self.listening.set()
+        self.thread = None
+        self.error = None
+        self.stats = {'utterances': 0, 'accepted': 0, 'ignored': 0, 'dropped': 0}
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+    def run(self):
+        try:
+            for block in self.source:
+                if not self.listening.is_set():
+                    if self.endpointer.in_speech:
+                        self.decoder.end()
+                    self.endpointer.reset()
+                    continue
+                for event in self.endpointer.push(block):
+                    self.handle(*event)
+            for event in self.endpointer.flush():
+                self.handle(*event)
+        except Exception as exc:
+            self.error = exc
+        finally:
+            self.put(None)  # End of input
+
+    def handle(self, kind, audio):
+        if kind == 'start':
+            if self.on_speech is not None:
+                self.on_speech(self.endpointer.position / self.endpointer.rate)
+            self.decoder.start()
+            if len(audio):
+                self.decoder.feed(audio)
+        elif kind == 'speech':
+            self.decoder.feed(audio)
+        else:
+            ended = time.perf_counter()
+            text = self.decoder.end().strip()
+            if audio is None or not text:
+                return
+            self.stats['utterances'] += 1
+            end = self.endpointer.position / self.endpointer.rate
+            command = self.gate(text, end)
+            if command is None:
+                self.stats['ignored'] += 1
+                return
+            self.stats['accepted'] += 1
+            self.put({'text': command, 'start': self.endpointer.start / self.endpointer.rate, 'end': end,
+                      'latency': time.perf_counter() - ended})
+
+    def put(self, utterance):
+        while True:
+            try:
+                self.utterances.put_nowait(utterance)
+                return
+            except queue.Full:
+                try:
+                    self.utterances.get_nowait()
+                    self.stats['dropped'] += 1
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout=None):
+        """ The next utterance, or None once the source has ended. Raises queue.Empty on timeout. """
+        utterance = self.utterances.get(timeout=timeout)
+        if utterance is None:
+            self.utterances.put(None)  # Every later get() sees the end too
+            if self.error is not None:
+                raise self.error
+        return utterance
+
+    def __iter__(self):
+        while True:
+            utterance = self.get()
+            if utterance is None:
+                return
+            yield utterance
+
+    def pause(self):
+        """ Ignore the input, e.g. while the assistant itself is talking. The decoder stays loaded. """
+        self.listening.clear()
+
+    def resume(self):
+        self.listening.set()
+
+    def stop(self):
+        self.source.close()
+        if self.thread is not None:
+            self.thread.join()
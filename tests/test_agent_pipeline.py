@@ -0,0 +1,61 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+import asyncio
+import unittest
+from agent_pipeline import AgentPipeline, score_answer
+from conversation_store import ConversationStore
+
+PROMPTS = {'base': 'BASE', 'refiner': 'REFINER', 'final': 'FINAL'}
+
+def fake_stream(replies, calls, delay=0.001):
+    async def stream(model, messages):
+        system = [message['content'] for message in messages if message['role'] == 'system'][-1]
+        calls.append((system, messages[-1]['content']))
+        for word in replies[system].split(' '):
+            await asyncio.sleep(delay)
+            yield word + ' '
+    return stream
+
+class AgentPipelineTestCase(unittest.TestCase):
+    def test_sequential_pipeline_runs_every_stage(self):
+        calls = []
+        replies = {'BASE': 'draft ' * 20, 'REFINER': 'critique ' * 10, 'FINAL': 'final answer'}
+        pipeline = AgentPipeline('mistral', PROMPTS, speculative=False, stream_fn=fake_stream(replies, calls))
+        result = asyncio.run(pipeline.run('question', ConversationStore()))
+        self.assertEqual(result['final'].strip(), 'final answer')
+        self.assertEqual([system for system, _ in calls], ['BASE', 'REFINER', 'FINAL'])
+        self.assertTrue(calls[1][1].endswith(result['base']))  # Refiner saw the complete draft
+        for timing in result['timings']:
+            self.assertLessEqual(timing['start'], timing['first_token'])
+            self.assertLessEqual(timing['first_token'], timing['end'])
+
+    def test_speculative_refiner_restarts_on_incomplete_draft(self):
+        calls = []
+        replies = {'BASE': 'draft ' * 200, 'REFINER': 'critique ' * 10, 'FINAL': 'final answer'}
+        pipeline = AgentPipeline('mistral', PROMPTS, refiner_start_chars=60, stream_fn=fake_stream(replies, calls))
+        result = asyncio.run(pipeline.run('question', ConversationStore()))
+        refiner_timing = result['timings'][1]
+        self.assertLess(refiner_timing['start'], result['timings'][0]['end'])  # Started while the base streamed
+        self.assertEqual(refiner_timing['restarts'], 1)
+        refiner_inputs = [text for system, text in calls if system == 'REFINER']
+        self.assertTrue(refiner_inputs[-1].endswith(result['base']))
+        self.assertEqual(result['final'].strip(), 'final answer')
+
+    def test_fast_path_skips_refinement(self):
+        calls = []
+        replies = {'BASE': 'The porch light is on.', 'REFINER': 'critique', 'FINAL': 'final'}
+        pipeline = AgentPipeline('mistral', PROMPTS, fast_path=True, stream_fn=fake_stream(replies, calls))
+        result = asyncio.run(pipeline.run('Is the porch light on?', ConversationStore()))
+        self.assertTrue(result['fast_path'])
+        self.assertEqual(result['final'], result['base'])
+        self.assertEqual([system for system, _ in calls], ['BASE'])
+        self.assertTrue(result['timings'][2]['skipped'])
+
+    def test_score_answer_penalizes_hedging(self):
+        self.assertEqual(score_answer('Is the garage door closed?', 'The garage door is closed.'), 1.0)
+        self.assertLess(score_answer('Is the garage door closed?', "I'm not sure whether the garage door is closed."), 0.8)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+import tempfile
+import unittest
+import numpy as np
+from rag.ann import IVFIndex
+from rag.knn import BatchKNN
+from rag.mmap_store import MmapEmbeddingStore
+
+
+def clustered(rng, n, dim=32, clusters=40):
+    centers = rng.standard_normal((clusters, dim))
+    return (centers[rng.integers(0, clusters, n)] + 0.3 * rng.standard_normal((n, dim))).astype(np.float32)
+
+
+class IVFIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.rng = np.random.default_rng(3)
+        self.vectors = clustered(self.rng, 4000)
+        self.ids = [f'chunk-{i}' for i in range(4000)]
+
+    def recall(self, index, queries, k=10, n_probe=None):
+        exact, _ = BatchKNN(self.ids[:len(index)], self.vectors[:len(index)]).search(queries, k=k)
+        found, _ = index.search(queries, k=k, n_probe=n_probe)
+        return np.mean([len(set(a) & set(b)) / k for a, b in zip(found, exact)])
+
+    def test_recall_grows_with_probes(self):
+        index = IVFIndex(n_lists=64)
+        index.add(self.ids, self.vectors)
+        queries = self.vectors[:50] + 0.05
+        self.assertEqual(self.recall(index, queries, n_probe=64), 1.0)  # Probing every list is exact
+        self.assertGreaterEqual(self.recall(index, queries, n_probe=8), self.recall(index, queries, n_probe=1))
+        self.assertGreater(self.recall(index, queries, n_probe=8), 0.9)
+
+    def test_incremental_insert_and_retrain(self):
+        index = IVFIndex(n_lists=16)
+        index.train(self.vectors[:500])
+        for start in range(0, 4000, 250):
+            index.add(self.ids[start:start + 250], self.vectors[start:start + 250])
+        self.assertEqual(len(index), 4000)
+        self.assertEqual(index.search(self.vectors[3999], k=1)[0], [['chunk-3999']])
+        ids, scores = index.search(np.empty((0, 32), dtype=np.float32), k=5)
+        self.assertEqual((ids, scores.shape), ([], (0, 5)))
+        index.retrain()
+        self.assertEqual(sum(size for _, size in index.lists), 4000)
+        empty = IVFIndex()
+        empty.retrain()  # Nothing to train on yet
+        self.assertFalse(empty.trained)
+        self.assertEqual(index.search(self.vectors[3999], k=1)[0], [['chunk-3999']])
+
+    def test_from_store_skips_deleted_rows(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        store = MmapEmbeddingStore(directory.name, dtype='int8')
+        store.append(self.ids[:1000], self.vectors[:1000])
+        store.delete(['chunk-5'])
+        index = IVFIndex.from_store(store, block_size=300)
+        self.assertEqual(len(index), 999)
+        self.assertIsNone(index.vectors)  # Scores are read from the store, not from a copy
+        self.assertEqual(index.search(self.vectors[7], k=1, n_probe=index.n_lists)[0], [['chunk-7']])
+        self.assertNotIn('chunk-5', index.search(self.vectors[5], k=1, n_probe=index.n_lists)[0][0])
+
+
+if __name__ == '__main__':
+    unittest.main()
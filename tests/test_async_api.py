@@ -0,0 +1,64 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+import asyncio
+import unittest
+from rag.async_api import AsyncRAG, RAGService
+from rag.retrieval_cache import StageTimer
+
+
+class FakeChain:
+    def __init__(self, tokens=5, delay=0.01):
+        self.tokens = tokens
+        self.delay = delay
+        self.running = 0
+        self.max_running = 0
+        self.closed = 0
+
+    async def astream(self, question):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            with StageTimer.stage('retrieve'):
+                await asyncio.sleep(self.delay)
+            for i in range(self.tokens):
+                await asyncio.sleep(self.delay)
+                yield f"{question}-{i} "
+        finally:
+            self.running -= 1
+            self.closed += 1
+
+
+class AsyncRAGTestCase(unittest.TestCase):
+    def test_bounded_concurrency_and_timings(self):
+        chain = FakeChain()
+        rag = AsyncRAG(chain, max_concurrency=2)
+
+        async def main():
+            return await asyncio.gather(*(rag.ask(f"q{i}") for i in range(6)))
+
+        results = asyncio.run(main())
+        self.assertEqual(chain.max_running, 2)
+        self.assertEqual(results[3][0], "q3-0 q3-1 q3-2 q3-3 q3-4 ")
+        timings = [timings for _, timings in results]
+        self.assertTrue(all(timing['retrieve'] < timing['first_token'] <= timing['total'] for timing in timings))
+        self.assertGreater(max(timing['queued'] for timing in timings), 0.05)  # Later questions waited for a slot
+        self.assertEqual((rag.metrics['completed'], rag.metrics['in_flight'], rag.metrics['waiting']), (6, 0, 0))
+
+    def test_sync_service_streams_and_cancels(self):
+        chain = FakeChain(tokens=50)
+        service = RAGService(AsyncRAG(chain, max_concurrency=1))
+        try:
+            stream = service.stream("q")
+            self.assertEqual(next(stream), "q-0 ")
+            stream.close()  # Stop reading early, e.g. the user navigated away
+            answer, timings = service.ask("short")
+            self.assertTrue(answer.startswith("short-0"))
+            self.assertEqual(chain.closed, 2)
+        finally:
+            service.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+import unittest
+import numpy as np
+from audio_io import Playback, convert, read_wav, write_wav
+
+def tone(frequency=440.0, rate=16000, seconds=0.5):
+    t = np.arange(int(rate * seconds)) / rate
+    return (0.5 * np.sin(2 * np.pi * frequency * t)).astype(np.float32).reshape(-1, 1)
+
+class AudioIOTestCase(unittest.TestCase):
+    def test_wav_round_trip_in_memory(self):
+        samples = tone()
+        decoded, rate = read_wav(write_wav(samples, 16000))
+        self.assertEqual(rate, 16000)
+        self.assertEqual(decoded.shape, (8000, 1))
+        self.assertLess(np.abs(decoded - samples).max(), 1e-3)
+
+    def test_convert_matches_ffmpeg_layout(self):
+        stereo = convert(tone(), 16000)  # What `ffmpeg -ac 2 -ar 44100` produced from pico2wave's 16 kHz mono
+        self.assertEqual(stereo.shape, (22050, 2))
+        self.assertEqual(stereo.dtype, np.float32)
+        np.testing.assert_array_equal(stereo[:, 0], stereo[:, 1])
+        spectrum = np.abs(np.fft.rfft(stereo[:, 0]))
+        self.assertAlmostEqual(np.argmax(spectrum) * 44100 / len(stereo), 440.0, delta=2.0)
+        np.testing.assert_allclose(convert(stereo, 44100, channels=1)[:, 0], stereo[:, 0])
+
+    def test_playback_stops_within_one_block(self):
+        playback = Playback(convert(tone(seconds=2.0), 16000))
+        out = np.empty((1024, 2), dtype=np.float32)
+        self.assertTrue(playback.fill(out))
+        self.assertGreater(np.abs(out).max(), 0.4)
+        playback.cancel()
+        self.assertFalse(playback.fill(out))
+        self.assertEqual(np.abs(out).max(), 0.0)
+        self.assertEqual(playback.position, 1024)
+        short = Playback(np.ones((100, 2), dtype=np.float32))
+        self.assertFalse(short.fill(out))
+        self.assertEqual(out[100:].max(), 0.0)  # The tail of the last block is silence
@@ -0,0 +1,59 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+import tempfile
+import unittest
+import numpy as np
+from rag.bm25 import BM25Index, HybridSearch, reciprocal_rank_fusion, tokenize
+
+DOCS = {
+    'e42': "Error E-42 means the bridge lost its network connection. Restart the router.",
+    'hue': "Pair the Hue bridge v2 by pressing the link button on top of the bridge.",
+    'nest': "The Nest thermostat shows a blinking light while its firmware updates.",
+    'reset': "To reset the bridge hold the button for ten seconds until the light blinks.",
+}
+
+
+class BM25IndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.index = BM25Index()
+        self.index.add(list(DOCS), list(DOCS.values()))
+
+    def test_codes_and_device_names(self):
+        self.assertIn('e-42', tokenize('E-42'))
+        self.assertIn('e42', tokenize('E-42'))
+        self.assertEqual(self.index.search('what does e42 mean', k=1)[0][0], 'e42')
+        self.assertEqual(self.index.search('Hue bridge v2 pairing', k=1)[0][0], 'hue')
+        self.assertEqual(self.index.search('dishwasher'), [])
+
+    def test_incremental_add_delete_and_reload(self):
+        self.index.search('bridge')  # Merges the pending documents
+        self.index.add(['e42'], ["Error E-42 is fixed in firmware 2.1"])  # Replaces the old text
+        self.index.delete(['nest'])
+        self.assertEqual([chunk_id for chunk_id, _ in self.index.search('firmware')], ['e42'])
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'bm25.npz')
+            self.index.save(path)
+            loaded = BM25Index.load(path)
+        self.assertEqual(loaded.search('firmware'), self.index.search('firmware'))
+        self.assertEqual(len(loaded), 3)
+        stats = loaded.stats()
+        self.assertLess(stats['bytes'], 8 * stats['postings'] + 8 * stats['terms'] + 8 * 16)
+
+    def test_fusion(self):
+        fused = reciprocal_rank_fusion([['a', 'b', 'c'], ['b', 'd']])
+        self.assertEqual([chunk_id for chunk_id, _ in fused][:2], ['b', 'a'])
+        vectors = {'e42': [1.0, 0.0], 'hue': [0.0, 1.0], 'nest': [0.7, 0.7], 'reset': [0.9, 0.1]}
+
+        def vector_search(queries, k):
+            ids = sorted(vectors, key=lambda chunk_id: -float(np.dot(vectors[chunk_id], queries[0])))[:k]
+            return [ids], None
+
+        hybrid = HybridSearch(self.index, vector_search, embed_fn=lambda text: [1.0, 0.0], candidates=3)
+        results = hybrid.search('E-42', k=2)
+        self.assertEqual(results[0][0], 'e42')  # First on both sides
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+import tempfile
+import unittest
+from chat_log import ChatLog
+from chat_catalog import ChatCatalog
+
+class ChatCatalogTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_listing_is_time_ordered_and_paginated(self):
+        catalog = ChatCatalog(self.tmpdir.name)
+        for i in range(5):
+            catalog.upsert(f'id{i}', [{'role': 'user', 'content': f'Question {i}'}], model='mistral', updated_at=100 + i)
+        catalog.upsert('id0', [{'role': 'user', 'content': 'Question 0'}, {'role': 'assistant', 'content': 'A'}], updated_at=200)
+
+        first_page = catalog.list_chats(limit=2, offset=0)
+        self.assertEqual([entry['chat_id'] for entry in first_page], ['id0', 'id4'])
+        self.assertEqual(first_page[0]['message_count'], 2)
+        self.assertEqual(first_page[0]['model'], 'mistral')  # Kept when the update doesn't name a model
+        self.assertEqual(first_page[0]['created_at'], 100)
+        self.assertEqual([entry['chat_id'] for entry in catalog.list_chats(limit=2, offset=2)], ['id3', 'id2'])
+        self.assertEqual(catalog.count(), 5)
+
+        catalog.delete('id4')
+        self.assertIsNone(catalog.get('id4'))
+        self.assertEqual(catalog.count(), 4)
+
+    def test_title_comes_from_first_user_message(self):
+        catalog = ChatCatalog(self.tmpdir.name, title_length=10)
+        catalog.upsert('x', [{'role': 'system', 'content': 'Persona'}, {'role': 'user', 'content': 'Turn   off the kitchen lights'}])
+        self.assertEqual(catalog.get('x')['title'], 'Turn off…')
+
+    def test_existing_chat_files_are_indexed_on_first_open(self):
+        history = [{'role': 'user', 'content': 'Hello'}, {'role': 'assistant', 'content': 'Hi'}]
+        ChatLog(os.path.join(self.tmpdir.name, 'chat_abc.json')).save(history)
+        catalog = ChatCatalog(self.tmpdir.name)
+        entry = catalog.get('abc')
+        self.assertEqual(entry['message_count'], 2)
+        self.assertEqual(entry['title'], 'Hello')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+import json
+import tempfile
+import unittest
+from chat_log import ChatLog
+
+class ChatLogTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'chat_test.json')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_save_appends_only_new_messages(self):
+        log = ChatLog(self.path)
+        history = [{'role': 'user', 'content': 'Hello'}]
+        log.save(history)
+        self.assertTrue(os.path.exists(self.path))
+        history.append({'role': 'assistant', 'content': 'Hi'})
+        log.save(history)
+        with open(log.journal_path) as file:
+            lines = file.readlines()
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(json.loads(lines[0]), {'i': 1, 'message': history[1]})
+        self.assertEqual(ChatLog(self.path).load(), history)
+
+    def test_compaction_folds_journal_into_snapshot(self):
+        log = ChatLog(self.path, compact_every=2)
+        history = []
+        for i in range(5):
+            history.append({'role': 'user', 'content': str(i)})
+            log.save(history)
+        with open(self.path) as file:
+            self.assertEqual(json.load(file), history)
+        self.assertEqual(ChatLog(self.path).load(), history)
+
+    def test_torn_journal_line_is_dropped(self):
+        log = ChatLog(self.path)
+        history = [{'role': 'user', 'content': 'Hello'}, {'role': 'assistant', 'content': 'Hi'}]
+        log.save(history[:1])
+        log.save(history)
+        with open(log.journal_path, 'a') as file:
+            file.write('{"i": 2, "message": {"role": "us')
+        reloaded = ChatLog(self.path)
+        self.assertEqual(reloaded.load(), history)
+        history.append({'role': 'user', 'content': 'Again'})
+        reloaded.save(history)
+        self.assertEqual(ChatLog(self.path).load(), history)
+
+    def test_reset_rewrites_history(self):
+        log = ChatLog(self.path)
+        log.save([{'role': 'user', 'content': 'a'}, {'role': 'assistant', 'content': 'b'}])
+        log.reset()
+        history = [{'role': 'user', 'content': 'c'}, {'role': 'assistant', 'content': 'd'}, {'role': 'user', 'content': 'e'}]
+        log.save(history)
+        self.assertEqual(ChatLog(self.path).load(), history)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+import unittest
+from context_window import ContextWindow, TokenCounter, SUMMARY_PREFIX
+
+def make_history(turns, words=50):
+    history = [{'role': 'system', 'content': 'You are a helpful assistant.'}]
+    for i in range(turns):
+        history.append({'role': 'user', 'content': f'question {i} ' + 'word ' * words})
+        history.append({'role': 'assistant', 'content': f'answer {i} ' + 'word ' * words})
+    history.append({'role': 'user', 'content': 'latest question'})
+    return history
+
+class ContextWindowTestCase(unittest.TestCase):
+    def test_short_history_is_sent_unchanged(self):
+        history = make_history(2, words=5)
+        messages, report = ContextWindow(budget=1000).fit(history, 'mistral')
+        self.assertEqual(messages, history)
+        self.assertEqual(report['saved_tokens'], 0)
+
+    def test_long_history_keeps_system_prompt_and_recent_turns(self):
+        history = make_history(40)
+        window = ContextWindow(budget=400)
+        messages, report = window.fit(history, 'mistral')
+        self.assertEqual(messages[0], history[0])
+        self.assertEqual(messages[-1], history[-1])
+        self.assertEqual(messages[1]['role'], 'user')  # Window opens on a question, not an orphaned answer
+        self.assertEqual(messages[1:], history[len(history) - len(messages) + 1:])
+        self.assertLessEqual(report['sent_tokens'], 400)
+        self.assertEqual(report['saved_tokens'], report['original_tokens'] - report['sent_tokens'])
+        self.assertGreater(report['dropped_messages'], 0)
+
+    def test_summary_is_cached_and_extended(self):
+        calls = []
+        def summarizer(messages, previous_summary, model):
+            calls.append((len(messages), previous_summary))
+            return f'summary of {len(messages)}'
+        window = ContextWindow(budget=600, summarizer=summarizer, summary_tokens=50)
+        history = make_history(20)
+        messages, report = window.fit(history, 'mistral')
+        self.assertTrue(report['summarized'])
+        self.assertTrue(messages[1]['content'].startswith(SUMMARY_PREFIX))
+        window.fit(history, 'mistral')
+        self.assertEqual(len(calls), 1)  # Same dropped prefix, served from cache
+
+        for i in range(10):  # Grow the conversation until the window has to move
+            history[-1]['content'] = f'follow-up {i} ' + 'word ' * 50
+            history.append({'role': 'assistant', 'content': f'reply {i} ' + 'word ' * 50})
+            history.append({'role': 'user', 'content': 'newest question'})
+            window.fit(history, 'mistral')
+        self.assertGreater(len(calls), 1)
+        self.assertEqual(calls[1][1], f'summary of {calls[0][0]}')  # Extends the cached summary with the newly dropped messages
+
+    def test_window_start_is_stable_across_turns(self):
+        window = ContextWindow(budget=600)
+        history = make_history(20)
+        first, _ = window.fit(history, 'mistral')
+        history[-1]['content'] = 'short follow-up'
+        history.append({'role': 'assistant', 'content': 'short reply'})
+        history.append({'role': 'user', 'content': 'another question'})
+        second, report = window.fit(history, 'mistral')
+        self.assertEqual(second[:len(first) - 1], first[:-1])  # Same prefix, only new messages appended
+        self.assertLessEqual(report['sent_tokens'], 600)
+
+    def test_counter_calibrates_from_server_counts(self):
+        counter = TokenCounter(smoothing=1.0)
+        messages = [{'role': 'user', 'content': 'x' * 400}]
+        counter.observe('mistral', messages, 104)
+        self.assertAlmostEqual(counter.ratio('mistral'), 4.0)
+        counter.observe('mistral', messages, 3)  # Prompt cache hit, ignored
+        self.assertAlmostEqual(counter.ratio('mistral'), 4.0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+import asyncio
+import unittest
+from agent_pipeline import AgentPipeline
+from context_window import TokenCounter
+from conversation_store import ConversationStore
+
+PROMPTS = {'base': 'BASE', 'refiner': 'REFINER', 'final': 'FINAL'}
+
+class ConversationStoreTestCase(unittest.TestCase):
+    def test_dialogue_holds_only_questions_and_final_answers(self):
+        store = ConversationStore()
+        store.add_turn('Turn on the lights', 'Done.', base='draft', refiner='critique')
+        self.assertEqual(store.messages(), [
+            {'role': 'user', 'content': 'Turn on the lights'},
+            {'role': 'assistant', 'content': 'Done.'},
+        ])
+        self.assertEqual(store.scratch[-1]['refiner'], 'critique')
+        view = store.base_view('BASE', 'And the fan?', 'mistral')
+        self.assertEqual([message['role'] for message in view], ['system', 'user', 'assistant', 'user'])
+        self.assertEqual(store.refiner_view('REFINER', 'q', 'draft')[0], {'role': 'system', 'content': 'REFINER'})
+
+    def test_prompt_size_per_turn_stays_bounded(self):
+        budget = 800
+        counter = TokenCounter()
+        prompt_tokens = {'BASE': [], 'REFINER': [], 'FINAL': []}
+
+        async def stream(model, messages):
+            system = messages[0]['content']
+            prompt_tokens[system].append(counter.count(messages, model))
+            yield f'{system.lower()} reply ' + 'word ' * 60
+
+        store = ConversationStore(budget=budget, counter=counter)
+        pipeline = AgentPipeline('mistral', PROMPTS, speculative=False, stream_fn=stream)
+
+        async def converse():
+            for turn in range(40):
+                question = f'question {turn} ' + 'word ' * 20
+                result = await pipeline.run(question, store)
+                pipeline.commit(question, store, result)
+
+        asyncio.run(converse())
+        self.assertEqual(len(store.messages()), 80)
+        for stage, counts in prompt_tokens.items():
+            self.assertEqual(len(counts), 40)
+            self.assertLessEqual(max(counts), budget, stage)
+        self.assertGreater(max(prompt_tokens['BASE']), budget // 2)  # The dialogue did fill the window
+        self.assertLessEqual(max(prompt_tokens['REFINER']) - min(prompt_tokens['REFINER']), 2)  # Independent of history
+
+    def test_final_view_keeps_the_question_when_draft_and_critique_are_long(self):
+        counter = TokenCounter()
+        store = ConversationStore(budget=300, counter=counter)
+        store.add_turn('Earlier question', 'Earlier answer')
+        question = 'Which lights are still on?'
+        view = store.final_view('FINAL', question, 'draft ' * 400, 'critique ' * 100, 'mistral')
+        self.assertEqual([message['role'] for message in view], ['system', 'user', 'assistant', 'user'])
+        self.assertEqual(view[1]['content'], question)
+        self.assertTrue(view[2]['content'].endswith('…'))  # The longer draft was cut
+        self.assertLessEqual(counter.count(view, 'mistral'), 300)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+import asyncio
+import unittest
+import httpx
+from rag.embedding_pipeline import EmbeddingPipeline
+
+
+class FakeEmbedder:
+    def __init__(self, failures=0, status=503):
+        self.failures = failures
+        self.status = status
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.calls = 0
+
+    async def __call__(self, texts):
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0.01)
+            if self.failures:
+                self.failures -= 1
+                request = httpx.Request('POST', 'http://stub/api/embed')
+                raise httpx.HTTPStatusError('busy', request=request, response=httpx.Response(self.status, request=request))
+            return [[float(len(text))] for text in texts]
+        finally:
+            self.in_flight -= 1
+
+
+class EmbeddingPipelineTestCase(unittest.TestCase):
+    def test_batches_with_bounded_concurrency(self):
+        embedder = FakeEmbedder()
+        pipeline = EmbeddingPipeline(batch_size=4, max_concurrency=2, embed_batch=embedder)
+        stored = {}
+
+        def sink(ids, texts, metadatas, vectors):
+            stored.update(zip(ids, vectors))
+
+        items = ((str(i), 'x' * i, None) for i in range(10))
+        stats = pipeline.run_sync(items, sink)
+        self.assertEqual(stats['chunks'], 10)
+        self.assertEqual(embedder.calls, 3)
+        self.assertLessEqual(embedder.max_in_flight, 2)
+        self.assertEqual(stored['7'], [7.0])
+
+    def test_retries_then_reports_failed_batches(self):
+        pipeline = EmbeddingPipeline(batch_size=8, max_retries=2, backoff=0.001, embed_batch=FakeEmbedder(failures=2))
+        self.assertEqual(pipeline.embed_texts(['ab', 'abc']), [[2.0], [3.0]])
+
+        pipeline = EmbeddingPipeline(batch_size=8, max_retries=2, backoff=0.001, embed_batch=FakeEmbedder(failures=1, status=400))
+        stats = pipeline.run_sync([('a', 'text', None)], lambda *batch: None)
+        self.assertEqual(stats['failed_batches'], 1)  # Client errors are not retried
+        self.assertEqual(stats['retries'], 0)
+
+    def test_unexpected_embedder_errors_are_raised(self):
+        async def malformed(texts):
+            return {}['embeddings']  # A response without the expected field
+
+        pipeline = EmbeddingPipeline(batch_size=2, embed_batch=malformed)
+        items = [(str(i), 'text', None) for i in range(5)]
+        with self.assertRaises(KeyError):  # Instead of waiting for the producer forever
+            asyncio.run(asyncio.wait_for(pipeline.run(items, lambda *batch: None), timeout=5))
+
+
+if __name__ == '__main__':
+    unittest.main()
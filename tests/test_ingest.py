@@ -0,0 +1,58 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+import tempfile
+import unittest
+from rag.ingest import PDFIngestor, find_pdfs
+
+
+def fake_count(path):
+    if 'unreadable' in path:
+        raise ValueError('not a PDF')
+    return 10
+
+
+def fake_parse(path, start, stop):
+    if 'broken' in path and start >= 4:
+        raise RuntimeError('bad page')
+    return [(number, f'{os.path.basename(path)} page {number}') for number in range(start, stop)]
+
+
+class PDFIngestorTestCase(unittest.TestCase):
+    def test_find_pdfs(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        directory = directory.name
+        os.makedirs(os.path.join(directory, 'manuals'))
+        for name in ('b.pdf', 'manuals/a.PDF', 'notes.txt'):
+            open(os.path.join(directory, name), 'w').close()
+        self.assertEqual([os.path.relpath(path, directory) for path in find_pdfs(directory)], ['b.pdf', 'manuals/a.PDF'])
+
+    def test_failed_files_do_not_abort_the_run(self):
+        paths = ['hue.pdf', 'unreadable.pdf', 'broken.pdf', 'nest.pdf']
+        for workers in (0, 2):
+            with self.subTest(workers=workers):
+                ingestor = PDFIngestor(workers=workers, window=2, pages_per_task=3, parse_fn=fake_parse, count_fn=fake_count)
+                pages = list(ingestor.pages(paths))
+                good = sorted((path, number) for path, number, _ in pages if path in ('hue.pdf', 'nest.pdf'))
+                self.assertEqual(good, sorted((path, number) for path in ('hue.pdf', 'nest.pdf') for number in range(10)))
+                self.assertEqual(sorted(ingestor.stats['errors']), ['broken.pdf', 'unreadable.pdf'])
+                report = ingestor.report()
+                self.assertEqual((report['files'], report['failed']), (2, 2))
+                self.assertGreater(report['pages_per_second'], 0)
+
+    def test_pages_are_pulled_lazily(self):
+        calls = []
+
+        def parse(path, start, stop):
+            calls.append(start)
+            return fake_parse(path, start, stop)
+
+        pages = PDFIngestor(workers=0, pages_per_task=2, parse_fn=parse, count_fn=fake_count).pages(['hue.pdf'])
+        next(pages)
+        self.assertEqual(calls, [0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+import unittest
+from intent_router import EmbeddingClassifier, Intent, IntentRouter
+
+INTENTS_PATH = os.path.join(os.path.dirname(__file__), '..', 'configs', 'intents.yaml')
+SLOTS = {'room': ['kitchen', 'living room', 'bedroom'], 'state': ['on', 'off'], 'level': r'\d{1,3}'}
+
+def fake_embed(text):
+    # Bag of words over a tiny vocabulary, enough to make paraphrases similar
+    vocabulary = ['lights', 'lamp', 'on', 'off', 'kill', 'dim', 'percent', 'weather', 'rain']
+    words = text.lower().split()
+    return [float(words.count(word)) for word in vocabulary] + [0.01]
+
+class IntentRouterTestCase(unittest.TestCase):
+    def test_shipped_intents_answer_commands_with_slots(self):
+        router = IntentRouter.from_config(INTENTS_PATH)
+        routed = router.route("Can you switch the living room lamp off, please?")
+        self.assertEqual((routed['intent'], routed['route']), ('lights', 'pattern'))
+        self.assertEqual(routed['slots'], {'room': 'living room', 'state': 'off'})
+        self.assertEqual(routed['response'], "Turning the living room lights off.")
+        self.assertEqual(router.route("dim the bedroom lights to 30%")['slots'], {'room': 'bedroom', 'level': '30'})
+        self.assertEqual(router.route("Set the thermostat to 21.5 degrees.")['slots'], {'temperature': '21.5'})
+        self.assertEqual(router.route("what time is it")['intent'], 'time')
+
+    def test_anything_else_falls_through_to_the_model(self):
+        actions = []
+        router = IntentRouter.from_config(INTENTS_PATH, on_action=lambda intent, slots: actions.append(intent))
+        self.assertIsNone(router.route("tell me a joke about lights"))
+        self.assertIsNone(router.route("turn on the kitchen lights and play some jazz"))  # Only whole matches count
+        self.assertIsNone(router.route("turn on the attic lights"))  # Unknown room
+        router.route("lock the front door")
+        self.assertEqual(actions, ['door'])
+        stats = router.stats()
+        self.assertEqual((stats['requests'], stats['pattern_hits'], stats['fallthrough']), (4, 1, 3))
+        self.assertAlmostEqual(stats['hit_rate'], 0.25)
+
+    def test_embedding_classifier_catches_paraphrases(self):
+        lights = Intent('lights', patterns=["turn {state} the {room} lights"], response="Turning the {room} lights {state}.",
+                        examples=["turn on the kitchen lights", "kill the lights", "lights off in the bedroom"], slots=SLOTS)
+        brightness = Intent('brightness', response="Setting the {room} lights to {level} percent.", slots=SLOTS,
+                            examples=["dim the kitchen lights to 30 percent", "dim the lamp"])
+        intents = [lights, brightness]
+        router = IntentRouter(intents, classifier=EmbeddingClassifier(intents, fake_embed, threshold=0.8))
+        routed = router.route("kitchen lights off now")
+        self.assertEqual((routed['intent'], routed['route']), ('lights', 'embedding'))
+        self.assertEqual(routed['response'], "Turning the kitchen lights off.")
+        self.assertIsNone(router.route("lights off"))  # Close to an example, but the room is missing
+        self.assertIsNone(router.route("will it rain"))  # Not close to any example
+        self.assertEqual(router.stats()['embedding_hits'], 1)
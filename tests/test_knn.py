@@ -0,0 +1,47 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+import unittest
+import numpy as np
+from rag.knn import BatchKNN, normalize_rows
+
+
+class BatchKNNTestCase(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        self.vectors = rng.standard_normal((500, 16)).astype(np.float32)
+        self.ids = [f'chunk-{i}' for i in range(500)]
+        self.metadatas = [{'source': 'a.pdf' if i % 2 else 'b.pdf', 'page': i // 10} for i in range(500)]
+
+    def exact(self, queries, rows, k):
+        scores = normalize_rows(queries) @ normalize_rows(self.vectors[rows]).T
+        return [[self.ids[rows[j]] for j in np.argsort(-row)[:k]] for row in scores]
+
+    def test_matches_brute_force_across_blocks(self):
+        queries = self.vectors[:8] + 0.1
+        knn = BatchKNN(self.ids, self.vectors, self.metadatas, block_size=64)
+        ids, scores = knn.search(queries, k=5)
+        self.assertEqual(ids, self.exact(queries, np.arange(500), 5))
+        self.assertEqual(scores.shape, (8, 5))
+        self.assertTrue(np.all(np.diff(scores, axis=1) <= 0))
+
+    def test_metadata_prefilter(self):
+        knn = BatchKNN(self.ids, self.vectors, self.metadatas, block_size=64)
+        ids, _ = knn.search(self.vectors[:4], k=3, where={'source': 'a.pdf'})
+        self.assertEqual(ids, self.exact(self.vectors[:4], np.arange(1, 500, 2), 3))
+        ids, scores = knn.search(self.vectors[0], k=5, where=lambda metadata: metadata['page'] == 0 and metadata['source'] == 'b.pdf')
+        self.assertEqual(scores.shape, (1, 5))
+        ids, scores = knn.search(self.vectors[0], k=5, where={'source': 'missing.pdf'})
+        self.assertEqual((ids, scores.shape), ([[]], (1, 0)))
+
+    def test_incremental_add(self):
+        knn = BatchKNN()
+        knn.add(self.ids[:250], self.vectors[:250])
+        knn.add(self.ids[250:], self.vectors[250:])
+        ids, _ = knn.search(self.vectors[400], k=1)
+        self.assertEqual(ids, [['chunk-400']])
+
+
+if __name__ == '__main__':
+    unittest.main()
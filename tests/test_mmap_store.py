@@ -0,0 +1,68 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+import tempfile
+import unittest
+import numpy as np
+from rag.knn import BatchKNN
+from rag.mmap_store import MmapEmbeddingStore
+
+
+class MmapEmbeddingStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = self.temporary_directory()
+        rng = np.random.default_rng(2)
+        self.vectors = rng.standard_normal((300, 32)).astype(np.float32)
+        self.ids = [f'chunk-{i}' for i in range(300)]
+        self.metadatas = [{'source': f'manual-{i % 3}.pdf'} for i in range(300)]
+
+    def temporary_directory(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        return directory.name
+
+    def filled(self, dtype):
+        store = MmapEmbeddingStore(self.directory, dtype=dtype)
+        for start in range(0, 300, 100):
+            store.append(self.ids[start:start + 100], self.vectors[start:start + 100], self.metadatas[start:start + 100])
+        return store
+
+    def test_reopen_and_search_match_exact(self):
+        for dtype in ('float16', 'int8'):
+            with self.subTest(dtype=dtype):
+                self.directory = self.temporary_directory()
+                self.filled(dtype).close()
+                store = MmapEmbeddingStore(self.directory)
+                self.assertEqual((len(store), store.vectors.dtype), (300, np.dtype(dtype)))
+                self.assertIsInstance(store.vectors[10:20], np.memmap)  # Slices are views of the file
+                ids, scores = store.search(self.vectors[:5], k=3)
+                exact, _ = BatchKNN(self.ids, self.vectors).search(self.vectors[:5], k=3)
+                self.assertEqual([row[0] for row in ids], [row[0] for row in exact])
+                self.assertTrue(np.allclose(scores[:, 0], 1.0, atol=0.01))
+                self.assertTrue(np.allclose(store.get(['chunk-7'])[0] @ self.vectors[7] / np.linalg.norm(self.vectors[7]), 1.0, atol=0.01))
+
+    def test_filter_and_tombstones(self):
+        store = self.filled('float16')
+        ids, _ = store.search(self.vectors[1], k=5, where={'source': 'manual-1.pdf'})
+        self.assertTrue(all(int(chunk_id.split('-')[1]) % 3 == 1 for chunk_id in ids[0]))
+        store.delete(['chunk-1'])
+        ids, _ = store.search(self.vectors[1], k=1)
+        self.assertNotEqual(ids, [['chunk-1']])
+        store.append(['chunk-1'], self.vectors[1:2])  # Re-adding an id replaces its row
+        self.assertEqual(store.search(self.vectors[1], k=1)[0], [['chunk-1']])
+        self.assertEqual(len(store.live_rows()), 300)
+
+    def test_interrupted_append_is_ignored(self):
+        store = self.filled('float16')
+        with open(store.vectors_path, 'ab') as file:
+            file.write(b'\0' * 50)  # Vectors written but header not updated
+        store = MmapEmbeddingStore(self.directory)
+        self.assertEqual(len(store), 300)
+        store.append(['new'], self.vectors[:1])
+        self.assertEqual(os.path.getsize(store.vectors_path), 301 * 32 * 2)
+        self.assertEqual(sorted(store.search(self.vectors[0], k=2)[0][0]), ['chunk-0', 'new'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+import json
+import tempfile
+import unittest
+from model_registry import AUTO, ModelRegistry, ModelRouter, complexity, unsure_reason
+
+MODELS_PATH = os.path.join(os.path.dirname(__file__), '..', 'configs', 'models.yaml')
+MODELS = {
+    'small:q4': {'tier': 1, 'first_token': 0.1, 'tokens_per_second': 60, 'cost': 1, 'context': 2048},
+    'medium:fp16': {'tier': 2, 'first_token': 0.3, 'tokens_per_second': 25, 'cost': 3, 'context': 8192},
+    'coder:fp16': {'tier': 2, 'first_token': 0.3, 'tokens_per_second': 20, 'cost': 3, 'context': 8192, 'strengths': ['code']},
+    'large:latest': {'tier': 3, 'first_token': 1.0, 'tokens_per_second': 12, 'cost': 8, 'context': 32768},
+    'manual:13b': {'tier': 1, 'first_token': 0.05, 'tokens_per_second': 90, 'cost': 1, 'context': 4096, 'auto': False},
+}
+
+class ModelRegistryTestCase(unittest.TestCase):
+    def test_shipped_registry_lists_every_model_once(self):
+        registry = ModelRegistry.from_config(MODELS_PATH)
+        menu = registry.menu()
+        self.assertEqual(list(menu), list(range(1, len(registry.models) + 1)))
+        self.assertIn('gemma:7b-instruct-v1.1-fp16', menu.values())  # Lost to a duplicate key in the old chat.py list
+        self.assertIn(registry.default, menu.values())
+        self.assertEqual(registry.select('1'), menu[1])
+        self.assertEqual(registry.select('auto'), AUTO)
+        self.assertEqual(registry.select('llama3:8b'), 'llama3:8b')
+        self.assertEqual(registry.select('mixtral please'), registry.default)
+
+    def test_router_picks_by_complexity_code_and_context(self):
+        router = ModelRouter(ModelRegistry(MODELS), log_path=None)
+        self.assertLess(complexity("turn on the hallway light"), complexity("Explain why my heat pump short-cycles and compare fixes."))
+        self.assertEqual(router.choose("What's the weather like?")['model'], 'small:q4')
+        self.assertEqual(router.choose("Explain why the heat pump short-cycles and compare the fixes.")['model'], 'medium:fp16')
+        self.assertEqual(router.choose("Why does this fail?\n```\ndef f(x):\n    return x +\n```")['model'], 'coder:fp16')
+        long_context = [{'role': 'user', 'content': 'word ' * 3000}]
+        self.assertEqual(router.choose("And the kitchen?", long_context)['model'], 'medium:fp16')  # Too long for small:q4
+        self.assertNotIn('manual:13b', router.stats()['models'])  # Only in the menu, never routed to
+
+    def test_unsure_answers_escalate_and_decisions_are_logged(self):
+        with tempfile.TemporaryDirectory() as directory:
+            log_path = os.path.join(directory, 'routing.jsonl')
+            router = ModelRouter(ModelRegistry(MODELS), log_path=log_path)
+            question = "What is the capital of Burkina Faso?"
+            decision = router.choose(question)
+            self.assertIsNone(router.escalate(decision, "The capital of Burkina Faso is Ouagadougou."))
+            self.assertIsNone(router.escalate(decision, "Ouagadougou."))  # Short and shares no word with the question
+            self.assertIsNone(decision['unsure'])
+            self.assertEqual(unsure_reason(" "), "empty answer")
+            self.assertEqual(unsure_reason("The capital is", truncated=True), "answer cut off")
+            self.assertIsNone(unsure_reason("It depends on the thermostat mode: in heat mode it holds 21°C."))
+            self.assertIsNone(unsure_reason("Hold the button until the light blinks. If it doesn't, I can't see the hub."))
+            self.assertEqual(unsure_reason("It depends."), "hedged ('it depends')")
+            self.assertEqual(unsure_reason("I can't control that device."), "hedged ('i can't')")
+            self.assertEqual(unsure_reason("Probably Paris, but I’m not sure."), "hedged ('i'm not sure')")
+            escalated = router.escalate(decision, "I'm not sure.")
+            self.assertEqual((escalated['model'], escalated['escalated_from']), ('medium:fp16', 'small:q4'))
+            top = router.escalate(router.escalate(escalated, "I don't know."), "I don't know.")
+            self.assertIsNone(top)  # Nothing above the large model
+            with open(log_path) as file:
+                logged = [json.loads(line) for line in file]
+        self.assertEqual([entry['model'] for entry in logged], ['small:q4', 'medium:fp16', 'large:latest'])
+        self.assertEqual(router.stats()['escalations'], 2)
@@ -0,0 +1,42 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+import unittest
+from ollama_session import OllamaSession, get_client, get_session
+
+class FakeClient:
+    def __init__(self):
+        self.requests = []
+
+    def chat(self, **kwargs):
+        self.requests.append(kwargs)
+        chunks = [
+            {'message': {'content': 'Hi'}, 'done': False},
+            {'message': {'content': ''}, 'done': True, 'load_duration': 2_000_000_000,
+             'prompt_eval_count': 12, 'prompt_eval_duration': 300_000_000, 'eval_count': 1, 'eval_duration': 10_000_000},
+        ]
+        return iter(chunks) if kwargs['stream'] else chunks[-1]
+
+class OllamaSessionTestCase(unittest.TestCase):
+    def test_sessions_share_one_client_per_host(self):
+        self.assertIs(get_session('mistral'), get_session('mistral'))
+        self.assertIs(get_session('mistral').client, get_session('mixtral').client)
+        self.assertIs(get_client(), get_session('mistral').client)
+
+    def test_requests_carry_keep_alive_and_record_metrics(self):
+        session = OllamaSession('mistral', keep_alive=-1)
+        session.client = FakeClient()
+        messages = [{'role': 'system', 'content': 'Persona'}, {'role': 'user', 'content': 'Hello'}]
+        self.assertEqual(''.join(chunk['message']['content'] for chunk in session.chat(messages)), 'Hi')
+        self.assertEqual(session.client.requests[0]['keep_alive'], -1)
+        self.assertTrue(session.last_metrics['cold_load'])
+        self.assertAlmostEqual(session.last_metrics['prompt_eval_duration'], 0.3)
+        self.assertEqual(session.last_metrics['shared_prefix_messages'], 0)
+
+        session.chat(messages + [{'role': 'assistant', 'content': 'Hi'}, {'role': 'user', 'content': 'Again'}], stream=False)
+        self.assertEqual(session.last_metrics['shared_prefix_messages'], 2)
+        self.assertEqual(len(session.metrics), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+import shutil
+import tempfile
+import unittest
+from rag.embedding_pipeline import EmbeddingPipeline
+from rag.ingest import PDFIngestor
+from rag.persistent_index import PersistentIndex
+
+
+class FakeCollection:
+    def __init__(self):
+        self.rows = {}
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        self.rows.update({chunk_id: document for chunk_id, document in zip(ids, documents)})
+
+    def count(self):
+        return len(self.rows)
+
+
+class FakeVectorDB:
+    """ The parts of langchain's Chroma wrapper PersistentIndex uses. """
+    def __init__(self):
+        self._collection = FakeCollection()
+
+    def delete(self, ids):
+        for chunk_id in ids:
+            self._collection.rows.pop(chunk_id, None)
+
+
+class FakeEmbedder:
+    def __init__(self):
+        self.texts = []
+
+    async def __call__(self, texts):
+        self.texts += texts
+        return [[float(len(text)), 1.0] for text in texts]
+
+
+def count_lines(path):
+    with open(path) as file:
+        return len(file.read().splitlines())
+
+
+def parse_lines(path, start, stop):
+    """ Every line of a text file is a page; a file with a BROKEN line cannot be parsed. """
+    with open(path) as file:
+        lines = file.read().splitlines()
+    if 'BROKEN' in lines:
+        raise ValueError('unreadable')
+    return list(enumerate(lines))[start:stop]
+
+
+class PersistentIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.embedder = FakeEmbedder()
+
+    def open(self, collection_name='manuals'):
+        return PersistentIndex(os.path.join(self.directory, 'index'), collection_name=collection_name,
+                               pipeline=EmbeddingPipeline(embed_batch=self.embedder), vector_db=FakeVectorDB(),
+                               embeddings=object())
+
+    def ingest(self, index, paths, prune=False):
+        ingestor = PDFIngestor(workers=0, parse_fn=parse_lines, count_fn=count_lines)
+        return index.ingest(paths, ingestor=ingestor, prune=prune)
+
+    def write(self, name, *lines):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as file:
+            file.write('\n'.join(lines))
+        return path
+
+    def test_only_changed_chunks_are_embedded_across_restarts(self):
+        hue = self.write('hue.txt', 'press the button', 'wait for the light')
+        nest = self.write('nest.txt', 'open the app')
+        report = self.ingest(self.open(), [hue, nest])
+        self.assertEqual((report['updated'], report['embedded_chunks']), (2, 3))
+
+        index = self.open()  # Restart: the manifest says nothing changed
+        self.assertEqual(self.ingest(index, [hue, nest])['unchanged'], 2)
+        self.write('hue.txt', 'press the button', 'wait for the blue light')
+        self.embedder.texts.clear()
+        report = self.ingest(index, [hue, nest])
+        self.assertEqual((report['updated'], report['embedded_chunks'], report['reused_chunks']), (1, 1, 1))
+        self.assertEqual(self.embedder.texts, ['wait for the blue light'])
+        self.assertNotIn('wait for the light', index.vector_db._collection.rows.values())  # The stale chunk is gone
+        self.assertEqual(index.version, 2)
+
+    def test_prune_drops_sources_that_are_gone(self):
+        hue = self.write('hue.txt', 'press the button')
+        nest = self.write('nest.txt', 'open the app')
+        index = self.open()
+        self.ingest(index, [hue, nest])
+        report = self.ingest(index, [hue], prune=True)
+        self.assertEqual((report['unchanged'], report['removed']), (1, 1))
+        self.assertEqual(list(index.vector_db._collection.rows.values()), ['press the button'])
+        self.assertEqual(list(self.open().manifest['sources']), [os.path.abspath(hue)])
+
+    def test_collections_in_one_directory_have_their_own_manifest(self):
+        hue = self.write('hue.txt', 'press the button')
+        self.ingest(self.open('manuals'), [hue])
+        other = self.open('notes')
+        self.assertNotEqual(other.manifest_path, self.open('manuals').manifest_path)
+        self.assertEqual(self.ingest(other, [hue])['embedded_chunks'], 1)  # Not "unchanged" from the manuals
+
+    def test_unparseable_files_keep_their_previous_version(self):
+        hue = self.write('hue.txt', 'press the button')
+        index = self.open()
+        self.ingest(index, [hue])
+        self.write('hue.txt', 'press the button', 'BROKEN')
+        report = self.ingest(index, [hue])
+        self.assertEqual((report['failed'], report['updated']), (1, 0))
+        self.assertEqual(list(index.vector_db._collection.rows.values()), ['press the button'])
+        self.assertEqual(self.ingest(self.open(), [hue])['failed'], 1)  # Still listed as changed, tried again
+
+    def test_cache_key_identifies_collection_and_rebuilds(self):
+        key = self.open().cache_key
+        self.assertEqual(self.open().cache_key, key)  # Stable across restarts
+        self.assertNotEqual(self.open('notes').cache_key, key)
+        shutil.rmtree(os.path.join(self.directory, 'index'))
+        self.assertNotEqual(self.open().cache_key, key)  # Rebuilt from scratch, same version 0
+
+
+if __name__ == '__main__':
+    unittest.main()
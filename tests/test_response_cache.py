@@ -0,0 +1,67 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+import tempfile
+import time
+import unittest
+from response_cache import ResponseCache, MemoryBackend, DiskBackend
+
+def fake_embed(text):
+    # Bag of words over a tiny vocabulary, enough to make paraphrases similar
+    vocabulary = ['turn', 'off', 'on', 'lights', 'kitchen', 'weather']
+    words = text.lower().replace('?', '').split()
+    return [float(words.count(word)) for word in vocabulary]
+
+class ResponseCacheTestCase(unittest.TestCase):
+    def test_exact_hits_ignore_case_whitespace_and_punctuation(self):
+        cache = ResponseCache()
+        cache.store('mistral', 'Persona', [], 'Turn off the lights.', 'Lights are off.')
+        self.assertEqual(cache.lookup('mistral', 'Persona', [], '  turn OFF the   lights '), 'Lights are off.')
+        self.assertIsNone(cache.lookup('mixtral', 'Persona', [], 'Turn off the lights'))
+        self.assertIsNone(cache.lookup('mistral', 'Other persona', [], 'Turn off the lights'))
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 2))
+
+    def test_recent_context_is_part_of_the_key(self):
+        cache = ResponseCache(context_messages=2)
+        context = [{'role': 'system', 'content': 'Persona'}, {'role': 'user', 'content': 'Which room?'}, {'role': 'assistant', 'content': 'Kitchen'}]
+        cache.store('mistral', 'Persona', context, 'Turn it off', 'Kitchen light off.')
+        self.assertEqual(cache.lookup('mistral', 'Persona', context[1:], 'turn it off'), 'Kitchen light off.')
+        self.assertIsNone(cache.lookup('mistral', 'Persona', [], 'turn it off'))
+
+    def test_lru_and_ttl_eviction(self):
+        cache = ResponseCache(backend=MemoryBackend(max_entries=2), ttl=60)
+        for question in ('a', 'b'):
+            cache.store('m', 'p', [], question, question.upper())
+        cache.lookup('m', 'p', [], 'a')  # 'b' becomes least recently used
+        cache.store('m', 'p', [], 'c', 'C')
+        self.assertIsNone(cache.lookup('m', 'p', [], 'b'))
+        self.assertEqual(cache.lookup('m', 'p', [], 'a'), 'A')
+        cache.ttl = -1
+        cache.store('m', 'p', [], 'd', 'D')
+        self.assertIsNone(cache.lookup('m', 'p', [], 'd'))
+
+    def test_disk_backend_survives_restart(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'responses.sqlite3')
+            ResponseCache(backend=DiskBackend(path)).store('m', 'p', [], 'Weather?', 'Sunny.')
+            self.assertEqual(ResponseCache(backend=DiskBackend(path)).lookup('m', 'p', [], 'weather'), 'Sunny.')
+
+    def test_semantic_match_within_partition(self):
+        cache = ResponseCache(semantic=True, embed_fn=fake_embed, threshold=0.8)
+        cache.store('m', 'p', [], 'how is the weather in the kitchen', 'Warm and sunny.')
+        self.assertEqual(cache.lookup('m', 'p', [], 'kitchen weather?'), 'Warm and sunny.')
+        self.assertIsNone(cache.lookup('m', 'p', [], 'lights'))
+        self.assertEqual(cache.stats()['semantic_hits'], 1)
+
+    def test_device_commands_only_hit_exactly(self):
+        cache = ResponseCache(semantic=True, embed_fn=fake_embed, threshold=0.7)
+        cache.store('m', 'p', [], 'turn on the kitchen lights', 'Kitchen lights on.')
+        self.assertIsNone(cache.lookup('m', 'p', [], 'turn off the kitchen lights'))  # Cosine 0.75 would clear 0.7
+        self.assertIsNone(cache.lookup('m', 'p', [], 'kitchen lights off'))
+        self.assertIsNone(cache.lookup('m', 'p', [], 'what about the kitchen lights?'))  # Commands are not candidates
+        self.assertEqual(cache.lookup('m', 'p', [], 'Turn on the kitchen lights.'), 'Kitchen lights on.')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+import contextvars
+import threading
+import time
+import unittest
+from rag.retrieval_cache import RetrievalCache, StageTimer, format_stage_timings
+
+
+class RetrievalCacheTestCase(unittest.TestCase):
+    def test_keyed_on_normalized_question_and_index_version(self):
+        index = {'version': 3}
+        cache = RetrievalCache(lambda: index['version'])
+        cache.store_expansion('How do I reset the Hue bridge?', ['reset hue bridge', 'factory reset bridge'])
+        cache.store_documents('How do I reset the Hue bridge?', [{'page_content': 'Hold the button', 'metadata': {'page': 4}}])
+        self.assertEqual(cache.expansion('how do i reset the hue bridge'), ['reset hue bridge', 'factory reset bridge'])
+        self.assertEqual(cache.documents('How do I reset the Hue bridge'), [{'page_content': 'Hold the button', 'metadata': {'page': 4}}])
+        index['version'] = 4  # Re-indexing invalidates everything
+        self.assertIsNone(cache.expansion('How do I reset the Hue bridge?'))
+        self.assertIsNone(cache.documents('How do I reset the Hue bridge?'))
+
+    def test_indexes_sharing_a_cache_do_not_see_each_other(self):
+        shared = RetrievalCache(lambda: 'manuals-abc-1 v0').cache
+        manuals = RetrievalCache(lambda: 'manuals-abc-1 v0', shared)
+        rebuilt = RetrievalCache(lambda: 'manuals-abc-2 v0', shared)  # Same version, new index
+        manuals.store_documents('reset the bridge', [{'page_content': 'Hold the button'}])
+        self.assertIsNone(rebuilt.documents('reset the bridge'))
+        self.assertEqual(manuals.documents('reset the bridge')[0]['page_content'], 'Hold the button')
+
+    def test_stage_timer_is_per_request(self):
+        results = {}
+
+        def request(name, delay):
+            timings = StageTimer.start()
+            with StageTimer.stage('expand'):
+                time.sleep(delay)
+            worker = threading.Thread(target=contextvars.copy_context().run, args=(retrieve,))
+            worker.start()
+            worker.join()
+            results[name] = timings
+
+        def retrieve():
+            with StageTimer.stage('retrieve'):
+                StageTimer.mark_cached('retrieve')
+
+        threads = [threading.Thread(target=request, args=(name, delay)) for name, delay in (('slow', 0.05), ('fast', 0.0))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertGreater(results['slow']['expand'], results['fast']['expand'])
+        self.assertIn('retrieve', results['fast'])
+        self.assertIn('retrieve 0.00s (cached)', format_stage_timings(results['fast']))
+
+
+if __name__ == '__main__':
+    unittest.main()
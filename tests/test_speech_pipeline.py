@@ -0,0 +1,109 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+import threading
+import time
+import unittest
+import numpy as np
+from audio_io import Playback
+from speech_pipeline import CancelToken, SentenceSplitter, SpeechPipeline, interruptible
+
+class FakePlayer:
+    def __init__(self, seconds=0.0):
+        self.seconds = seconds
+        self.played = []
+
+    def play(self, clip, cancelled):
+        self.played.append(clip)
+        cancelled.wait(self.seconds)
+
+class BlockPlayer:
+    """ Plays like a sound card: one 32 ms block of a Playback at a time, in real time. """
+    def play(self, clip, cancelled):
+        playback = Playback(clip, cancelled)
+        out = np.empty((256, 1), dtype=np.float32)
+        while playback.fill(out):
+            time.sleep(256 / 8000)
+        return playback.fraction
+
+def words(text, delay, closed):
+    try:
+        for word in text.split(' '):
+            time.sleep(delay)
+            yield word + ' '
+    finally:
+        closed.set()
+
+class SpeechPipelineTestCase(unittest.TestCase):
+    def test_splitter_emits_sentences_as_tokens_complete_them(self):
+        splitter = SentenceSplitter()
+        text = "Sure, e.g. the hall light is on. Steps:\n1. Open the app now.\n2. Tap Rooms! Done"
+        sentences = []
+        for i in range(0, len(text), 3):
+            sentences += splitter.feed(text[i:i + 3])
+        sentences += splitter.flush()
+        # No cut after the abbreviation or the list number; "Steps:" is too short to be spoken on its own
+        self.assertEqual(sentences, ["Sure, e.g. the hall light is on.", "Steps:\n1. Open the app now.",
+                                     "2. Tap Rooms!", "Done"])
+        self.assertTrue(all(len(sentence) <= 40 for sentence in SentenceSplitter(max_chars=40).feed("word " * 30)))
+        long_clause = SentenceSplitter(max_chars=40).feed("first the hall, then the kitchen and the long hallway lights")
+        self.assertEqual(long_clause[0], "first the hall,")  # At the comma, not the last space before max_chars
+
+    def test_first_sentence_plays_while_generation_continues(self):
+        player = FakePlayer()
+        speech = SpeechPipeline(lambda text: text.upper(), player).start()
+        speech.feed("The kitchen light is now on. ")
+        deadline = time.time() + 2
+        while not player.played and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(player.played, ["THE KITCHEN LIGHT IS NOW ON."])  # Spoken before the answer is finished
+        speech.feed("The **hall** light stays off")
+        timings = speech.finish()
+        self.assertEqual(player.played[-1], "THE HALL LIGHT STAYS OFF")
+        self.assertEqual(timings['sentences'], 2)
+        self.assertLessEqual(timings['first_sentence'], timings['first_audio'])
+
+    def test_stop_drops_queued_sentences(self):
+        player = FakePlayer(seconds=5)
+        speech = SpeechPipeline(lambda text: text, player, max_sentences=2, max_clips=1).start()
+        speech.feed("This is the first sentence. ")
+        while not player.played:
+            time.sleep(0.01)
+        for word in ('second', 'third', 'fourth'):
+            speech.feed(f"This is the {word} sentence. ")  # Fills both queues behind the playing clip
+        speech.stop()
+        speech.feed("This one comes after the stop. ")
+        started = time.perf_counter()
+        speech.finish()
+        self.assertLess(time.perf_counter() - started, 1.0)
+        self.assertEqual(len(player.played), 1)
+        self.assertEqual(speech.spoken, [])
+
+    def test_barge_in_stops_playback_and_keeps_the_spoken_prefix(self):
+        answer = ("The kitchen light is on now. The hall light stays off for the night. "
+                  "The thermostat is set to twenty degrees. The front door is locked.")
+        cancel = CancelToken()
+        speech = SpeechPipeline(lambda text: np.ones((len(text) * 200, 1), dtype=np.float32), BlockPlayer()).start()
+        cancel.on_cancel(speech.stop)
+        threading.Timer(0.6, cancel.cancel, args=('barge-in',)).start()  # Mid-way through the first sentence
+        closed = threading.Event()
+        for token in interruptible(words(answer, 0.02, closed), cancel):
+            speech.feed(token)
+        timings = speech.finish()
+        self.assertLess(timings['stop_latency'], 0.1)
+        spoken = speech.spoken_text()
+        self.assertTrue(spoken.endswith('...'))
+        self.assertTrue(answer.startswith(spoken[:-3]))
+        self.assertLess(len(spoken), len("The kitchen light is on now."))
+        self.assertTrue(closed.wait(1.0))  # The abandoned stream was closed
+
+    def test_cancel_does_not_wait_for_a_slow_first_token(self):
+        cancel = CancelToken()
+        closed = threading.Event()
+        threading.Timer(0.05, cancel.cancel).start()
+        started = time.perf_counter()
+        self.assertEqual(list(interruptible(words("late answer", 0.5, closed), cancel)), [])
+        self.assertLess(time.perf_counter() - started, 0.2)
+        self.assertEqual(cancel.reason, 'cancelled')
+        self.assertTrue(closed.wait(2.0))
@@ -0,0 +1,86 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+import tempfile
+import unittest
+import numpy as np
+from audio_io import convert, write_wav
+from speech_recognizer import Endpointer, SpeechRecognizer, WakeWord, WavSource
+
+RATE = 16000
+
+def recording(*parts):
+    """ 16 kHz mono audio from (kind, seconds) parts: 'voice' is a loud vowel-like tone, 'quiet' room noise. """
+    rng = np.random.default_rng(0)
+    chunks = []
+    for kind, seconds in parts:
+        t = np.arange(int(RATE * seconds)) / RATE
+        if kind == 'voice':
+            chunks.append(0.3 * np.sin(2 * np.pi * 180 * t) * (1 + 0.5 * np.sin(2 * np.pi * 4 * t)))
+        else:
+            chunks.append(rng.normal(0, 0.002, len(t)))
+    return np.concatenate(chunks).reshape(-1, 1)
+
+class ScriptedDecoder:
+    """ Returns the next scripted transcript for every utterance and records how much audio it was fed. """
+    def __init__(self, transcripts):
+        self.transcripts = list(transcripts)
+        self.fed = []
+
+    def start(self):
+        self.fed.append(0)
+
+    def feed(self, samples):
+        self.fed[-1] += len(samples)
+
+    def end(self):
+        return self.transcripts.pop(0) if self.transcripts else ''
+
+class SpeechRecognizerTestCase(unittest.TestCase):
+    def test_endpointer_finds_utterances_and_drops_clicks(self):
+        audio = recording(('quiet', 1.0), ('voice', 0.6), ('quiet', 1.0), ('voice', 0.03), ('quiet', 1.0),
+                          ('voice', 1.2), ('quiet', 1.0))
+        pcm = (audio[:, 0] * 32767).astype(np.int16)
+        endpointer = Endpointer()
+        utterances, starts = [], []
+        for offset in range(0, len(pcm), 700):  # Blocks that do not line up with frames
+            for kind, data in endpointer.push(pcm[offset:offset + 700]):
+                if kind == 'start':
+                    starts.append(endpointer.start / RATE)
+                elif kind == 'end' and data is not None:
+                    utterances.append(len(data) / RATE)
+        self.assertEqual(len(utterances), 2)
+        self.assertAlmostEqual(starts[0], 0.7, delta=0.05)  # 300 ms of pre-roll before the onset at 1.0 s
+        self.assertAlmostEqual(utterances[1], 0.3 + 1.2 + 0.6, delta=0.1)  # Pre-roll + speech + hangover
+
+    def test_wake_word_gates_utterances_from_wav_files(self):
+        with tempfile.TemporaryDirectory() as directory:
+            paths = []
+            for i, seconds in enumerate([0.8, 0.5, 0.4, 0.9]):
+                paths.append(os.path.join(directory, f'{i}.wav'))
+                with open(paths[-1], 'wb') as file:  # 44.1 kHz stereo, as a recorder would save it
+                    file.write(write_wav(convert(recording(('voice', seconds), ('quiet', 1.0)), RATE), 44100))
+            decoder = ScriptedDecoder(["hey computer turn on the kitchen lights", "what a nice day",
+                                       "computer", "what is the temperature"])
+            onsets = []
+            recognizer = SpeechRecognizer(WavSource(paths), decoder=decoder, wake_word=WakeWord('computer'),
+                                          on_speech=onsets.append).start()
+            commands = [utterance['text'] for utterance in recognizer]
+        self.assertEqual(commands, ["turn on the kitchen lights", "what is the temperature"])
+        self.assertEqual(recognizer.stats, {'utterances': 4, 'accepted': 2, 'ignored': 2, 'dropped': 0})
+        self.assertEqual(len(decoder.fed), 4)
+        self.assertEqual(len(onsets), 4)  # Speech onsets are reported before anything is recognized
+        self.assertAlmostEqual(onsets[1], 2.8 + 0.03, delta=0.05)  # First file: 0.8 s voice, 1 s quiet, 1 s gap
+        self.assertGreater(decoder.fed[0], 0.8 * RATE)  # The decoder heard the whole first utterance
+
+    def test_wake_word_follow_up_window_and_full_queue(self):
+        gate = WakeWord('computer', follow_up=5.0)
+        self.assertIsNone(gate("Computer.", now=10.0))
+        self.assertIsNone(gate("never mind", now=16.0))  # Too late, the window closed at 15 s
+        self.assertEqual(WakeWord(None)("anything", now=0.0), "anything")
+        recognizer = SpeechRecognizer([], decoder=ScriptedDecoder([]), queue_size=2)
+        for i in range(3):
+            recognizer.put({'text': str(i)})
+        self.assertEqual([recognizer.get(timeout=1)['text'] for _ in range(2)], ['1', '2'])
+        self.assertEqual(recognizer.stats['dropped'], 1)
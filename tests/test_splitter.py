@@ -0,0 +1,45 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+import unittest
+from rag.splitter import TextSplitter
+
+PARAGRAPH = "The Hue bridge v2 supports up to 50 lights. Error E-42 means the bridge lost its network link. "
+
+
+class TextSplitterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.text = "\n\n".join(PARAGRAPH * (i % 3 + 1) for i in range(20))
+
+    def test_chunks_respect_size_and_cover_the_text(self):
+        splitter = TextSplitter(chunk_size=200, chunk_overlap=30)
+        spans = list(splitter.spans(self.text))
+        self.assertTrue(all(0 < end - start <= 200 for start, end in spans))
+        covered = set()
+        for start, end in spans:
+            covered.update(range(start, end))
+        self.assertTrue(all(i in covered for i, char in enumerate(self.text) if not char.isspace()))
+        self.assertTrue(all(self.text[start] != ' ' and self.text[start - 1] in ' \n' for start, _ in spans[1:]))  # Word boundaries
+
+    def test_token_budget(self):
+        splitter = TextSplitter(chunk_size=400, chunk_overlap=20, max_tokens=40, count_tokens=lambda text: len(text.split()))
+        self.assertTrue(all(len(chunk.split()) <= 40 for chunk in splitter.split_text(self.text)))
+        self.assertLessEqual(max(len(chunk) for chunk in TextSplitter(max_tokens=100, chars_per_token=3.0).split_text(self.text)), 300)
+
+    def test_ids_are_stable_and_carry_metadata(self):
+        splitter = TextSplitter(chunk_size=200, chunk_overlap=30, namespace='mxbai')
+        chunks = splitter.split(self.text, source='hue.pdf', page=2)
+        self.assertEqual([chunk.id for chunk in chunks], [chunk.id for chunk in splitter.split(self.text, source='hue.pdf', page=2)])
+        self.assertEqual(chunks[1].metadata, {'start': chunks[1].start, 'end': chunks[1].end, 'source': 'hue.pdf', 'page': 2})
+        self.assertEqual(chunks[1].text, self.text[chunks[1].start:chunks[1].end])
+        self.assertEqual(len({chunk.id for chunk in chunks}), len(chunks))  # Repeated text gets occurrence suffixes
+
+        edited = self.text + "\n\nNew troubleshooting section."
+        kept = {chunk.id for chunk in chunks} & {chunk.id for chunk in splitter.split(edited, source='hue.pdf', page=2)}
+        self.assertGreaterEqual(len(kept), len(chunks) - 1)
+        self.assertNotEqual(chunks[0].id, splitter.split(self.text, source='hue.pdf', page=3)[0].id)
+
+
+if __name__ == '__main__':
+    unittest.main()